@@ -51,6 +51,9 @@ if __name__ == '__main__':
         remove_dir('{{ cookiecutter.module_name }}/example_subpkg/')
         remove_file('{{ cookiecutter.module_name }}/example_mod.py')
         remove_file('{{ cookiecutter.module_name }}/tests/test_example.py')
+        remove_file('{{ cookiecutter.module_name }}/tests/test_stress.py')
+        remove_file('benchmarks/benchmarks/bench_primes.py')
 
     if '{{ cookiecutter.use_compiled_extensions }}' != 'y' or '{{ cookiecutter.include_example_code }}' != 'y':
         remove_file('{{ cookiecutter.module_name }}/example_c.pyx')
+        remove_file('{{ cookiecutter.module_name }}/setup_package.py')
@@ -0,0 +1,3 @@
+def timeraw_import_package():
+    # Run in a fresh interpreter, so this is the full cost of the first import
+    return "import {{ cookiecutter.module_name }}"
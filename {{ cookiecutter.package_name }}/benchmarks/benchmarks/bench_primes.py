@@ -0,0 +1,89 @@
+"""
+Benchmarks for the prime number engines, covering the time and peak memory
+of each backend across problem sizes, and how the parallel backends scale
+with the number of cores.
+"""
+
+import contextlib
+import io
+import os
+
+from {{ cookiecutter.module_name }}.example_mod import do_primes, primes
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+from {{ cookiecutter.module_name }} import example_c
+{%- endif %}
+
+SIZES = [10, 10 ** 3, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8]
+
+CORES = [1, 2, 4, 8, 16, 32, 64]
+
+
+def _quiet(func, *args, **kwargs):
+    # do_primes reports the engine it uses, which would otherwise end up in
+    # every timing
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+class Primes:
+    params = [SIZES]
+    param_names = ['n']
+    timeout = 1200
+
+    def time_primes(self, n):
+        primes(n)
+
+    def peakmem_primes(self, n):
+        primes(n)
+
+    def time_primes_limit(self, n):
+        primes(limit=n)
+
+    def time_do_primes(self, n):
+        _quiet(do_primes, n)
+
+    def time_do_primes_auto(self, n):
+        # The backends are calibrated by the first call, outside of the
+        # timings since asv runs a warmup first.
+        _quiet(do_primes, n, backend='auto')
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+
+    def time_primes_c(self, n):
+        example_c.primes(n)
+
+    def peakmem_primes_c(self, n):
+        example_c.primes(n)
+
+    def time_sieve_c(self, n):
+        example_c.sieve(0, n)
+
+    def peakmem_sieve_c(self, n):
+        example_c.sieve(0, n)
+
+    def time_do_primes_c(self, n):
+        _quiet(do_primes, n, usecython=True)
+{%- endif %}
+
+
+class Scaling:
+    params = [[10 ** 6, 10 ** 8], CORES]
+    param_names = ['n', 'cores']
+    timeout = 1200
+
+    def setup(self, n, cores):
+        if cores > (os.cpu_count() or 1):
+            raise NotImplementedError
+        # Start the process pool outside of the timings, since it is reused
+        # across calls.
+        _quiet(do_primes, 10, workers=cores)
+
+    def time_do_primes_workers(self, n, cores):
+        _quiet(do_primes, n, workers=cores)
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+
+    def time_do_primes_workers_c(self, n, cores):
+        _quiet(do_primes, n, usecython=True, workers=cores)
+
+    def time_primes_c_threads(self, n, cores):
+        example_c.primes(n, num_threads=cores)
+{%- endif %}
@@ -1,17 +1,40 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 
+from importlib import import_module
+
 # Packages may add whatever they like to this file, but
 # should keep this content at the top.
 # ----------------------------------------------------------------------------
-from ._{{ cookiecutter._parent_project }}_init import *   # noqa
+# The version and the test function are looked up lazily (see __getattr__
+# below) since they are slow to create.
+_LAZY_ATTRIBUTES = {'__version__': '._{{ cookiecutter._parent_project }}_init',
+                    'test': '._{{ cookiecutter._parent_project }}_init'}
 # ----------------------------------------------------------------------------
 
 __all__ = []
 
 {%- if cookiecutter.include_example_code == 'y' %}
-from .example_mod import *   # noqa
-# Then you can be explicit to control what ends up in the namespace,
-__all__ += ['do_primes']   # noqa
-# or you can keep everything from the subpackage with the following instead
-# __all__ += example_mod.__all__
+# Names from sub-modules are exposed by adding them to _LAZY_ATTRIBUTES, so
+# that the sub-module is only imported when one of them is first used. You
+# can be explicit to control what ends up in the namespace,
+_LAZY_ATTRIBUTES.update(dict.fromkeys(['do_primes', 'aprimes', 'prime_count'], '.example_mod'))
+__all__ += ['do_primes', 'aprimes', 'prime_count']   # noqa
+# or expose a whole sub-module by mapping its name to itself
+_LAZY_ATTRIBUTES['example_mod'] = '.example_mod'
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+_LAZY_ATTRIBUTES['example_c'] = '.example_c'
+{%- endif %}
 {%- endif %}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = import_module(_LAZY_ATTRIBUTES[name], __name__)
+    value = module if module.__name__ == f'{__name__}.{name}' else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
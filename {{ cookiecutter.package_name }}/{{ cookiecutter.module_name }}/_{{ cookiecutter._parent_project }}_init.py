@@ -1,13 +1,23 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 import os
 
-__all__ = ['__version__', 'test']
+__all__ = ['__version__', 'test']  # noqa: F822
 
-try:
-    from .version import version as __version__
-except ImportError:
-    __version__ = ''
 
-# Create the test function for self test
-from astropy.tests.runner import TestRunner
-test = TestRunner.make_test_runner_in(os.path.dirname(__file__))
+def __getattr__(name):
+    # Looking up the version of a development checkout and creating the test
+    # runner import setuptools_scm and most of astropy, so both are deferred
+    # until they are first used to keep importing the package fast.
+    if name == '__version__':
+        try:
+            from .version import version as value
+        except ImportError:
+            value = ''
+    elif name == 'test':
+        # Create the test function for self test
+        from astropy.tests.runner import TestRunner
+        value = TestRunner.make_test_runner_in(os.path.dirname(__file__))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
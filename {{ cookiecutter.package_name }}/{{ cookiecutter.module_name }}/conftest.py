@@ -9,6 +9,8 @@ get picked up when running the tests inside an interpreter using
 
 import os
 
+import pytest
+
 try:
     from pytest_astropy_header.display import PYTEST_HEADER_MODULES, TESTED_VERSIONS
     ASTROPY_HEADER = True
@@ -24,6 +26,8 @@ def pytest_configure(config):
     config : pytest configuration
 
     """
+    config.addinivalue_line('markers', 'slow: long-running test, only run with -m slow')
+
     if ASTROPY_HEADER:
 
         config.option.astropy_header = True
@@ -36,3 +40,20 @@ def pytest_configure(config):
         from . import __version__
         packagename = os.path.basename(os.path.dirname(__file__))
         TESTED_VERSIONS[packagename] = __version__
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip the tests marked as slow unless they are selected with -m.
+
+    Parameters
+    ----------
+    config : pytest configuration
+    items : list of collected tests
+
+    """
+    if 'slow' in (config.getoption('markexpr') or ''):
+        return
+    skip = pytest.mark.skip(reason='slow test, select it with -m slow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
@@ -1,38 +1,1096 @@
-def primes(int imax):
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+Compiled prime sieve kernel.
+
+Segments of odd numbers are stored one bit per number and sieved without
+holding the GIL. Batches of segments are spread across cores with ``prange``
+when the extension is built with OpenMP, and run serially otherwise.
+
+The primes below 2**16 are computed when the extension is built, by
+``setup_package.py``, and compiled into it as constant tables. Queries
+below that limit are answered from them, and they hold the base primes of
+every sieve of a range below 2**32.
+
+The counters reported to
+`~{{ cookiecutter.module_name }}.example_subpkg.instrumentation.profile` are
+only compiled in when the ``EXAMPLE_STATS`` macro is defined to 1, which
+``setup_package.py`` does if the ``EXAMPLE_STATS`` environment variable is set
+to ``1`` at build time.
+"""
+
+import os
+from math import log
+from time import perf_counter
+
+import numpy as np
+
+from .example_subpkg.instrumentation import current_stats
+
+from cython.parallel import prange
+from libc.math cimport cbrt, sqrt
+from libc.stdint cimport int64_t, uint8_t, uint32_t, uint64_t
+from libc.string cimport memset
+
+cdef extern from *:
+    """
+    #ifndef EXAMPLE_STATS
+    #define EXAMPLE_STATS 0
+    #endif
+
+    #if defined(_MSC_VER)
+    #include <intrin.h>
+    static int example_popcount64(unsigned long long x) { return (int)__popcnt64(x); }
+    static int example_ctz64(unsigned long long x) {
+        unsigned long i; _BitScanForward64(&i, x); return (int)i;
+    }
+    #else
+    static int example_popcount64(unsigned long long x) { return __builtin_popcountll(x); }
+    static int example_ctz64(unsigned long long x) { return __builtin_ctzll(x); }
+    #endif
+
+    /* Full 64x64 -> 128 bit product, returning the high word */
+    static unsigned long long example_mul_wide(unsigned long long a,
+                                               unsigned long long b,
+                                               unsigned long long *lo) {
+    #if defined(__SIZEOF_INT128__)
+        unsigned __int128 t = (unsigned __int128)a * b;
+        *lo = (unsigned long long)t;
+        return (unsigned long long)(t >> 64);
+    #elif defined(_MSC_VER) && defined(_M_X64)
+        unsigned long long hi;
+        *lo = _umul128(a, b, &hi);
+        return hi;
+    #else
+        unsigned long long a0 = a & 0xFFFFFFFFULL, a1 = a >> 32;
+        unsigned long long b0 = b & 0xFFFFFFFFULL, b1 = b >> 32;
+        unsigned long long p00 = a0 * b0, p01 = a0 * b1;
+        unsigned long long p10 = a1 * b0, p11 = a1 * b1;
+        unsigned long long mid = (p00 >> 32) + (p01 & 0xFFFFFFFFULL) + (p10 & 0xFFFFFFFFULL);
+        *lo = (mid << 32) | (p00 & 0xFFFFFFFFULL);
+        return p11 + (p01 >> 32) + (p10 >> 32) + (mid >> 32);
+    #endif
+    }
+
+    /* Montgomery product a * b / 2**64 mod n, for a, b < n, n odd and
+       ninv = n**-1 mod 2**64 */
+    static unsigned long long example_montmul(unsigned long long a,
+                                              unsigned long long b,
+                                              unsigned long long n,
+                                              unsigned long long ninv) {
+        unsigned long long lo, mlo;
+        unsigned long long hi = example_mul_wide(a, b, &lo);
+        unsigned long long mhi = example_mul_wide(lo * ninv, n, &mlo);
+        return hi < mhi ? hi - mhi + n : hi - mhi;
+    }
+    """
+    # A compile-time constant, so the instrumentation is removed by the C
+    # compiler when it is zero.
+    const bint STATS "EXAMPLE_STATS"
+    int popcount64 "example_popcount64"(uint64_t x) noexcept nogil
+    int ctz64 "example_ctz64"(uint64_t x) noexcept nogil
+    uint64_t montmul "example_montmul"(uint64_t a, uint64_t b, uint64_t n,
+                                       uint64_t ninv) noexcept nogil
+
+cdef extern from "small_primes.h":
+    # The primes below SMALL_PRIME_LIMIT, and their odd-only bitmap, with bit
+    # i standing for 2 * i + 1
+    enum:
+        SMALL_PRIME_LIMIT "EXAMPLE_SMALL_PRIME_LIMIT"
+        SMALL_PRIME_COUNT "EXAMPLE_SMALL_PRIME_COUNT"
+    const int64_t *SMALL_PRIMES_DATA "example_small_primes"
+    const uint64_t *SMALL_PRIME_BITS "example_small_prime_bits"
+
+__all__ = ['primes', 'sieve', 'sieve_size', 'prime_count', 'is_prime',
+           'smallest_prime_factors', 'factorize', 'STATS_ENABLED', 'SMALL_PRIMES']
+
+# Whether the kernel was built with its instrumentation
+STATS_ENABLED = bool(STATS)
+
+# A read-only view of the primes compiled into the extension
+SMALL_PRIMES = np.asarray(<int64_t[:SMALL_PRIME_COUNT]> <int64_t *> SMALL_PRIMES_DATA)
+SMALL_PRIMES.flags.writeable = False
+
+# By default, one segment is 32 KiB of bits, i.e. 262144 odd numbers, so
+# that it stays in the L1/L2 cache of a single core while it is being
+# sieved.
+cdef enum:
+    SEGMENT_WORDS = 4096
+    SEGMENT_BITS = SEGMENT_WORDS * 64
+
+# Default number of segments handed to each thread per parallel batch
+cdef enum:
+    SEGMENTS_PER_THREAD = 4
+
+# Default size above which the base primes of a range are not kept in a
+# table, but sieved again for each window of the range, 64 MiB, or the base
+# primes of the ranges below about 2.6e16.
+cdef enum:
+    BASE_BYTES = 1 << 26
+
+# Numbers below this are classified with a lookup in a prime bitmap, and
+# larger ones with Miller-Rabin.
+cdef enum:
+    SMALL_LIMIT = 1 << 20
+
+# Testing these bases is enough to make Miller-Rabin deterministic for any
+# 64-bit integer (Jim Sinclair's set).
+cdef uint64_t MR_BASES[7]
+MR_BASES[:] = [2, 325, 9375, 28178, 450775, 9780504, 1795265022]
+
+# A 64-bit integer has at most 64 prime factors counted with multiplicity,
+# and at most 15 distinct ones.
+cdef enum:
+    MAX_FACTORS = 64
+    MAX_DISTINCT_FACTORS = 15
+
+# phi(x, a) is looked up in a table, instead of recursing, once a reaches
+# PHI_A, using the periodicity of phi(x, PHI_A) modulo the product of the
+# first PHI_A primes.
+cdef enum:
+    PHI_A = 7
+    PHI_PRIMORIAL = 2 * 3 * 5 * 7 * 11 * 13 * 17
+
+
+cdef int64_t _sieve_segment(uint64_t *bits, Py_ssize_t words, int64_t lo, int64_t nbits,
+                            const int64_t *base, Py_ssize_t nbase) noexcept nogil:
+    # Bit i of the segment of words 64-bit words stands for the odd number
+    # lo + 2 * i, and is left set if that number is prime. Bits past nbits
+    # are cleared. Returns the number of bits cleared when built with STATS,
+    # and 0 otherwise.
+    cdef int64_t hi = lo + 2 * nbits
+    cdef int64_t p, s, i, marks = 0
+    cdef Py_ssize_t j, nwords = (nbits + 63) >> 6
+
+    memset(bits, 0xFF, nwords * sizeof(uint64_t))
+    if nwords < words:
+        memset(bits + nwords, 0, (words - nwords) * sizeof(uint64_t))
+
+    for j in range(nbase):
+        p = base[j]
+        if p * p >= hi:
+            break
+        if p * p >= lo:
+            s = p * p
+        else:
+            s = (lo + p - 1) // p * p
+            if not s & 1:
+                s += p
+        i = (s - lo) >> 1
+        if STATS and i < nbits:
+            marks += (nbits - 1 - i) // p + 1
+        while i < nbits:
+            bits[i >> 6] &= ~((<uint64_t>1) << (i & 63))
+            i += p
+
+    if nbits & 63:
+        bits[nwords - 1] &= ((<uint64_t>1) << (nbits & 63)) - 1
+    return marks
+
+
+cdef int64_t _count_segment(const uint64_t *bits, Py_ssize_t words) noexcept nogil:
+    cdef int64_t total = 0
+    cdef Py_ssize_t j
+    for j in range(words):
+        total += popcount64(bits[j])
+    return total
+
+
+cdef void _extract_segment(const uint64_t *bits, Py_ssize_t words, int64_t lo,
+                           int64_t *out) noexcept nogil:
+    cdef uint64_t word
+    cdef Py_ssize_t j, n = 0
+    for j in range(words):
+        word = bits[j]
+        while word:
+            out[n] = lo + 2 * (64 * j + ctz64(word))
+            n += 1
+            word &= word - 1
+
+
+cdef int64_t _prime_count_bound(int64_t x):
+    # Rosser and Schoenfeld's upper bound for the number of primes <= x
+    return x if x <= 17 else <int64_t>(1.25506 * x / log(x)) + 1
+
+
+cdef object _odd_base_primes(int64_t limit):
+    # Odd primes <= limit, from the compiled table if it goes that far, and
+    # otherwise sieved one segment of odd numbers at a time with the compiled
+    # table as their base primes, which covers any limit below 2**32
+    if limit < SMALL_PRIME_LIMIT:
+        return SMALL_PRIMES[1:np.searchsorted(SMALL_PRIMES, limit, 'right')]
+    result = np.empty(_prime_count_bound(limit), dtype=np.int64)
+    bits = np.empty(SEGMENT_WORDS, dtype=np.uint64)
+    cdef int64_t[::1] result_view = result
+    cdef uint64_t[::1] bits_view = bits
+    cdef int64_t lo = 3, nbits, found = 0
+    with nogil:
+        while lo <= limit:
+            nbits = min(SEGMENT_BITS, (limit - lo) // 2 + 1)
+            _sieve_segment(&bits_view[0], SEGMENT_WORDS, lo, nbits,
+                           SMALL_PRIMES_DATA + 1, SMALL_PRIME_COUNT - 1)
+            _extract_segment(&bits_view[0], SEGMENT_WORDS, lo, &result_view[found])
+            found += _count_segment(&bits_view[0], SEGMENT_WORDS)
+            lo += 2 * nbits
+    return result[:found]
+
+
+cdef int64_t _sieve_streamed(uint64_t *bits, Py_ssize_t words, int64_t lo, int64_t nbits,
+                             int64_t root, uint64_t *base_bits) noexcept nogil:
+    # Like _sieve_segment, but with the odd primes up to root as base primes,
+    # sieved SEGMENT_BITS at a time into base_bits as they are needed instead
+    # of being read from a table
+    cdef int64_t hi = lo + 2 * nbits
+    cdef int64_t base_lo = SMALL_PRIME_LIMIT + 1, base_nbits, p, s, i
+    cdef int64_t marks = _sieve_segment(bits, words, lo, nbits, SMALL_PRIMES_DATA + 1,
+                                        SMALL_PRIME_COUNT - 1)
+    cdef uint64_t word
+    cdef Py_ssize_t j
+    while base_lo <= root:
+        base_nbits = min(SEGMENT_BITS, (root - base_lo) // 2 + 1)
+        _sieve_segment(base_bits, SEGMENT_WORDS, base_lo, base_nbits,
+                       SMALL_PRIMES_DATA + 1, SMALL_PRIME_COUNT - 1)
+        for j in range(SEGMENT_WORDS):
+            word = base_bits[j]
+            while word:
+                p = base_lo + 2 * (64 * j + ctz64(word))
+                word &= word - 1
+                if p * p >= hi:
+                    return marks
+                if p * p >= lo:
+                    s = p * p
+                else:
+                    s = (lo + p - 1) // p * p
+                    if not s & 1:
+                        s += p
+                i = (s - lo) >> 1
+                if STATS and i < nbits:
+                    marks += (nbits - 1 - i) // p + 1
+                while i < nbits:
+                    bits[i >> 6] &= ~((<uint64_t>1) << (i & 63))
+                    i += p
+        base_lo += 2 * base_nbits
+    return marks
+
+
+cdef Py_ssize_t _sieve_batch(int64_t lo, int64_t hi, Py_ssize_t batch, int num_threads,
+                             Py_ssize_t words, uint64_t *bits, int64_t *counts,
+                             int64_t *offsets, const int64_t *base, Py_ssize_t nbase,
+                             int64_t root, uint64_t *base_bits,
+                             int64_t *marks) noexcept nogil:
+    # Sieves up to batch segments of words 64-bit words from lo in parallel,
+    # and fills in the number of primes in each segment and their offsets in
+    # the output, offsets[nseg] being the total. Returns the number of
+    # segments sieved. If base_bits is not NULL, the base primes up to root
+    # are streamed through it instead of being read from base.
+    cdef Py_ssize_t k
+    cdef int64_t nbits = 64 * words
+    cdef Py_ssize_t nseg = min(batch, ((hi - lo + 1) // 2 + nbits - 1) // nbits)
+    cdef int64_t seg_lo, total = 0, batch_marks = 0
+    for k in prange(nseg, num_threads=num_threads, schedule='static'):
+        seg_lo = lo + 2 * nbits * k
+        if base_bits != NULL:
+            batch_marks += _sieve_streamed(
+                &bits[k * words], words, seg_lo, min(nbits, (hi - seg_lo + 1) // 2),
+                root, base_bits)
+        else:
+            batch_marks += _sieve_segment(
+                &bits[k * words], words, seg_lo, min(nbits, (hi - seg_lo + 1) // 2),
+                base, nbase)
+        counts[k] = _count_segment(&bits[k * words], words)
+    for k in range(nseg):
+        offsets[k] = total
+        total += counts[k]
+    offsets[nseg] = total
+    marks[0] += batch_marks
+    return nseg
+
+
+cdef void _extract_batch(const uint64_t *bits, Py_ssize_t words, int64_t lo,
+                         Py_ssize_t nseg, const int64_t *counts, const int64_t *offsets,
+                         int64_t *out, int num_threads) noexcept nogil:
+    # Writes the primes of the first nseg segments of a batch to out
+    cdef Py_ssize_t k
+    for k in prange(nseg, num_threads=num_threads, schedule='static'):
+        if counts[k]:
+            _extract_segment(&bits[k * words], words, lo + 128 * words * k,
+                             &out[offsets[k]])
+
+
+def sieve(int64_t lo, int64_t hi, int64_t imax=-1, int num_threads=0, out=None,
+          Py_ssize_t segment_bytes=0, Py_ssize_t segments_per_thread=0,
+          Py_ssize_t base_bytes=-1):
+    """
+    Returns the prime numbers in the range ``[lo, hi)``.
+
+    Parameters
+    ----------
+    lo, hi: int
+        The bounds of the half-open range to sieve.
+    imax: int, optional
+        If not negative, stop once this many primes have been found.
+    num_threads: int, optional
+        The number of threads to sieve with. Defaults to the number of CPUs.
+    out: buffer, optional
+        A writable, contiguous buffer of 64-bit integers to write the primes
+        to instead of a new array, such as a NumPy array, an ``array('q')``
+        or a memoryview of a shared memory block cast to ``'q'``. It must be
+        large enough for all of the primes in the range, or for ``imax`` of
+        them; see `sieve_size`.
+    segment_bytes: int, optional
+        The size of the bitmap of each segment, rounded down to a multiple
+        of 8 bytes. Defaults to 32 KiB.
+    segments_per_thread: int, optional
+        The number of segments sieved by each thread between two
+        extractions of the primes. Defaults to 4. The working memory of the
+        sieve is ``num_threads * segments_per_thread * segment_bytes``.
+    base_bytes: int, optional
+        The most memory the table of base primes, the odd primes up to
+        ``sqrt(hi)``, may take. Defaults to 64 MiB. If the table would be
+        larger, the base primes are sieved again for each window of the
+        range, on a single thread, with windows of up to ``base_bytes`` of
+        bits, which is slower for wide ranges but keeps the memory used by
+        short ranges of large numbers down to the windows.
+
+    Returns
+    -------
+    result: `numpy.ndarray` or int
+        The prime numbers, as a 64-bit integer array, or the number of
+        primes written if ``out`` is given.
+    """
+
+    cdef int64_t[::1] dest
+    cdef int64_t limit = imax
+    if out is not None:
+        dest = out
+        if imax > dest.shape[0]:
+            raise ValueError("out has room for {0} primes, fewer than imax={1}".format(
+                dest.shape[0], imax))
+        if imax < 0:
+            limit = dest.shape[0]
+
+    if hi <= SMALL_PRIME_LIMIT:
+        # Looked up in the compiled table
+        table = SMALL_PRIMES[np.searchsorted(SMALL_PRIMES, lo):
+                             np.searchsorted(SMALL_PRIMES, hi)]
+        if imax >= 0:
+            table = table[:imax]
+        if out is None:
+            return table.copy()
+        if table.size > limit:
+            raise ValueError("out is too small for the primes in the range, see sieve_size")
+        np.asarray(dest)[:table.size] = table
+        return table.size
+
+    chunks = []
+    cdef int64_t found = 0
+    if lo <= 2 < hi and imax != 0:
+        if out is None:
+            chunks.append(np.array([2], dtype=np.int64))
+        elif limit == 0:
+            raise ValueError("out is too small for the primes in the range, see sieve_size")
+        else:
+            dest[0] = 2
+        found = 1
+
+    lo = max(lo, 3) | 1
+    if lo >= hi:
+        if out is not None:
+            return found
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    if num_threads <= 0:
+        num_threads = os.cpu_count() or 1
+
+    cdef Py_ssize_t words = max(segment_bytes // 8, 1) if segment_bytes > 0 else SEGMENT_WORDS
+    if segments_per_thread <= 0:
+        segments_per_thread = SEGMENTS_PER_THREAD
+    cdef Py_ssize_t batch = num_threads * segments_per_thread
+    if base_bytes < 0:
+        base_bytes = BASE_BYTES
+
+    cdef int64_t root = <int64_t>sqrt(<double>(hi - 1)) + 1
+    cdef const int64_t *base_ptr = NULL
+    cdef Py_ssize_t nbase = 0
+    cdef const int64_t[::1] base_view
+    cdef uint64_t[::1] base_bits_view
+    cdef uint64_t *base_bits = NULL
+    stats = current_stats() if STATS else None
+    if root >= SMALL_PRIME_LIMIT and 8 * _prime_count_bound(root) > base_bytes:
+        # The whole range is a single window, or as much of it as the memory
+        # the table would have taken allows.
+        words = min(max(batch * words, base_bytes // 8),
+                    ((hi - lo + 1) // 2 + 63) // 64)
+        batch = 1
+        base_bits_buffer = np.empty(SEGMENT_WORDS, dtype=np.uint64)
+        base_bits_view = base_bits_buffer
+        base_bits = &base_bits_view[0]
+    else:
+        if stats is not None:
+            started = perf_counter()
+        base = _odd_base_primes(root)
+        if stats is not None:
+            stats.add_time('base primes', perf_counter() - started)
+        base_view = base
+        base_ptr = &base_view[0] if base.size else NULL
+        nbase = base.size
+
+    bits = np.empty(batch * words, dtype=np.uint64)
+    counts = np.empty(batch, dtype=np.int64)
+    offsets = np.empty(batch + 1, dtype=np.int64)
+    cdef uint64_t[::1] bits_view = bits
+    cdef int64_t[::1] counts_view = counts
+    cdef int64_t[::1] offsets_view = offsets
+    cdef int64_t[::1] chunk_view
+
+    cdef Py_ssize_t nseg, nfit
+    cdef int64_t total, room, marks = 0
+
+    if stats is not None:
+        stats.bytes_allocated += bits.nbytes
+    while lo < hi and (imax < 0 or found < imax):
+        if stats is not None:
+            started = perf_counter()
+        with nogil:
+            nseg = _sieve_batch(lo, hi, batch, num_threads, words, &bits_view[0],
+                                &counts_view[0], &offsets_view[0], base_ptr, nbase, root,
+                                base_bits, &marks)
+        total = offsets_view[nseg]
+        if stats is not None:
+            stats.add_time('sieve', perf_counter() - started)
+            stats.segments += nseg
+            started = perf_counter()
+
+        if out is None:
+            chunk = np.empty(total, dtype=np.int64)
+            if total:
+                chunk_view = chunk
+                with nogil:
+                    _extract_batch(&bits_view[0], words, lo, nseg, &counts_view[0],
+                                   &offsets_view[0], &chunk_view[0], num_threads)
+            if stats is not None:
+                stats.bytes_allocated += chunk.nbytes
+            chunks.append(chunk)
+        elif total <= limit - found:
+            if total:
+                with nogil:
+                    _extract_batch(&bits_view[0], words, lo, nseg, &counts_view[0],
+                                   &offsets_view[0], &dest[found], num_threads)
+        else:
+            if imax < 0:
+                raise ValueError("out is too small for the primes in the range, "
+                                 "see sieve_size")
+            # Write the segments that fit whole, then the part of the next one
+            # that fits.
+            room = limit - found
+            nfit = 0
+            while offsets_view[nfit + 1] <= room:
+                nfit += 1
+            with nogil:
+                _extract_batch(&bits_view[0], words, lo, nfit, &counts_view[0],
+                               &offsets_view[0], &dest[found], num_threads)
+            chunk = np.empty(counts_view[nfit], dtype=np.int64)
+            chunk_view = chunk
+            _extract_segment(&bits_view[nfit * words], words, lo + 128 * words * nfit,
+                             &chunk_view[0])
+            dest[found + offsets_view[nfit]:limit] = chunk_view[:room - offsets_view[nfit]]
+            total = room
+
+        if stats is not None:
+            stats.add_time('extract', perf_counter() - started)
+        found += total
+        lo += 128 * words * nseg
+
+    if stats is not None:
+        stats.marks += marks
+    if out is not None:
+        return found
+    result = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+    if imax >= 0:
+        result = result[:imax]
+    return result
+
+
+def sieve_size(int64_t lo, int64_t hi, int64_t imax=-1):
+    """
+    Returns the size of the ``out`` buffer needed by `sieve`.
+
+    This is the number of primes in ``[lo, hi)``, found with `prime_count`
+    without sieving the range.
+
+    Parameters
+    ----------
+    lo, hi: int
+        The bounds of the half-open range.
+    imax: int, optional
+        If not negative, the number of primes `sieve` is asked to stop at.
+
+    Returns
+    -------
+    size: int
+        The number of primes `sieve` would return.
+    """
+    cdef int64_t size = prime_count(hi - 1) - prime_count(lo - 1) if hi > lo else 0
+    return size if imax < 0 else min(size, imax)
+
+
+def primes(int64_t imax, int num_threads=0, out=None, Py_ssize_t segment_bytes=0,
+           Py_ssize_t segments_per_thread=0, Py_ssize_t base_bytes=-1):
     """
     Returns prime numbers up to imax.
 
     Parameters
     ----------
     imax: int
-        The number of primes to return. This should be less or equal to 10000.
+        The number of primes to return.
+    num_threads: int, optional
+        The number of threads to sieve with. Defaults to the number of CPUs.
+    out: buffer, optional
+        A writable, contiguous buffer of at least ``imax`` 64-bit integers to
+        write the primes to instead, as for `sieve`.
+    segment_bytes, segments_per_thread, base_bytes: int, optional
+        The sizes of the sieve buffers, as for `sieve`.
 
     Returns
     -------
-    result: list
-        The list of prime numbers.
-    """
-
-    cdef int n, k, i
-    cdef int p[10001]
-    result = []
-    k = 0
-    n = 2
-    i = 0
-
-    if imax > 10000:
-        raise ValueError("imax should be <= 10000")
-
-    while len(result) < imax:
-        i = 0
-        while i < k and n % p[i] != 0:
-            i = i + 1
-        if i == k:
-            p[k] = n
-            k = k + 1
-            result.append(n)
-            if k > 10000:
+    result: list or int
+        The list of prime numbers, or the number of primes written if
+        ``out`` is given.
+    """
+
+    if imax <= 0:
+        return [] if out is None else 0
+    if imax <= SMALL_PRIME_COUNT:
+        if out is None:
+            return SMALL_PRIMES[:imax].tolist()
+        return sieve(2, SMALL_PRIME_LIMIT, imax, out=out)
+    # Rosser's upper bound for the imax-th prime
+    bound = int(imax * (log(imax) + log(log(imax)))) + 2
+
+    if out is not None:
+        return sieve(2, bound, imax, num_threads, out, segment_bytes, segments_per_thread,
+                     base_bytes)
+    return sieve(2, bound, imax, num_threads, None, segment_bytes,
+                 segments_per_thread, base_bytes).tolist()
+
+
+ctypedef struct _PiTable:
+    # Odd-only prime bitmap (bit i stands for 2 * i + 1) up to limit, with the
+    # number of primes before each 64-bit word, plus the primes themselves
+    # with primes[i] being the i-th prime (primes[0] is unused).
+    const uint64_t *bits
+    const int64_t *prefix
+    int64_t limit
+    const int64_t *primes
+    Py_ssize_t nprimes
+    const int64_t *small_phi
+
+
+cdef inline int64_t _pi(int64_t y, const _PiTable *t) noexcept nogil:
+    # Number of primes <= y, for y <= t.limit
+    cdef int64_t b
+    if y < 2:
+        return 0
+    b = (y - 1) >> 1
+    return 1 + t.prefix[b >> 6] + popcount64(
+        t.bits[b >> 6] & (((<uint64_t>2) << (b & 63)) - 1))
+
+
+cdef int64_t _phi(int64_t x, Py_ssize_t a, const _PiTable *t) noexcept nogil:
+    # Number of integers in [1, x] that are not divisible by any of the first
+    # a primes, using phi(x, a) = phi(x, a - 1) - phi(x / p_a, a - 1).
+    cdef int64_t result, y, p
+    cdef Py_ssize_t i
+
+    if a == 0:
+        return x
+    if a == PHI_A:
+        return (x // PHI_PRIMORIAL) * t.small_phi[PHI_PRIMORIAL] + t.small_phi[x % PHI_PRIMORIAL]
+    if x <= t.primes[a]:
+        return 1 if x >= 1 else 0
+    if (x <= t.limit and a < t.nprimes
+            and x < t.primes[a + 1] * t.primes[a + 1]):
+        # Only 1 and the primes above p_a are left
+        return _pi(x, t) - a + 1
+    if a < PHI_A:
+        return _phi(x, a - 1, t) - _phi(x // t.primes[a], a - 1, t)
+
+    result = _phi(x, PHI_A, t)
+    for i in range(PHI_A + 1, a + 1):
+        p = t.primes[i]
+        y = x // p
+        if y <= t.primes[i - 1] and x <= t.limit:
+            # Every remaining term is phi(y, i - 1) = 1, for as long as p <= x
+            y = min(<int64_t>a, _pi(x, t)) - i + 1
+            if y > 0:
+                result -= y
+            break
+        result -= _phi(y, i - 1, t)
+    return result
+
+
+cdef int64_t _icbrt(int64_t x) noexcept nogil:
+    cdef int64_t r = <int64_t>cbrt(<double>x)
+    while r * r * r > x:
+        r -= 1
+    while (r + 1) * (r + 1) * (r + 1) <= x:
+        r += 1
+    return r
+
+
+cdef int64_t _isqrt(int64_t x) noexcept nogil:
+    cdef int64_t r = <int64_t>sqrt(<double>x)
+    while r * r > x:
+        r -= 1
+    while (r + 1) * (r + 1) <= x:
+        r += 1
+    return r
+
+
+def prime_count(int64_t x, int num_threads=0):
+    """
+    Returns the number of primes less than or equal to x.
+
+    This uses the Meissel-Lehmer method, so the primes below x are never
+    enumerated: only a table of the primes below x**(2/3) is sieved, and the
+    rest is counted with the phi(x, a) recursion.
+
+    Parameters
+    ----------
+    x: int
+        The upper bound, included in the count.
+    num_threads: int, optional
+        The number of threads to sieve the table with. Defaults to the number
+        of CPUs.
+
+    Returns
+    -------
+    count: int
+        The number of primes <= x.
+    """
+
+    if x < SMALL_PRIME_LIMIT:
+        return int(np.searchsorted(SMALL_PRIMES, x, 'right'))
+    if num_threads <= 0:
+        num_threads = os.cpu_count() or 1
+
+    cdef int64_t root3 = _icbrt(x)
+    cdef int64_t limit = max(root3 * root3 + 1, PHI_PRIMORIAL, _isqrt(x) + 1)
+    cdef Py_ssize_t nseg = ((limit + 1) // 2 + SEGMENT_BITS - 1) // SEGMENT_BITS
+    cdef Py_ssize_t k
+
+    # Sieve the table of primes up to limit, all segments at once
+    base = _odd_base_primes(_isqrt(limit) + 1)
+    cdef const int64_t[::1] base_view = base
+    cdef const int64_t *base_ptr = &base_view[0] if base.size else NULL
+    cdef Py_ssize_t nbase = base.size
+    bits = np.empty(nseg * SEGMENT_WORDS, dtype=np.uint64)
+    cdef uint64_t[::1] bits_view = bits
+    with nogil:
+        for k in prange(nseg, num_threads=num_threads, schedule='static'):
+            _sieve_segment(&bits_view[k * SEGMENT_WORDS], SEGMENT_WORDS,
+                           1 + 2 * SEGMENT_BITS * k, SEGMENT_BITS, base_ptr, nbase)
+        bits_view[0] &= ~(<uint64_t>1)
+
+    prefix = np.empty(bits.size + 1, dtype=np.int64)
+    cdef int64_t[::1] prefix_view = prefix
+    with nogil:
+        prefix_view[0] = 0
+        for k in range(nseg * SEGMENT_WORDS):
+            prefix_view[k + 1] = prefix_view[k] + popcount64(bits_view[k])
+
+    # The primes up to sqrt(x), 1-indexed
+    small = np.concatenate([[0, 2], sieve(3, _isqrt(x) + 1, num_threads=num_threads)])
+    cdef int64_t[::1] primes_view = small
+
+    small_phi = np.ones(PHI_PRIMORIAL + 1, dtype=np.int64)
+    small_phi[0] = 0
+    for p in small[1:PHI_A + 1]:
+        small_phi[::p] = 0
+    np.cumsum(small_phi, out=small_phi)
+    cdef int64_t[::1] small_phi_view = small_phi
+
+    cdef _PiTable table
+    table.bits = &bits_view[0]
+    table.prefix = &prefix_view[0]
+    table.limit = limit
+    table.primes = &primes_view[0]
+    table.nprimes = small.size - 1
+    table.small_phi = &small_phi_view[0]
+
+    cdef Py_ssize_t a = _pi(root3, &table)
+    cdef Py_ssize_t b = _pi(_isqrt(x), &table)
+    cdef int64_t result
+    with nogil:
+        result = _phi(x, a, &table) + a - 1
+        for k in range(a + 1, b + 1):
+            result -= _pi(x // table.primes[k], &table) - k + 1
+    return result
+
+
+cdef bint _is_prime64(uint64_t n, const uint64_t *small_bits) noexcept nogil:
+    cdef uint64_t d, x, a, ninv, one, minus_one, r2, lo
+    cdef uint64_t e
+    cdef int r, s, j
+
+    if n < SMALL_PRIME_LIMIT:
+        return n == 2 or (n & 1 and (SMALL_PRIME_BITS[n >> 7] >> ((n >> 1) & 63)) & 1)
+    if n < SMALL_LIMIT:
+        return n & 1 and (small_bits[n >> 7] >> ((n >> 1) & 63)) & 1
+
+    # Cheap rejection of most composites, with constant divisors that the
+    # compiler turns into multiplications
+    if (not n & 1 or n % 3 == 0 or n % 5 == 0 or n % 7 == 0 or n % 11 == 0
+            or n % 13 == 0 or n % 17 == 0 or n % 19 == 0 or n % 23 == 0
+            or n % 29 == 0 or n % 31 == 0 or n % 37 == 0):
+        return False
+
+    # Miller-Rabin, with all of the arithmetic in Montgomery form
+    ninv = n
+    for j in range(5):
+        ninv *= 2 - n * ninv
+    one = (0 - n) % n
+    minus_one = n - one
+    r2 = 0
+
+    d = n - 1
+    s = 0
+    while not d & 1:
+        d >>= 1
+        s += 1
+
+    for j in range(7):
+        if j == 0:
+            # 2 in Montgomery form is just 2**65 mod n
+            a = one + one - n if one >= n - one else one + one
+        else:
+            a = MR_BASES[j] % n
+            if a == 0:
+                continue
+            if r2 == 0:
+                # 2**128 mod n, by doubling 2**64 mod n. This is only needed
+                # for the numbers that pass the first base, which are rare.
+                r2 = one
+                for r in range(64):
+                    r2 = r2 + r2 - n if r2 >= n - r2 else r2 + r2
+            a = montmul(a, r2, n, ninv)
+        x = one
+        e = d
+        while e:
+            if e & 1:
+                x = montmul(x, a, n, ninv)
+            a = montmul(a, a, n, ninv)
+            e >>= 1
+        if x == one or x == minus_one:
+            continue
+        for r in range(s - 1):
+            x = montmul(x, x, n, ninv)
+            if x == minus_one:
                 break
-        n = n + 1
+        else:
+            return False
+    return True
+
+
+cdef object _odd_prime_bitmap(int64_t limit):
+    # Odd-only bitmap of the primes below limit, with bit i standing for
+    # 2 * i + 1, in the same layout as the sieve segments.
+    cdef int64_t nbits = limit // 2
+    bits = np.empty(max((nbits + 63) // 64, SEGMENT_WORDS), dtype=np.uint64)
+    cdef uint64_t[::1] bits_view = bits
+    base = _odd_base_primes(_isqrt(limit) + 1)
+    cdef const int64_t[::1] base_view = base
+    _sieve_segment(&bits_view[0], bits.size, 1, nbits, &base_view[0], base.size)
+    bits_view[0] &= ~(<uint64_t>1)
+    return bits
+
+
+_small_bits = None
+
+
+def is_prime(values, int num_threads=0):
+    """
+    Tests whether each of the given integers is prime.
+
+    Values below 2**16 are looked up in the compiled bitmap, those below
+    2**20 in a bitmap sieved on first use, and larger ones are tested with
+    a deterministic Miller-Rabin test, in parallel and without holding the
+    GIL.
+
+    Parameters
+    ----------
+    values: array_like
+        An integer or an array of integers, with at most 64 bits.
+    num_threads: int, optional
+        The number of threads to test with. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    result: `numpy.ndarray`
+        A boolean array with the same shape as ``values``.
+    """
+    global _small_bits
+
+    values = np.asarray(values)
+    if not values.size:
+        # An empty list is converted to floats
+        values = values.astype(np.int64)
+    if values.dtype.kind not in 'iu':
+        raise TypeError("is_prime expects integer values")
+    if num_threads <= 0:
+        num_threads = os.cpu_count() or 1
+
+    n = np.ascontiguousarray(values, dtype=np.uint64)
+    result = np.zeros(values.shape, dtype=bool)
+    cdef const uint64_t[::1] n_view = n.ravel()
+    cdef unsigned char[::1] result_view = result.view(np.uint8).ravel()
+    cdef const uint64_t[::1] small_view
+    cdef const uint64_t *small_bits = NULL
+    cdef Py_ssize_t i
+
+    # Values below SMALL_PRIME_LIMIT only need the compiled bitmap
+    if n.size and n.max() >= SMALL_PRIME_LIMIT:
+        if _small_bits is None:
+            _small_bits = _odd_prime_bitmap(SMALL_LIMIT)
+        small_view = _small_bits
+        small_bits = &small_view[0]
+
+    if n_view.shape[0]:
+        with nogil:
+            for i in prange(n_view.shape[0], num_threads=num_threads, schedule='static'):
+                result_view[i] = _is_prime64(n_view[i], small_bits)
 
+    if values.dtype.kind == 'i':
+        result[values < 0] = False
     return result
+
+
+def smallest_prime_factors(int64_t limit):
+    """
+    Returns the table of the smallest prime factor of every integer below
+    ``limit``, built with a linear sieve.
+
+    Parameters
+    ----------
+    limit: int
+        The size of the table. This should be less than 2**32.
+
+    Returns
+    -------
+    spf: `numpy.ndarray`
+        A 32-bit unsigned integer array, in which ``spf[n]`` is the smallest
+        prime factor of ``n`` for ``n >= 2``, and ``spf[0] = spf[1] = 0``.
+    """
+    if limit > 2 ** 32:
+        raise ValueError("limit should be <= 2**32")
+    spf = np.zeros(max(limit, 0), dtype=np.uint32)
+    found = np.empty(max(limit // 2, 16), dtype=np.uint32)
+    cdef uint32_t[::1] spf_view = spf
+    cdef uint32_t[::1] primes_view = found
+    cdef int64_t i, m
+    cdef Py_ssize_t j, nprimes = 0
+    cdef uint32_t p
+
+    with nogil:
+        for i in range(2, limit):
+            if spf_view[i] == 0:
+                spf_view[i] = <uint32_t>i
+                primes_view[nprimes] = <uint32_t>i
+                nprimes += 1
+            # Each composite is crossed off exactly once, by its smallest
+            # prime factor.
+            for j in range(nprimes):
+                p = primes_view[j]
+                m = i * p
+                if p > spf_view[i] or m >= limit:
+                    break
+                spf_view[m] = p
+    return spf
+
+
+cdef uint64_t _gcd(uint64_t a, uint64_t b) noexcept nogil:
+    cdef int shift
+    if a == 0:
+        return b
+    if b == 0:
+        return a
+    shift = ctz64(a | b)
+    a >>= ctz64(a)
+    while b:
+        b >>= ctz64(b)
+        if a > b:
+            a, b = b, a
+        b -= a
+    return a << shift
+
+
+cdef uint64_t _pollard_brent(uint64_t n, uint64_t c) noexcept nogil:
+    # Returns a non-trivial factor of the odd composite n, or n on failure.
+    # The iteration x -> x**2 + c is done in Montgomery form, which doesn't
+    # change the gcds with n.
+    cdef uint64_t ninv = n, x, y, ys, q, g
+    cdef Py_ssize_t i, k, r, m = 128
+    for i in range(5):
+        ninv *= 2 - n * ninv
+    q = (0 - n) % n
+    y = 2 % n
+    g = 1
+    r = 1
+    while g == 1:
+        x = y
+        for i in range(r):
+            y = montmul(y, y, n, ninv)
+            y = y - (n - c) if y >= n - c else y + c
+        k = 0
+        while k < r and g == 1:
+            ys = y
+            for i in range(min(m, r - k)):
+                y = montmul(y, y, n, ninv)
+                y = y - (n - c) if y >= n - c else y + c
+                q = montmul(q, x - y if x > y else y - x, n, ninv)
+            g = _gcd(q, n)
+            k += m
+        r *= 2
+    if g == n:
+        # The batched product hit zero, so step through the last batch again
+        g = 1
+        while g == 1:
+            ys = montmul(ys, ys, n, ninv)
+            ys = ys - (n - c) if ys >= n - c else ys + c
+            g = _gcd(x - ys if x > ys else ys - x, n)
+    return g
+
+
+cdef int _factor64(uint64_t n, const uint32_t *spf, uint64_t limit,
+                   const uint64_t *small_bits, uint64_t *factors,
+                   uint8_t *exponents) noexcept nogil:
+    # Writes the distinct prime factors of n in increasing order along with
+    # their exponents, and returns how many there are.
+    cdef uint64_t raw[MAX_FACTORS]
+    cdef uint64_t stack[MAX_FACTORS]
+    cdef int nraw = 0, nstack = 0, count = 0, i, j
+    cdef uint64_t m, d, c, p
+
+    if n < 2:
+        return 0
+    while not n & 1:
+        raw[nraw] = 2
+        nraw += 1
+        n >>= 1
+
+    if n > 1:
+        stack[0] = n
+        nstack = 1
+    while nstack:
+        nstack -= 1
+        m = stack[nstack]
+        if m < limit:
+            while m > 1:
+                raw[nraw] = spf[m]
+                nraw += 1
+                m //= spf[m]
+        elif _is_prime64(m, small_bits):
+            raw[nraw] = m
+            nraw += 1
+        else:
+            c = 1
+            d = _pollard_brent(m, c)
+            while d == m:
+                c += 1
+                d = _pollard_brent(m, c)
+            stack[nstack] = d
+            stack[nstack + 1] = m // d
+            nstack += 2
+
+    # Sort the prime factors and merge repeated ones
+    for i in range(1, nraw):
+        p = raw[i]
+        j = i - 1
+        while j >= 0 and raw[j] > p:
+            raw[j + 1] = raw[j]
+            j -= 1
+        raw[j + 1] = p
+    for i in range(nraw):
+        if count and factors[count - 1] == raw[i]:
+            exponents[count - 1] += 1
+        else:
+            factors[count] = raw[i]
+            exponents[count] = 1
+            count += 1
+    return count
+
+
+_spf_table = None
+
+
+def factorize(values, int64_t limit=2 ** 22, int num_threads=0):
+    """
+    Factorizes each of the given integers.
+
+    Values below ``limit`` are factored by repeated lookups in a table of
+    smallest prime factors, and larger ones with Pollard's rho algorithm,
+    in parallel and without holding the GIL.
+
+    Parameters
+    ----------
+    values: array_like
+        An array of non-negative integers, with at most 64 bits.
+    limit: int, optional
+        The size of the smallest prime factor table.
+    num_threads: int, optional
+        The number of threads to factor with. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    offsets: `numpy.ndarray`
+        An array of ``len(values) + 1`` offsets, such that the factors of
+        ``values[i]`` are ``factors[offsets[i]:offsets[i + 1]]``.
+    factors: `numpy.ndarray`
+        The distinct prime factors of every value in increasing order, as
+        64-bit unsigned integers.
+    exponents: `numpy.ndarray`
+        The multiplicity of each of the factors, as 8-bit unsigned integers.
+    """
+    global _small_bits, _spf_table
+
+    values = np.asarray(values)
+    if not values.size:
+        # An empty list is converted to floats
+        values = values.astype(np.int64)
+    if values.dtype.kind not in 'iu':
+        raise TypeError("factorize expects integer values")
+    if values.dtype.kind == 'i' and (values < 0).any():
+        raise ValueError("factorize expects non-negative values")
+    if num_threads <= 0:
+        num_threads = os.cpu_count() or 1
+
+    if _small_bits is None:
+        _small_bits = _odd_prime_bitmap(SMALL_LIMIT)
+    if _spf_table is None or len(_spf_table) != max(limit, 2):
+        _spf_table = smallest_prime_factors(max(limit, 2))
+    cdef const uint64_t[::1] small_view = _small_bits
+    cdef const uint32_t[::1] spf_view = _spf_table
+
+    n = np.ascontiguousarray(values, dtype=np.uint64).ravel()
+    cdef const uint64_t[::1] n_view = n
+    cdef Py_ssize_t i, size = n.size
+
+    # Factor into fixed-size slots first, then compact them
+    all_factors = np.empty((size, MAX_DISTINCT_FACTORS), dtype=np.uint64)
+    all_exponents = np.empty((size, MAX_DISTINCT_FACTORS), dtype=np.uint8)
+    counts = np.zeros(size, dtype=np.int64)
+    cdef uint64_t[:, ::1] factors_view = all_factors
+    cdef uint8_t[:, ::1] exponents_view = all_exponents
+    cdef int64_t[::1] counts_view = counts
+
+    if size:
+        with nogil:
+            for i in prange(size, num_threads=num_threads, schedule='dynamic',
+                            chunksize=256):
+                counts_view[i] = _factor64(n_view[i], &spf_view[0], max(limit, 2),
+                                           &small_view[0], &factors_view[i, 0],
+                                           &exponents_view[i, 0])
+
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    used = np.arange(MAX_DISTINCT_FACTORS) < counts[:, None]
+    return offsets, all_factors[used], all_exponents[used]
@@ -1,78 +1,1714 @@
-__all__ = ['primes', 'do_primes']
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import chain, compress
+from math import ceil, log
+from time import perf_counter
 
+from .example_subpkg.instrumentation import current_stats, profile as _profile
 
-def primes(imax):
+try:
+    from math import isqrt
+except ImportError:  # Python < 3.8
+    def isqrt(n):
+        x = int(n ** 0.5)
+        while x * x > n:
+            x -= 1
+        while (x + 1) * (x + 1) <= n:
+            x += 1
+        return x
+
+__all__ = ['primes', 'iter_primes', 'iter_prime_chunks', 'prime_count',
+           'primes_in_range', 'nth_prime', 'is_prime', 'smallest_prime_factors',
+           'factorize', 'PrimeCache', 'prime_cache', 'aiter_prime_chunks', 'aprimes',
+           'Backend', 'register_backend', 'unregister_backend', 'available_backends',
+           'calibrate_backends', 'choose_backend', 'do_primes']
+
+# Number of odd numbers sieved per segment. One byte is used per odd number,
+# so the default keeps a segment within a typical 256 KiB L2 cache. The
+# engines use the size picked by example_subpkg.tuning.autotune instead, once
+# it has been run.
+SEGMENT_SIZE = 2 ** 18
+
+# Approximate peak memory per prime returned by each backend, in bytes: a
+# list holds a pointer to a 32-byte int object per prime, and the compiled
+# and NumPy engines also hold the primes in 64-bit arrays before converting
+# them.
+_LIST_BYTES = 44
+_BYTES_PER_PRIME = {'python': _LIST_BYTES, 'cython': 52, 'numpy': 60, 'parallel': 52}
+
+# Approximate memory per odd number of a pure Python sieve segment, in bytes,
+# counting the list of the primes found in it.
+_SEGMENT_BYTES = 16
+
+# The base primes of the compiled sieve take at least the one 32 KiB segment
+# they are streamed through.
+_BASE_SEGMENT_BYTES = 2 ** 15
+
+
+def primes(imax=None, limit=None, as_set=False, max_memory=None, persistent=False):
     """
-    Returns prime numbers up to imax.
+    Returns prime numbers, either the first ``imax`` of them or all of the
+    primes below ``limit``.
+
+    The primes are generated with a segmented Sieve of Eratosthenes over the
+    odd numbers, so the working memory (besides the result itself) only grows
+    with the square root of the largest prime returned. If this process is
+    attached to a shared prime table, they are read from it instead.
 
     Parameters
     ----------
-    imax: int
-        The number of primes to return. This should be less or equal to 10000.
+    imax: int, optional
+        The number of primes to return.
+    limit: int, optional
+        If given instead of ``imax``, return all of the primes strictly
+        smaller than this number.
+    as_set: bool, optional
+        Return a `~{{ cookiecutter.module_name }}.example_subpkg.prime_set.PrimeSet`
+        instead of a list, which takes about one bit per odd number.
+    max_memory: int, optional
+        The memory budget of the call in bytes, including the result.
+        Defaults to the budget set by
+        `~{{ cookiecutter.module_name }}.example_subpkg.tuning.autotune`, if
+        any. The sieve segments are shrunk to fit in it if needed.
+    persistent: bool, optional
+        Read the primes from the on-disk
+        `~{{ cookiecutter.module_name }}.example_subpkg.prime_table.PrimeTable`
+        in the cache directory, extending it if needed, so that they are only
+        sieved once across processes and sessions.
+
+    Returns
+    -------
+    result: list or `~{{ cookiecutter.module_name }}.example_subpkg.prime_set.PrimeSet`
+        The prime numbers.
+
+    Raises
+    ------
+    MemoryError
+        If the result is expected to take more than ``max_memory``, before
+        any work is done.
+    """
+
+    if (imax is None) == (limit is None):
+        raise ValueError("exactly one of imax and limit should be given")
+
+    if as_set:
+        from .example_subpkg.prime_set import PrimeSet
+        if limit is None:
+            limit = nth_prime(imax) + 1 if imax > 0 else 2
+        _check_memory(_prime_set_bytes(2, limit), _memory_budget(max_memory))
+        return PrimeSet.from_range(2, limit)
+
+    table = _persistent_table() if persistent else _attached_table()
+    if table is not None:
+        if limit is None:
+            return table.primes(imax).tolist()
+        return table.primes_below(limit).tolist()
+
+    if limit is not None:
+        stop = limit
+    elif imax <= 0:
+        return []
+    else:
+        stop = _nth_prime_upper_bound(imax) + 1
+
+    count = imax if limit is None else _prime_count_upper_bound(2, limit)
+    segment_size, max_size = _python_segments(stop, _LIST_BYTES * count,
+                                              _memory_budget(max_memory))
+
+    result = []
+    for segment in _iter_segments(2, stop, segment_size, max_size):
+        result.extend(segment)
+        if imax is not None and len(result) >= imax:
+            del result[imax:]
+            break
+
+    return result
+
+
+def _attached_table():
+    """
+    Returns the shared prime table this process is attached to, or `None`.
+
+    Nothing can be attached before the shared_table module is imported, so
+    there is no need to import it (and NumPy) here.
+    """
+    shared_table = sys.modules.get(__package__ + '.example_subpkg.shared_table')
+    return None if shared_table is None else shared_table.attached_table()
+
+
+_prime_table = None
+
+
+def _persistent_table():
+    """
+    Returns the on-disk prime table of the cache directory, opened on first
+    use.
+    """
+    global _prime_table
+    if _prime_table is None:
+        from .example_subpkg.prime_table import PrimeTable
+        _prime_table = PrimeTable()
+    return _prime_table
+
+
+def _nth_prime_upper_bound(n):
+    """
+    Returns an upper bound for the n-th prime (Rosser's theorem).
+    """
+    if n < 6:
+        return (2, 3, 5, 7, 11, 13)[max(n, 1) - 1]
+    logn = log(n)
+    return int(n * (logn + log(logn))) + 1
+
+
+def _settings():
+    from .example_subpkg.tuning import settings
+    return settings()
+
+
+def _prime_count_upper_bound(lo, hi):
+    """
+    Returns an upper bound for the number of primes in ``[lo, hi)``, from the
+    bounds of Rosser and Schoenfeld, and of Montgomery and Vaughan for short
+    ranges.
+    """
+    length = hi - max(lo, 0)
+    if length < 2:
+        return max(length, 0)
+    if hi <= 17:
+        return length
+    return min(int(1.25506 * hi / log(hi)) + 1, int(2 * length / log(length)) + 1)
+
+
+def _memory_budget(max_memory):
+    """
+    Returns ``max_memory``, or the default budget if it is `None`.
+    """
+    return _settings()['max_memory'] if max_memory is None else max_memory
+
+
+def _check_memory(nbytes, max_memory):
+    if max_memory is not None and nbytes > max_memory:
+        raise MemoryError('this needs about {0} bytes, more than max_memory={1}'.format(
+            nbytes, max_memory))
+
+
+def _prime_set_bytes(lo, hi):
+    # The bitmap, and the flags of the segment being packed into it
+    return max(hi - lo, 0) // 16 + 16 * 2 ** 20
+
+
+def _python_segments(stop, reserved, max_memory):
+    """
+    Returns the segment size of the pure Python sieve and the size segments
+    may grow to, so that sieving up to ``stop`` takes at most
+    ``max_memory - reserved`` bytes.
+    """
+    size = _settings()['segment_size']
+    if max_memory is None:
+        return size, None
+    # The base primes are sieved in a bytearray and kept in a list, which is
+    # up to twice as large as needed since it grows by doubling.
+    root = 2 * isqrt(max(stop, 1)) + 2
+    base = root + 2 * _LIST_BYTES * _prime_count_upper_bound(2, root)
+    max_size = (max_memory - reserved - base) // _SEGMENT_BYTES
+    if max_size < 2 ** 10:
+        _check_memory(reserved + base + 2 ** 10 * _SEGMENT_BYTES, max_memory)
+    return min(size, max_size), max_size
+
+
+def _compiled_options(reserved=0, max_memory=None, num_threads=0):
+    """
+    Returns the sizes of the compiled sieve's buffers, reduced if needed so
+    that they take at most ``max_memory - reserved`` bytes, along with the
+    base primes.
+    """
+    settings = _settings()
+    options = {'segment_bytes': settings['segment_bytes'],
+               'segments_per_thread': settings['segments_per_thread']}
+    if max_memory is not None:
+        threads = num_threads or os.cpu_count() or 1
+        size, count = options['segment_bytes'], options['segments_per_thread']
+        reserved += _BASE_SEGMENT_BYTES
+        while threads * count * size > max_memory - reserved and count > 1:
+            count //= 2
+        while threads * count * size > max_memory - reserved and size > 2 ** 12:
+            size //= 2
+        _check_memory(reserved + threads * count * size, max_memory)
+        # The base primes are kept in a table if it fits in what is left, and
+        # streamed otherwise
+        options.update(segment_bytes=size, segments_per_thread=count,
+                       base_bytes=max_memory - reserved - threads * count * size)
+    return options
+
+
+def _small_primes(limit):
+    """
+    Returns the list of primes below ``limit`` using a plain sieve.
+    """
+    if limit < 3:
+        return []
+    sieve = bytearray([1]) * limit
+    sieve[:2] = b'\x00\x00'
+    for p in range(2, isqrt(limit - 1) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = bytes(len(range(p * p, limit, p)))
+    return list(compress(range(limit), sieve))
+
+
+def _iter_flags(start=3, stop=None, segment_size=None, max_size=None):
+    """
+    Sieves the odd numbers in ``[max(start, 3), stop)`` segment by segment.
+
+    Yields ``(lo, flags)`` pairs, where ``flags`` is a `bytearray` in which
+    ``flags[i]`` is non-zero if ``lo + 2 * i`` is prime. The base primes
+    needed to sieve a segment are extended on demand, so ``stop`` can be
+    `None` to keep sieving forever. Segments hold ``segment_size`` odd
+    numbers, the tuned size by default, and grow with ``sqrt(stop)`` up to
+    ``max_size``.
+    """
+    if segment_size is None:
+        segment_size = _settings()['segment_size']
+    lo = max(start, 3) | 1
+    base = []
+    base_limit = 0
+    stats = current_stats()
+
+    while stop is None or lo < stop:
+        # Segments grow with sqrt(hi) so that the per-base-prime overhead
+        # stays proportional to the work done in the segment.
+        size = max(segment_size, isqrt(lo) >> 1)
+        if max_size is not None:
+            size = min(size, max_size)
+        hi = lo + 2 * size
+        if stop is not None and hi > stop:
+            hi = stop
+            size = (hi - lo + 1) >> 1
+
+        root = isqrt(hi - 1)
+        if root >= base_limit:
+            started = perf_counter()
+            base_limit = max(root + 1, 2 * base_limit)
+            base = _small_primes(base_limit)[1:]
+            if stats is not None:
+                stats.add_time('base primes', perf_counter() - started)
+
+        started = perf_counter() if stats is not None else 0
+        segment = bytearray([1]) * size
+        marks = 0
+        for p in base:
+            pp = p * p
+            if pp >= hi:
+                break
+            if pp >= lo:
+                i = (pp - lo) >> 1
+            else:
+                # Start from the first odd multiple of p that is >= lo
+                i = ((-(-lo // p) | 1) * p - lo) >> 1
+            if i < size:
+                count = (size - 1 - i) // p + 1
+                segment[i::p] = bytes(count)
+                marks += count
+        if stats is not None:
+            stats.segments += 1
+            stats.marks += marks
+            stats.bytes_allocated += size
+            stats.add_time('sieve', perf_counter() - started)
+
+        yield lo, segment
+        lo = hi
+
+
+def _iter_segments(start=2, stop=None, segment_size=None, max_size=None):
+    """
+    Yields the primes in ``[start, stop)`` as one list per sieve segment.
+    """
+    if stop is not None and stop <= start:
+        return
+    if start <= 2 and (stop is None or stop > 2):
+        yield [2]
+    stats = current_stats()
+    for lo, segment in _iter_flags(start, stop, segment_size, max_size):
+        if stats is None:
+            yield [lo + 2 * i for i in compress(range(len(segment)), segment)]
+        else:
+            with stats.phase('extract'):
+                found = [lo + 2 * i for i in compress(range(len(segment)), segment)]
+            yield found
+
+
+def iter_primes(start=2, stop=None, chunk=None):
+    """
+    Iterates over the prime numbers in ``[start, stop)`` in increasing order.
+
+    The primes are produced by an incremental segmented sieve, so the
+    iterator can be left unbounded and abandoned at any point. Memory use
+    grows with the square root of the current position, not with the number
+    of primes produced.
+
+    Parameters
+    ----------
+    start: int, optional
+        The smallest number to consider.
+    stop: int, optional
+        If given, stop before this number. Otherwise iterate forever.
+    chunk: int, optional
+        The number of odd numbers sieved at a time. Defaults to the tuned
+        segment size.
+
+    Yields
+    ------
+    prime: int
+        The next prime number.
+    """
+    for segment in _iter_segments(start, stop, chunk):
+        yield from segment
+
+
+def iter_prime_chunks(start=2, stop=None, chunk=None, usecython=False):
+    """
+    Iterates over the prime numbers in ``[start, stop)`` in NumPy arrays.
+
+    This is the same as `iter_primes`, but each sieved segment is returned as
+    a whole, so there is no per-prime Python overhead.
+
+    Parameters
+    ----------
+    start: int, optional
+        The smallest number to consider.
+    stop: int, optional
+        If given, stop before this number. Otherwise iterate forever.
+    chunk: int, optional
+        The number of odd numbers sieved at a time. Defaults to the tuned
+        segment size.
+    usecython: bool, optional
+        Use the compiled sieve.
+
+    Yields
+    ------
+    primes: `numpy.ndarray`
+        The prime numbers found in the next segment, as 64-bit integers.
+        Segments without any primes are skipped.
+    """
+    import numpy as np
+
+    if stop is not None and stop <= start:
+        return
+    if chunk is None:
+        chunk = _settings()['segment_size']
+    if usecython:
+        from .example_c import sieve
+        options = _compiled_options()
+        lo = start
+        while stop is None or lo < stop:
+            hi = lo + 2 * chunk if stop is None else min(lo + 2 * chunk, stop)
+            found = sieve(lo, hi, **options)
+            if found.size:
+                yield found
+            lo = hi
+        return
+    head = [2] if start <= 2 and (stop is None or stop > 2) else []
+    for lo, segment in _iter_flags(start, stop, chunk):
+        found = np.flatnonzero(np.frombuffer(segment, dtype=np.uint8))
+        found *= 2
+        found += lo
+        if head:
+            found = np.concatenate([np.array(head, dtype=found.dtype), found])
+            head = []
+        if found.size:
+            yield found
+    if head:
+        yield np.array(head, dtype=np.int64)
+
+
+def prime_count(x):
+    """
+    Returns the number of primes less than or equal to x, without listing
+    them.
+
+    The compiled engine uses the Meissel-Lehmer method, which takes roughly
+    O(x**(2/3)) time. The pure Python fallback uses a vectorized variant of
+    Legendre's formula that takes roughly O(x**(3/4)) time. In both cases,
+    memory use is sublinear in x.
+
+    Parameters
+    ----------
+    x: int
+        The upper bound, included in the count.
+
+    Returns
+    -------
+    count: int
+        The number of primes <= x.
+    """
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+    from .example_c import prime_count as cprime_count
+    return cprime_count(x)
+{%- else %}
+    return _legendre_prime_count(x)
+{%- endif %}
+
+
+def _legendre_prime_count(x):
+    """
+    Returns the number of primes <= x by tracking the count S(v) of numbers
+    in [2, v] that survive sieving, for every v of the form x // k.
+    """
+    import numpy as np
+
+    if x < 2:
+        return 0
+    r = isqrt(x)
+    # small[v] = S(v) for v <= r, and large[k] = S(x // k) for k <= r
+    small = np.arange(-1, r, dtype=np.int64)
+    large = np.zeros(r + 1, dtype=np.int64)
+    large[1:] = x // np.arange(1, r + 1, dtype=np.int64) - 1
+
+    for p in _small_primes(r + 1):
+        sp = small[p - 1]
+        p2 = p * p
+        # Large values first, since they read the small ones
+        kmax = min(r, x // p2)
+        kp = np.arange(p, kmax * p + 1, p, dtype=np.int64)
+        inside = kp <= r
+        values = np.empty(kmax, dtype=np.int64)
+        values[inside] = large[kp[inside]]
+        values[~inside] = small[x // kp[~inside]]
+        large[1:kmax + 1] -= values - sp
+        if p2 <= r:
+            v = np.arange(p2, r + 1, dtype=np.int64)
+            small[p2:] -= small[v // p] - sp
+
+    return int(large[1])
+
+
+def is_prime(values):
+    """
+    Tests whether each of the given integers is prime.
+
+    Small values are looked up in a sieved table, and larger ones are tested
+    with a Miller-Rabin test using bases that make it deterministic for any
+    64-bit integer.
+
+    Parameters
+    ----------
+    values: array_like
+        An integer or an array of integers, with at most 64 bits.
+
+    Returns
+    -------
+    result: `numpy.ndarray`
+        A boolean array with the same shape as ``values``.
+    """
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+    from .example_c import is_prime as cis_prime
+    return cis_prime(values)
+{%- else %}
+    return _is_prime_python(values)
+{%- endif %}
+
+
+# Testing these bases is enough to make Miller-Rabin deterministic for any
+# 64-bit integer.
+_MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+_SMALL_LIMIT = 2 ** 16
+
+
+def _miller_rabin(n):
+    for p in _MR_BASES:
+        if n % p == 0:
+            return n == p
+    d = n - 1
+    s = 0
+    while not d & 1:
+        d >>= 1
+        s += 1
+    for a in _MR_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _is_prime_python(values):
+    import numpy as np
+
+    values = np.asarray(values)
+    if not values.size:
+        # An empty list is converted to floats
+        values = values.astype(np.int64)
+    if values.dtype.kind not in 'iu':
+        raise TypeError("is_prime expects integer values")
+
+    result = np.zeros(values.shape, dtype=bool)
+    small = (values >= 0) & (values < _SMALL_LIMIT)
+    flags = np.zeros(_SMALL_LIMIT, dtype=bool)
+    flags[_small_primes(_SMALL_LIMIT)] = True
+    result[small] = flags[values[small]]
+    large = values >= _SMALL_LIMIT
+    result[large] = [_miller_rabin(int(n)) for n in values[large]]
+    return result
+
+
+def smallest_prime_factors(limit):
+    """
+    Returns the table of the smallest prime factor of every integer below
+    ``limit``.
+
+    Parameters
+    ----------
+    limit: int
+        The size of the table. This should be less than 2**32.
+
+    Returns
+    -------
+    spf: `numpy.ndarray`
+        A 32-bit unsigned integer array, in which ``spf[n]`` is the smallest
+        prime factor of ``n`` for ``n >= 2``, and ``spf[0] = spf[1] = 0``.
+    """
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+    from .example_c import smallest_prime_factors as csmallest_prime_factors
+    return csmallest_prime_factors(limit)
+{%- else %}
+    return _smallest_prime_factors_python(limit)
+{%- endif %}
+
+
+def factorize(values, limit=2 ** 22):
+    """
+    Factorizes each of the given integers.
+
+    Values below ``limit`` are factored with a table of smallest prime
+    factors, and larger ones with Pollard's rho algorithm. The result is
+    returned in compressed sparse row form rather than as nested lists.
+
+    Parameters
+    ----------
+    values: array_like
+        An array of non-negative integers, with at most 64 bits.
+    limit: int, optional
+        The size of the smallest prime factor table.
+
+    Returns
+    -------
+    offsets: `numpy.ndarray`
+        An array of ``len(values) + 1`` offsets, such that the factors of
+        ``values[i]`` are ``factors[offsets[i]:offsets[i + 1]]``.
+    factors: `numpy.ndarray`
+        The distinct prime factors of every value in increasing order, as
+        64-bit unsigned integers.
+    exponents: `numpy.ndarray`
+        The multiplicity of each of the factors, as 8-bit unsigned integers.
+    """
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+    from .example_c import factorize as cfactorize
+    return cfactorize(values, limit)
+{%- else %}
+    return _factorize_python(values, limit)
+{%- endif %}
+
+
+def _smallest_prime_factors_python(limit):
+    import numpy as np
+
+    if limit > 2 ** 32:
+        raise ValueError("limit should be <= 2**32")
+    spf = np.zeros(max(limit, 0), dtype=np.uint32)
+    # Going through the primes in decreasing order leaves the smallest
+    # prime factor as the last value written for every composite.
+    for p in reversed(_small_primes(isqrt(max(limit - 1, 0)) + 1)):
+        spf[p * p::p] = p
+    unset = np.flatnonzero(spf == 0)
+    spf[unset] = unset
+    spf[:2] = 0
+    return spf
+
+
+def _pollard_brent(n):
+    """
+    Returns a non-trivial factor of the odd composite ``n``.
+    """
+    from math import gcd
+
+    for c in range(1, n):
+        y, r, q, g = 2, 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(128, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += 128
+            r *= 2
+        if g == n:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+        if g != n:
+            return g
+
+
+def _prime_factors(n, spf):
+    """
+    Returns the prime factors of ``n`` with multiplicity, in no particular
+    order.
+    """
+    result = []
+    while n % 2 == 0 and n > 1:
+        result.append(2)
+        n //= 2
+    stack = [n] if n > 1 else []
+    while stack:
+        m = stack.pop()
+        if m < len(spf):
+            while m > 1:
+                result.append(int(spf[m]))
+                m //= int(spf[m])
+        elif _miller_rabin(m):
+            result.append(m)
+        else:
+            d = _pollard_brent(m)
+            stack += [d, m // d]
+    return result
+
+
+def _factorize_python(values, limit):
+    import numpy as np
+
+    values = np.asarray(values)
+    if not values.size:
+        # An empty list is converted to floats
+        values = values.astype(np.int64)
+    if values.dtype.kind not in 'iu':
+        raise TypeError("factorize expects integer values")
+    if values.dtype.kind == 'i' and (values < 0).any():
+        raise ValueError("factorize expects non-negative values")
+    values = values.astype(np.uint64).ravel()
+    spf = _smallest_prime_factors_python(max(limit, 2))
+
+    # Peel off the smallest prime factor of all of the small values at once,
+    # recording (index, factor) pairs.
+    index = np.flatnonzero((values > 1) & (values < len(spf)))
+    remaining = values[index].astype(np.int64)
+    found_index, found_factor = [], []
+    while index.size:
+        factor = spf[remaining].astype(np.int64)
+        found_index.append(index)
+        found_factor.append(factor.astype(np.uint64))
+        remaining //= factor
+        keep = remaining > 1
+        index, remaining = index[keep], remaining[keep]
+
+    for i in np.flatnonzero(values >= len(spf)):
+        factors = _prime_factors(int(values[i]), spf)
+        found_index.append(np.full(len(factors), i))
+        found_factor.append(np.array(factors, dtype=np.uint64))
+
+    if found_index:
+        found_index = np.concatenate(found_index)
+        found_factor = np.concatenate(found_factor)
+    else:
+        found_index = np.empty(0, dtype=np.int64)
+        found_factor = np.empty(0, dtype=np.uint64)
+
+    # Group equal (index, factor) pairs into exponents
+    order = np.lexsort((found_factor, found_index))
+    found_index, found_factor = found_index[order], found_factor[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ((found_index[1:] != found_index[:-1])
+                 | (found_factor[1:] != found_factor[:-1]))
+    starts = np.flatnonzero(first)
+    exponents = np.diff(np.append(starts, len(order))).astype(np.uint8)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(found_index[starts], minlength=len(values)), out=offsets[1:])
+    return offsets, found_factor[starts], exponents
+
+
+class PrimeCache:
+    """
+    An in-process cache of the first primes, grown as larger requests come in.
+
+    The cached primes are kept as consecutive sieve segments starting at 2.
+    A request for fewer primes than are cached is served by slicing the
+    segments, and a larger request only sieves the segments past the end of
+    the table. When the cached segments use more than ``max_bytes``, the
+    least recently used ones are evicted; only their bounds are kept, so they
+    are sieved again if they are needed later.
+
+    Parameters
+    ----------
+    max_bytes: int, optional
+        The memory ceiling for the cached primes, in bytes.
+    segment_size: int, optional
+        The number of odd numbers covered by each cached segment.
+
+    Attributes
+    ----------
+    hits: int
+        The number of segments that were served from the cache.
+    misses: int
+        The number of segments that had to be sieved.
+    evictions: int
+        The number of segments that were evicted.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, segment_size=SEGMENT_SIZE):
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Drops all of the cached segments and resets the statistics.
+        """
+        self._bounds = []
+        self._segments = OrderedDict()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def stats(self):
+        """
+        A dictionary with the hit, miss and eviction counts and the memory
+        used by the cached segments.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'nbytes': self.nbytes,
+                'segments': len(self._segments)}
+
+    def _segment(self, index):
+        stats = current_stats()
+        segment = self._segments.get(index)
+        if segment is not None:
+            self.hits += 1
+            if stats is not None:
+                stats.cache_hits += 1
+            self._segments.move_to_end(index)
+            return segment
+
+        self.misses += 1
+        if stats is not None:
+            stats.cache_misses += 1
+        if index == len(self._bounds):
+            lo = self._bounds[-1][1] if self._bounds else 2
+            self._bounds.append((lo, (lo | 1) + 2 * self.segment_size))
+        lo, hi = self._bounds[index]
+        segment = array('q', chain.from_iterable(_iter_segments(lo, hi)))
+
+        self._segments[index] = segment
+        self.nbytes += segment.itemsize * len(segment)
+        while self.nbytes > self.max_bytes and len(self._segments) > 1:
+            _, evicted = self._segments.popitem(last=False)
+            self.nbytes -= evicted.itemsize * len(evicted)
+            self.evictions += 1
+        return segment
+
+    def primes(self, imax):
+        """
+        Returns the first ``imax`` prime numbers.
+
+        Parameters
+        ----------
+        imax: int
+            The number of primes to return.
+
+        Returns
+        -------
+        result: list
+            The list of prime numbers.
+        """
+        result = []
+        index = 0
+        with self._lock:
+            while len(result) < imax:
+                segment = self._segment(index)
+                result.extend(segment[:imax - len(result)])
+                index += 1
+        return result
+
+
+# The cache used by do_primes(..., cache=True)
+prime_cache = PrimeCache()
+
+
+def primes_in_range(lo, hi):
+    """
+    Returns the prime numbers in the range ``[lo, hi)``.
+
+    Only the window itself is sieved, using the base primes up to
+    ``sqrt(hi)``, so the cost is O(sqrt(hi) + (hi - lo)) however large
+    ``lo`` is.
+
+    Parameters
+    ----------
+    lo, hi: int
+        The bounds of the half-open range.
 
     Returns
     -------
     result: list
         The list of prime numbers.
     """
+{%- if cookiecutter.use_compiled_extensions == 'y' %}
+    return _sieve_range(lo, hi, usecython=True, num_threads=0).tolist()
+{%- else %}
+    return _sieve_range(lo, hi)
+{%- endif %}
+
+
+def nth_prime(n):
+    """
+    Returns the n-th prime number, counting from ``nth_prime(1) = 2``.
+
+    An analytic estimate of the n-th prime is corrected with `prime_count`,
+    and only the window between the estimate and the answer is sieved.
+
+    Parameters
+    ----------
+    n: int
+        The index of the prime to return.
+
+    Returns
+    -------
+    prime: int
+        The n-th prime number.
+    """
+    if n < 1:
+        raise ValueError("n should be >= 1")
+    if n < 6:
+        return (2, 3, 5, 7, 11)[n - 1]
+
+    logn = log(n)
+    loglogn = log(logn)
+    # Cipolla's asymptotic expansion, which is within a fraction of a percent
+    # of the answer for large n.
+    x = int(n * (logn + loglogn - 1 + (loglogn - 2) / logn))
+    count = prime_count(x)
+    window = max(2 ** 16, isqrt(x))
+
+    # Walk windows forwards or backwards from x until the n-th prime is in
+    # one of them.
+    if count < n:
+        lo = x + 1
+        while True:
+            found = primes_in_range(lo, lo + window)
+            if count + len(found) >= n:
+                return found[n - count - 1]
+            count += len(found)
+            lo += window
+    else:
+        hi = x + 1
+        while True:
+            found = primes_in_range(max(hi - window, 2), hi)
+            if count - len(found) < n:
+                return found[n - count - 1]
+            count -= len(found)
+            hi -= window
+
+
+def _sieve_range(lo, hi, usecython=False, num_threads=1, max_memory=None):
+    """
+    Returns the primes in ``[lo, hi)``, using at most ``max_memory`` bytes.
+    This is the unit of work that is sent to worker processes by `do_primes`.
+    """
+    reserved = _BYTES_PER_PRIME['cython' if usecython else 'python'] * \
+        _prime_count_upper_bound(lo, hi)
+    _check_memory(reserved, max_memory)
+    if usecython:
+        from .example_c import sieve
+        return sieve(lo, hi, num_threads=num_threads,
+                     **_compiled_options(reserved, max_memory, num_threads))
+    segment_size, max_size = _python_segments(hi, reserved, max_memory)
+    return list(chain.from_iterable(_iter_segments(lo, hi, segment_size, max_size)))
+
+
+# Worker pools are expensive to start, so they are kept around and reused
+# by later calls, keyed by the number of workers and the kind of pool.
+_executors = {}
+
+
+def _get_executor(workers, threads=False):
+    executor = _executors.get((workers, threads))
+    if executor is None:
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        pool = ThreadPoolExecutor if threads else ProcessPoolExecutor
+        executor = _executors[workers, threads] = pool(max_workers=workers)
+        if not threads:
+            # The parallel engine is only calibrated once its pool is running
+            with _backends_lock:
+                _calibration.clear()
+    return executor
+
+
+_cpus = None
+
+
+def _available_cpus():
+    """
+    Returns the number of CPUs this process can run on, capped by the CPU
+    quota of its cgroup.
+    """
+    global _cpus
+    if _cpus is None:
+        try:
+            cpus = len(os.sched_getaffinity(0))
+        except AttributeError:  # not available on macOS and Windows
+            cpus = os.cpu_count() or 1
+        from .example_subpkg.tuning import cpu_limit
+        limit = cpu_limit()
+        if limit is not None:
+            cpus = min(cpus, max(1, ceil(limit)))
+        _cpus = cpus
+    return _cpus
+
+
+def _parallel_primes(lo, hi, workers, usecython=False, imax=None, max_memory=None):
+    """
+    Returns the primes in ``[lo, hi)``, or only the first ``imax`` of them,
+    sieving independent ranges on a pool of ``workers`` processes and merging
+    the partial results in order.
+
+    The result is counted against ``max_memory`` in this process, and what
+    is left of it is divided evenly between the workers.
+    """
+    if hi <= lo or imax is not None and imax <= 0:
+        return []
+
+    # A few tasks per worker evens out the load, but each task should still
+    # cover at least a couple of sieve segments.
+    ntasks = max(1, min(4 * workers, (hi - lo) // (4 * SEGMENT_SIZE)))
+    task_memory = None
+    if max_memory is not None:
+        count = _prime_count_upper_bound(lo, hi)
+        reserved = _BYTES_PER_PRIME['parallel'] * (count if imax is None else min(imax, count))
+        task_memory = (max_memory - reserved) // workers
+        # Smaller tasks, until the primes of the densest one take at most
+        # half of the budget of a worker
+        per_prime = _BYTES_PER_PRIME['cython' if usecython else 'python']
+        while (2 * per_prime * _prime_count_upper_bound(lo, lo + (hi - lo) // ntasks)
+               > task_memory and ntasks < (hi - lo) // 2 ** 10):
+            ntasks *= 2
+        _check_memory(reserved + 2 * workers * per_prime *
+                      _prime_count_upper_bound(lo, lo + (hi - lo) // ntasks), max_memory)
+    bounds = [lo + (hi - lo) * i // ntasks for i in range(ntasks + 1)]
+
+    executor = _get_executor(workers)
+    parts = executor.map(_sieve_range, bounds[:-1], bounds[1:], [usecython] * ntasks,
+                         [1] * ntasks, [task_memory] * ntasks)
 
-    p = list(range(10000))
     result = []
-    k = 0
-    n = 2
-
-    if imax > 10000:
-        raise ValueError("imax should be <= 10000")
-
-    while len(result) < imax:
-        i = 0
-        while i < k and n % p[i] != 0:
-            i = i + 1
-        if i == k:
-            p[k] = n
-            k = k + 1
-            result.append(n)
-            if k > 10000:
-                break
-        n = n + 1
+    for part in parts:
+        result.extend(part.tolist() if usecython else part)
+        if imax is not None and len(result) >= imax:
+            del result[imax:]
+            break
+    return result
+
+
+def _sieve_chunk(lo, hi, usecython=False):
+    """
+    Returns the primes in ``[lo, hi)`` as a NumPy array. This is the unit of
+    work of `aiter_prime_chunks`.
+    """
+    if usecython:
+        from .example_c import sieve
+        return sieve(lo, hi, num_threads=1)
+    import numpy as np
+    return np.concatenate([np.empty(0, dtype=np.int64)]
+                          + list(iter_prime_chunks(lo, hi)))
+
+
+async def aiter_prime_chunks(start=2, stop=None, chunk=SEGMENT_SIZE,
+                             usecython=False, workers=None, max_pending=None):
+    """
+    Asynchronously iterates over the prime numbers in ``[start, stop)`` in
+    NumPy arrays.
+
+    The sieving runs in an executor so that the event loop stays responsive:
+    the compiled kernel releases the GIL and runs on a thread pool, while the
+    pure-Python sieve runs on a process pool. Chunks are submitted ahead of
+    the consumer, but at most ``max_pending`` of them are in flight at once,
+    so a slow consumer does not cause unbounded memory use. Closing the
+    iterator, or cancelling the task consuming it, cancels the chunks that
+    have not been started yet.
+
+    Parameters
+    ----------
+    start: int, optional
+        The smallest number to consider.
+    stop: int, optional
+        If given, stop before this number. Otherwise iterate forever.
+    chunk: int, optional
+        The number of odd numbers sieved by each unit of work.
+    usecython: bool, optional
+        Use the compiled sieve.
+    workers: int, optional
+        The number of threads or processes to use. Defaults to the number of
+        CPUs.
+    max_pending: int, optional
+        The maximum number of chunks in flight. Defaults to twice the number
+        of workers.
+
+    Yields
+    ------
+    primes: `numpy.ndarray`
+        The prime numbers found in the next chunk, as 64-bit integers.
+        Chunks without any primes are skipped.
+    """
+    import asyncio
+    from collections import deque
+
+    if not workers:
+        workers = _available_cpus()
+    if max_pending is None:
+        max_pending = 2 * workers
+    executor = _get_executor(workers, threads=usecython)
+    loop = asyncio.get_running_loop()
+
+    def bounds():
+        lo = start
+        while stop is None or lo < stop:
+            hi = lo + 2 * chunk if stop is None else min(lo + 2 * chunk, stop)
+            yield lo, hi
+            lo = hi
 
+    ranges = bounds()
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < max_pending:
+                bound = next(ranges, None)
+                if bound is None:
+                    break
+                pending.append(loop.run_in_executor(executor, _sieve_chunk,
+                                                    *bound, usecython))
+            if not pending:
+                return
+            found = await pending.popleft()
+            if len(found):
+                yield found
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def aprimes(n, usecython=False, workers=None, start=None, max_pending=None):
+    """
+    Returns the first ``n`` prime numbers, or the primes in ``[start, n)`` if
+    ``start`` is given, without blocking the event loop.
+
+    This is the asynchronous version of `do_primes`; see
+    `aiter_prime_chunks` for how the work is scheduled.
+
+    Parameters
+    ----------
+    n: int
+        The number of primes to return, or the end of the range if ``start``
+        is given.
+    usecython: bool, optional
+        Use the compiled sieve.
+    workers: int, optional
+        The number of threads or processes to use.
+    start: int, optional
+        If given, return the primes in ``[start, n)`` instead, sieving only
+        that range.
+    max_pending: int, optional
+        The maximum number of chunks in flight.
+
+    Returns
+    -------
+    result: list
+        The prime numbers found.
+    """
+    if start is not None:
+        lo, stop, n = start, n, None
+    elif n <= 0:
+        return []
+    else:
+        # The first n primes are all below a known bound, so no chunk beyond
+        # it is ever submitted.
+        lo, stop = 2, _nth_prime_upper_bound(n) + 1
+    if stop <= lo:
+        return []
+    chunks = aiter_prime_chunks(lo, stop, usecython=usecython, workers=workers,
+                                max_pending=max_pending)
+    result = []
+    try:
+        async for found in chunks:
+            if n is None:
+                result.extend(found.tolist())
+                continue
+            result.extend(found[:n - len(result)].tolist())
+            if len(result) == n:
+                break
+    finally:
+        await chunks.aclose()
     return result
 
 
-def do_primes(n, usecython=False):
+class Backend:
+    """
+    An engine that `do_primes` can use to find the first ``n`` primes.
+
+    Parameters
+    ----------
+    name: str
+        The name used to select the engine.
+    primes: callable
+        Called as ``primes(n, workers, max_memory)`` to return the list of
+        the first ``n`` primes. ``workers`` is the number of workers
+        requested, or `None`, and can be ignored by engines that don't run in
+        parallel. ``max_memory`` is the memory budget of the call in bytes,
+        or `None`, which the engine should stay within, counting its workers.
+    probe: callable, optional
+        Called without arguments to check whether the engine can run here,
+        for instance whether an optional dependency is installed. It is only
+        called once, and the engine is unavailable if it returns `False` or
+        raises an exception.
+    speedup: float or callable, optional
+        How much faster the engine runs on large inputs than on the small
+        ones used by `calibrate_backends`, for instance because it spreads
+        the work over several cores. A callable is called without arguments
+        to measure it each time the engine is calibrated.
+    ready: callable, optional
+        Called without arguments to check whether the engine can be timed by
+        `calibrate_backends`. Engines with an expensive start-up, like a
+        worker pool, use it to stay out of the choice of ``'auto'`` until
+        they have been started by an explicit request.
+    """
+
+    def __init__(self, name, primes, probe=None, speedup=1, ready=None):
+        self.name = name
+        self.primes = primes
+        self.probe = probe
+        self.speedup = speedup
+        self.ready = ready
+        self._available = None
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__, self.name)
+
+    @property
+    def available(self):
+        """
+        Whether the engine can run here, as determined by its probe.
+        """
+        if self._available is None:
+            try:
+                self._available = self.probe is None or self.probe() is not False
+            except Exception:
+                self._available = False
+        return self._available
+
+
+_backends = OrderedDict()
+_backends_lock = threading.Lock()
+
+# The cost model of each available engine, fitted by calibrate_backends, as
+# (overhead in seconds, seconds per prime) pairs, and the speedup of each
+# engine on large inputs.
+_calibration = {}
+_speedups = {}
+
+
+def register_backend(backend, replace=False):
+    """
+    Makes an engine available to `do_primes`.
+
+    Parameters
+    ----------
+    backend: `Backend`
+        The engine to register.
+    replace: bool, optional
+        Whether to replace an engine already registered under the same name.
+    """
+    with _backends_lock:
+        if backend.name in _backends and not replace:
+            raise ValueError("a backend named {0!r} is already registered".format(
+                backend.name))
+        _backends[backend.name] = backend
+        # The new engine is only considered by 'auto' once it is calibrated
+        _calibration.clear()
+
+
+def unregister_backend(name):
+    """
+    Removes an engine registered with `register_backend`, along with its
+    calibration.
+
+    Parameters
+    ----------
+    name: str
+        The name of the engine to remove.
+    """
+    with _backends_lock:
+        if name not in _backends:
+            raise ValueError("no backend named {0!r} is registered".format(name))
+        del _backends[name]
+        _calibration.pop(name, None)
+        _speedups.pop(name, None)
+
+
+def available_backends():
+    """
+    Returns the names of the registered engines that can run here.
+    """
+    return [name for name, backend in _backends.items() if backend.available]
+
+
+def calibrate_backends(sizes=(2 ** 10, 2 ** 15), repeat=3):
+    """
+    Times each available engine on small inputs, to fit the cost model used
+    by `choose_backend`.
+
+    The engines are timed on two sizes, and a fixed overhead plus a cost per
+    prime is fitted to the fastest of ``repeat`` runs on each. This is done
+    automatically the first time `choose_backend` is used. Engines that are
+    not ready, like the parallel one before its worker pool is started, are
+    left out, so that calibrating never starts a worker pool.
+
+    Returns
+    -------
+    calibration: dict
+        The fitted ``(overhead, seconds per prime)`` of each engine.
+    """
+    small, large = sizes
+    calibration = {}
+    speedups = {}
+    for name in available_backends():
+        backend = _backends[name]
+        if backend.ready is not None and not backend.ready():
+            continue
+        # The first call may import modules
+        backend.primes(small, None, None)
+        times = []
+        for n in sizes:
+            best = float('inf')
+            for _ in range(repeat):
+                started = perf_counter()
+                backend.primes(n, None, None)
+                best = min(best, perf_counter() - started)
+            times.append(best)
+        per_prime = max(0., (times[1] - times[0]) / (large - small))
+        calibration[name] = (max(0., times[0] - per_prime * small), per_prime)
+        speedups[name] = backend.speedup() if callable(backend.speedup) else backend.speedup
+    with _backends_lock:
+        _calibration.clear()
+        _calibration.update(calibration)
+        _speedups.clear()
+        _speedups.update(speedups)
+    return dict(calibration)
+
+
+def choose_backend(n):
+    """
+    Returns the name of the engine expected to find the first ``n`` primes
+    the fastest, calibrating the engines first if needed.
+    """
+    if not _calibration:
+        calibrate_backends()
+
+    def cost(name):
+        overhead, per_prime = _calibration[name]
+        return overhead + per_prime * n / _speedups[name]
+
+    return min(_calibration, key=cost)
+
+
+def _resolve_backend(name, n):
+    # Unavailable engines silently fall back to pure Python
+    if name == 'auto':
+        name = choose_backend(n)
+    if name not in _backends:
+        raise ValueError("unknown backend {0!r}, expected 'auto' or one of {1}".format(
+            name, ', '.join(_backends)))
+    backend = _backends[name]
+    return backend if backend.available else _backends['python']
+
+
+def _python_backend(n, workers, max_memory):
+    return primes(n, max_memory=max_memory)
+
+
+def _cython_backend(n, workers, max_memory):
+    from .example_c import primes as cprimes
+    options = _compiled_options(_BYTES_PER_PRIME['cython'] * n, max_memory, workers or 0)
+    return cprimes(n, num_threads=workers or 0, **options)
+
+
+def _numpy_backend(n, workers, max_memory):
+    # Bytearray sieve segments with the primes extracted by NumPy
+    if n <= 0:
+        return []
+    stop = _nth_prime_upper_bound(n) + 1
+    segment_size, _ = _python_segments(stop, _BYTES_PER_PRIME['numpy'] * n, max_memory)
+    found = []
+    count = 0
+    for chunk in iter_prime_chunks(2, stop, chunk=segment_size):
+        found.append(chunk)
+        count += len(chunk)
+        if count >= n:
+            break
+    import numpy as np
+    return np.concatenate(found)[:n].tolist()
+
+
+def _parallel_backend(n, workers, max_memory):
+    workers = workers or _available_cpus()
+    stop = _nth_prime_upper_bound(n) + 1 if n > 0 else 2
+    return _parallel_primes(2, stop, workers, _backends['cython'].available, imax=n,
+                            max_memory=max_memory)
+
+
+def _probe_cython():
+    from . import example_c  # noqa: F401
+
+
+def _probe_numpy():
+    import numpy  # noqa: F401
+
+
+def _probe_parallel():
+    # Worker processes need a working multiprocessing module
+    import _multiprocessing  # noqa: F401
+
+
+def _parallel_ready():
+    # The pool used by the parallel engine when no number of workers is given
+    return (_available_cpus(), False) in _executors
+
+
+def _parallel_speedup(repeat=3):
+    """
+    Measures how much faster a large range is sieved on all the available
+    CPUs than on one.
+
+    This times the threads of the compiled sieve, which scale across cores
+    like the worker processes of the parallel engine but need no pool to be
+    started. Without the compiled extension, the number of available CPUs
+    is used as is.
+    """
+    cpus = _available_cpus()
+    if cpus == 1 or not _backends['cython'].available:
+        return cpus
+    from .example_c import sieve
+
+    def best(num_threads):
+        times = []
+        for _ in range(repeat):
+            started = perf_counter()
+            sieve(10 ** 9, 10 ** 9 + 2 ** 25, num_threads=num_threads)
+            times.append(perf_counter() - started)
+        return min(times)
+
+    return min(max(best(1) / best(cpus), 1.), cpus)
+
+
+register_backend(Backend('python', _python_backend))
+register_backend(Backend('cython', _cython_backend, probe=_probe_cython))
+register_backend(Backend('numpy', _numpy_backend, probe=_probe_numpy))
+register_backend(Backend('parallel', _parallel_backend, probe=_probe_parallel,
+                         speedup=_parallel_speedup, ready=_parallel_ready))
+
+
+def do_primes(n, usecython=False, workers=None, cache=False, start=None,
+              nth=False, verbose=True, as_set=False, profile=False, backend=None,
+              max_memory=None, persistent=False):
+    """
+    Returns the first ``n`` prime numbers using the requested engine.
+
+    Parameters
+    ----------
+    n: int
+        The number of primes to return, or the end of the range if ``start``
+        is given.
+    usecython: bool, optional
+        Whether to use the compiled kernel instead of pure Python.
+    workers: int, optional
+        If larger than one, split the work across this many processes. The
+        process pool is started on first use and reused by later calls.
+    cache: bool, optional
+        Whether to serve the pure Python engine's results from
+        `prime_cache`, which keeps the primes computed by earlier calls.
+
+        If neither ``cache`` nor ``backend`` is given and this process is
+        attached to a shared prime table (see
+        `~{{ cookiecutter.module_name }}.example_subpkg.shared_table.attach`),
+        the first ``n`` primes are returned as a read-only view of that
+        table instead.
+    start: int, optional
+        If given, return the primes in ``[start, n)`` instead, sieving only
+        that range.
+    nth: bool, optional
+        If `True`, return only the n-th prime, as found by `nth_prime`.
+    verbose: bool, optional
+        Whether to print which engine is used.
+    as_set: bool, optional
+        Return a `~{{ cookiecutter.module_name }}.example_subpkg.prime_set.PrimeSet`
+        instead of a list. The set is always built in this process, so
+        ``workers`` and ``cache`` are ignored.
+    profile: bool, optional
+        Also return statistics on the work done, as collected by
+        `~{{ cookiecutter.module_name }}.example_subpkg.instrumentation.profile`.
+    backend: str, optional
+        The name of a registered `Backend` to find the primes with, or
+        ``'auto'`` to pick the one expected to be the fastest for ``n``. An
+        engine that is not available here, like ``'cython'`` when the
+        compiled extension is missing, silently falls back to ``'python'``.
+        For the ``start``, ``nth``, ``cache`` and ``as_set`` modes, this only
+        selects whether the compiled sieve is used.
+    max_memory: int, optional
+        The memory budget of the call in bytes, including the result.
+        Defaults to the budget set by
+        `~{{ cookiecutter.module_name }}.example_subpkg.tuning.autotune`, if
+        any. The sieve segments of every engine are shrunk to fit in it if
+        needed. With several workers, the result is counted in this process
+        and what is left of the budget is divided between the workers.
+    persistent: bool, optional
+        Return the first ``n`` primes as a read-only view of the on-disk
+        `~{{ cookiecutter.module_name }}.example_subpkg.prime_table.PrimeTable`
+        in the cache directory instead, extending it if needed. Other
+        processes, and later sessions, read the primes from the table
+        instead of sieving them again. Like ``cache``, this is ignored in the
+        ``start``, ``nth`` and ``as_set`` modes.
+
+    Returns
+    -------
+    result: list or `~{{ cookiecutter.module_name }}.example_subpkg.prime_set.PrimeSet`
+        The prime numbers.
+    stats: `~{{ cookiecutter.module_name }}.example_subpkg.instrumentation.EngineStats`
+        Only returned if ``profile`` is `True`.
+
+    Raises
+    ------
+    MemoryError
+        If the result is expected to take more than ``max_memory``, before
+        any work is done.
+    """
+    if profile:
+        with _profile() as stats, stats.phase('total'):
+            result = do_primes(n, usecython=usecython, workers=workers, cache=cache,
+                               start=start, nth=nth, verbose=verbose, as_set=as_set,
+                               backend=backend, max_memory=max_memory,
+                               persistent=persistent)
+        return result, stats
+
+    if backend is not None:
+        backend = _resolve_backend(backend, n)
+        usecython = backend.name == 'cython'
+    # Without the compiled extension, fall back to pure Python
+    usecython = usecython and _backends['cython'].available
+
+    if verbose:
+        if backend is not None:
+            print('Using the {0} backend'.format(backend.name))
+        elif usecython:
+            print('Using cython-based primes')
+        else:
+            print('Using pure python primes')
+
+    parallel = workers is not None and workers > 1
+    if as_set:
+        if nth:
+            raise ValueError("as_set cannot be combined with nth")
+        from .example_subpkg.prime_set import PrimeSet
+        if start is None:
+            start, n = 2, nth_prime(n) + 1 if n > 0 else 2
+        _check_memory(_prime_set_bytes(start, n), _memory_budget(max_memory))
+        return PrimeSet.from_range(start, n, usecython=usecython)
+    if nth:
+        return [nth_prime(n)]
+    max_memory = _memory_budget(max_memory)
+    engine = 'parallel' if parallel else 'cython' if usecython else 'python'
+    if start is not None:
+        reserved = _BYTES_PER_PRIME[engine] * _prime_count_upper_bound(start, n)
+        _check_memory(reserved, max_memory)
+        if parallel:
+            return _parallel_primes(start, n, workers, usecython, max_memory=max_memory)
+        if usecython:
+            from .example_c import sieve
+            options = _compiled_options(reserved, max_memory)
+            return sieve(start, n, **options).tolist()
+        segment_size, max_size = _python_segments(n, reserved, max_memory)
+        return list(chain.from_iterable(_iter_segments(start, n, segment_size, max_size)))
+    if cache and not usecython:
+        # The cache keeps the 64-bit primes it holds on top of the result
+        _check_memory((_LIST_BYTES + 8) * n, max_memory)
+        return prime_cache.primes(n)
+    if persistent:
+        return _persistent_table().primes(n)
+    if backend is not None:
+        _check_memory(_BYTES_PER_PRIME.get(backend.name, _LIST_BYTES) * n, max_memory)
+        return backend.primes(n, workers, max_memory)
+    table = _attached_table()
+    if table is not None:
+        return table.primes(n)
+    if parallel:
+        _check_memory(_BYTES_PER_PRIME[engine] * n, max_memory)
+        stop = _nth_prime_upper_bound(n) + 1 if n > 0 else 2
+        return _parallel_primes(2, stop, workers, usecython, imax=n, max_memory=max_memory)
     if usecython:
-{% if cookiecutter.use_compiled_extensions != 'y' %}
-        raise Exception("This template does not have the example C code included.")
-{% else %}
         from .example_c import primes as cprimes
-        print('Using cython-based primes')
-        return cprimes(n)
-{% endif %}
-    else:
-        print('Using pure python primes')
-        return primes(n)
+        options = _compiled_options(_BYTES_PER_PRIME[engine] * n, max_memory)
+        return cprimes(n, **options)
+    return primes(n, max_memory=max_memory)
 
 
 def main(args=None):
 
-    from astropy.utils.compat import argparse
+    import argparse
     from time import time
 
-    parser = argparse.ArgumentParser(description='Process some integers.')
+    from .example_subpkg.tuning import parse_size
+
+    if args is None:
+        args = sys.argv[1:]
+    if args[:1] == ['serve']:
+        from .example_subpkg.prime_server import main as serve
+        return serve(args[1:])
+    if args[:1] == ['tune']:
+        from .example_subpkg.tuning import autotune, tuning_path
+        argparse.ArgumentParser(
+            prog='tune', description='Measure the best sieve settings for this '
+            'host and save them for later runs.').parse_args(args[1:])
+        settings = autotune()
+        for key, value in sorted(settings.items()):
+            print('{0}: {1}'.format(key, value))
+        print('Saved to {0}'.format(tuning_path()))
+        return
+
+    # The commands are dispatched by hand, since argparse cannot tell a
+    # subcommand from the N positional argument
+    parser = argparse.ArgumentParser(
+        description='Process some integers.',
+        epilog="commands: 'serve' answers prime number queries on a Unix socket, "
+               "and 'tune' saves the best sieve settings for this host. "
+               "Run them with --help for their options.")
     parser.add_argument('-c', '--use-cython', dest='cy', action='store_true',
                         help='Use the Cython-based Prime number generator.')
     parser.add_argument('-t', '--timing', dest='time', action='store_true',
                         help='Time the Fibonacci generator.')
     parser.add_argument('-p', '--print', dest='prnt', action='store_true',
                         help='Print all of the Prime numbers.')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of worker processes to sieve with.')
+    parser.add_argument('--backend', default=None,
+                        help="Engine to use: 'auto' or one of {0}.".format(
+                            ', '.join(_backends)))
+    parser.add_argument('-s', '--start', type=int, default=None,
+                        help='Get the Prime numbers from this number up to N '
+                             'instead, sieving only that range.')
+    parser.add_argument('--nth', action='store_true',
+                        help='Only get the N-th Prime number.')
+    parser.add_argument('-b', '--benchmark', action='store_true',
+                        help='Benchmark the engines instead: run them a few '
+                             'times each and report timing statistics.')
+    parser.add_argument('--backends', default=None,
+                        help='Comma-separated engines to benchmark, out of '
+                             '{0}. Defaults to all of the available ones.'.format(
+                                 ', '.join(_backends)))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed runs per engine when benchmarking.')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='Number of untimed runs per engine when benchmarking.')
+    parser.add_argument('--json', default=None,
+                        help='Also write the benchmark results to this JSON file.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the Prime numbers to this file instead, '
+                             'one segment at a time.')
+    parser.add_argument('-f', '--format', default='npy',
+                        choices=('npy', 'delta-varint', 'bitmap', 'text', 'fits', 'hdf5'),
+                        help='Format of the output file. The fits and hdf5 tables '
+                             'also hold the index of each prime and the gap to '
+                             'the previous one, and their export resumes where '
+                             'it stopped if it is interrupted.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Report counters and per-phase timings of the '
+                             'work done by the engine.')
+    parser.add_argument('--persistent', action='store_true',
+                        help='Read the Prime numbers from a table in the cache '
+                             'directory, that is extended as needed and shared '
+                             'with later runs.')
+    parser.add_argument('--max-memory', type=parse_size, default=None,
+                        help='Fail instead of using more than this much memory, '
+                             'in bytes, or with a K, M or G suffix. Output files '
+                             'are always written one segment at a time, so this '
+                             'cannot be combined with --output.')
     parser.add_argument('n', metavar='N', type=int,
                         help='Get Prime numbers up to this number.')
 
     res = parser.parse_args(args)
 
+    if res.benchmark:
+        from .example_subpkg.benchmark import format_results, run_benchmark
+        backends = res.backends.split(',') if res.backends else available_backends()
+        results = run_benchmark(res.n, backends, repeat=res.repeat,
+                                warmup=res.warmup, workers=res.workers,
+                                max_memory=res.max_memory)
+        print(format_results(results))
+        if res.json:
+            import json
+            with open(res.json, 'w') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if res.output:
+        if res.nth or res.persistent:
+            parser.error('--output cannot be combined with --nth or --persistent')
+        # The primes are streamed from the sieve in this process
+        if res.workers is not None or res.backend is not None:
+            parser.error('--output cannot be combined with --workers or --backend')
+        if res.max_memory is not None:
+            parser.error('--output cannot be combined with --max-memory')
+        from .example_subpkg.prime_io import write_primes
+        pre = time()
+        with _profile() as stats, stats.phase('total'):
+            if res.format in ('fits', 'hdf5'):
+                from .example_subpkg.prime_export import export_primes
+                start, stop = res.start, res.n
+                if start is None:
+                    start, stop = 2, nth_prime(res.n) + 1 if res.n > 0 else 2
+                count = export_primes(res.output, start, stop, res.format,
+                                      usecython=res.cy)
+            elif res.start is None:
+                chunks = iter_prime_chunks(2, _nth_prime_upper_bound(res.n) + 1,
+                                           usecython=res.cy)
+                count = write_primes(res.output, chunks, res.format, imax=res.n)
+            else:
+                chunks = iter_prime_chunks(res.start, res.n, usecython=res.cy)
+                count = write_primes(res.output, chunks, res.format)
+        post = time()
+        print('Wrote {0} prime numbers to {1}'.format(count, res.output))
+        if res.time:
+            print('Running time: {0} s'.format(post - pre))
+        if res.profile:
+            print(stats.format())
+        return
+
     pre = time()
-    primes = do_primes(res.n, res.cy)
+    primes = do_primes(res.n, res.cy, workers=res.workers, start=res.start,
+                       nth=res.nth, profile=res.profile, backend=res.backend,
+                       max_memory=res.max_memory, persistent=res.persistent)
     post = time()
+    if res.profile:
+        primes, stats = primes
 
     print('Found {0} prime numbers'.format(len(primes)))
     print('Largest prime: {0}'.format(primes[-1]))
@@ -80,5 +1716,8 @@ def main(args=None):
     if res.time:
         print('Running time: {0} s'.format(post - pre))
 
+    if res.profile:
+        print(stats.format())
+
     if res.prnt:
         print('Primes: {0}'.format(primes))
@@ -1,5 +1,17 @@
 """
 This is the docstring for the examplesubpkg package.  Normally you would
-have whatever.py files in this directory implementing some modules, but this
-is just an example sub-package, so it doesn't actually do anything.
+have whatever.py files in this directory implementing some modules. Here:
+
+* `~{{ cookiecutter.module_name }}.example_subpkg.prime_table` provides a
+  persistent prime table stored in the sub-package's ``data`` directory.
+* `~{{ cookiecutter.module_name }}.example_subpkg.prime_io` provides compact
+  file formats for long lists of primes.
+* `~{{ cookiecutter.module_name }}.example_subpkg.prime_export` exports ranges
+  of primes larger than memory to FITS or HDF5 tables.
+* `~{{ cookiecutter.module_name }}.example_subpkg.shared_table` shares a prime
+  table between the processes on a host.
+* `~{{ cookiecutter.module_name }}.example_subpkg.prime_server` answers prime
+  number queries from other processes over a Unix socket.
+* `~{{ cookiecutter.module_name }}.example_subpkg.tuning` tunes the segment
+  sizes and memory budget of the engines to the host.
 """
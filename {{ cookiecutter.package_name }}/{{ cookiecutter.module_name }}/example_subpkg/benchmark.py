@@ -0,0 +1,168 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Repeatable timings of the prime number engines, as used by the
+``--benchmark`` option of the example console script.
+"""
+
+import math
+import sys
+import time
+
+__all__ = ['run_benchmark', 'format_results']
+
+
+def _maxrss(who):
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    maxrss = resource.getrusage(getattr(resource, who)).ru_maxrss
+    if not maxrss:
+        return None
+    # ru_maxrss is in kilobytes, except on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or `None`
+    if it can't be determined on this platform.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return _maxrss('RUSAGE_SELF')
+
+
+def _measure(conn, n, name, repeat, warmup, workers, max_memory):
+    # Runs in a fresh process for each engine, so that the peak RSS is that
+    # of the engine alone. The worker pools are shut down at the end so that
+    # the peak RSS of the largest worker is included in RUSAGE_CHILDREN.
+    try:
+        from ..example_mod import _executors, do_primes
+
+        for _ in range(warmup):
+            do_primes(n, verbose=False, backend=name, workers=workers,
+                      max_memory=max_memory)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            found = do_primes(n, verbose=False, backend=name, workers=workers,
+                              max_memory=max_memory)
+            times.append((time.perf_counter_ns() - start) / 1e9)
+        for executor in list(_executors.values()):
+            executor.shutdown()
+        conn.send((times, len(found), peak_rss(), _maxrss('RUSAGE_CHILDREN')))
+    except BaseException as exc:
+        conn.send(exc)
+    finally:
+        conn.close()
+
+
+def _run_isolated(n, name, repeat, warmup, workers, max_memory):
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure,
+                              args=(sender, n, name, repeat, warmup, workers,
+                                    max_memory))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        process.join()
+        result = RuntimeError("the benchmark of the {0} engine exited with code "
+                              "{1}".format(name, process.exitcode))
+    finally:
+        receiver.close()
+        process.join()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def run_benchmark(n, backends, repeat=5, warmup=1, workers=None, max_memory=None):
+    """
+    Times `~{{ cookiecutter.module_name }}.example_mod.do_primes` for each of
+    the given engines.
+
+    Each engine is run in a fresh process, ``warmup`` times untimed, then
+    ``repeat`` times timed with `time.perf_counter_ns`.
+
+    Parameters
+    ----------
+    n: int
+        The number of primes to generate.
+    backends: list of str
+        The names of the engines to time, out of
+        `~{{ cookiecutter.module_name }}.example_mod.available_backends`.
+    repeat: int, optional
+        The number of timed runs per engine.
+    warmup: int, optional
+        The number of untimed runs per engine.
+    workers: int, optional
+        The number of workers for the engines that run in parallel. Defaults
+        to the number of CPUs.
+    max_memory: int, optional
+        The memory budget of each run in bytes, as for
+        `~{{ cookiecutter.module_name }}.example_mod.do_primes`.
+
+    Returns
+    -------
+    results: list of dict
+        One dictionary per engine, with the minimum, median and 95th
+        percentile run time in seconds, the throughput in primes per second,
+        the peak RSS in bytes of the process running the engine, and that of
+        its largest worker process. The peak RSS values are `None` when they
+        can't be measured on this platform, or when the engine started no
+        worker processes.
+    """
+    from ..example_mod import _backends, available_backends
+
+    if repeat < 1:
+        raise ValueError("repeat should be >= 1")
+    unknown = set(backends) - set(_backends)
+    if unknown:
+        raise ValueError("unknown engines: {0}".format(', '.join(sorted(unknown))))
+    unavailable = set(backends) - set(available_backends())
+    if unavailable:
+        raise ValueError("unavailable engines: {0}".format(', '.join(sorted(unavailable))))
+
+    results = []
+    for name in backends:
+        times, count, rss, workers_rss = _run_isolated(n, name, repeat, warmup, workers,
+                                                       max_memory)
+        times.sort()
+        median = (times[(repeat - 1) // 2] + times[repeat // 2]) / 2
+        results.append({'backend': name, 'n': n, 'repeat': repeat,
+                        'min': times[0], 'median': median,
+                        'p95': times[math.ceil(0.95 * repeat) - 1],
+                        'primes_per_second': count / median if median else math.inf,
+                        'peak_rss': rss, 'peak_rss_workers': workers_rss})
+    return results
+
+
+def format_results(results):
+    """
+    Returns the results of `run_benchmark` as a plain text table.
+    """
+    def megabytes(size):
+        return '-' if size is None else '{0:.1f}'.format(size / 2 ** 20)
+
+    row = '{0:<10} {1:>12} {2:>12} {3:>12} {4:>14} {5:>10} {6:>15}'
+    lines = [row.format(
+        'backend', 'min [s]', 'median [s]', 'p95 [s]', 'primes/s', 'RSS [MB]',
+        'worker RSS [MB]')]
+    for result in results:
+        lines.append(row.format(
+            result['backend'], '{0:.6f}'.format(result['min']),
+            '{0:.6f}'.format(result['median']), '{0:.6f}'.format(result['p95']),
+            '{0:.4g}'.format(result['primes_per_second']), megabytes(result['peak_rss']),
+            megabytes(result['peak_rss_workers'])))
+    return '\n'.join(lines)
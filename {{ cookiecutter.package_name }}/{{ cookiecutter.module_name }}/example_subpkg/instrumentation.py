@@ -0,0 +1,129 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Optional instrumentation of the prime engines.
+
+Instrumentation is off unless a `profile` block is active, in which case
+the engines record what they do in the block's `EngineStats`. Outside of a
+block the engines only check once per segment that no stats are being
+collected. Work done in worker processes is not recorded.
+
+The compiled kernel only records its counters if it was built with the
+``EXAMPLE_STATS`` environment variable set to ``1``; otherwise the
+instrumentation is compiled out of it entirely.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+__all__ = ['EngineStats', 'profile', 'current_stats', 'stats_callbacks']
+
+_current = ContextVar('{{ cookiecutter.module_name }}_stats', default=None)
+
+# Functions called with the EngineStats of every profile block when it ends,
+# for instance to export them to a metrics system.
+stats_callbacks = []
+
+
+class EngineStats:
+    """
+    Counters and timings of the work done by the prime engines.
+
+    Attributes
+    ----------
+    segments: int
+        The number of sieve segments sieved.
+    marks: int
+        The number of composite numbers crossed off while sieving.
+    cache_hits: int
+        The number of segments served from the in-process cache.
+    cache_misses: int
+        The number of segments that were not in the cache.
+    bytes_allocated: int
+        The memory allocated for sieve segments and results, in bytes.
+    phases: dict
+        The wall time spent in each phase of the engines, in seconds.
+    """
+
+    __slots__ = ('segments', 'marks', 'cache_hits', 'cache_misses',
+                 'bytes_allocated', 'phases')
+
+    def __init__(self):
+        self.segments = 0
+        self.marks = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bytes_allocated = 0
+        self.phases = {}
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(type(self).__name__, self.as_dict())
+
+    def add_time(self, phase, seconds):
+        """
+        Adds to the time spent in a phase.
+        """
+        self.phases[phase] = self.phases.get(phase, 0.) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times the body of the context as part of the phase ``name``.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - start)
+
+    def as_dict(self):
+        """
+        Returns the statistics as a dictionary.
+        """
+        result = {name: getattr(self, name) for name in self.__slots__}
+        result['phases'] = dict(self.phases)
+        return result
+
+    def format(self):
+        """
+        Returns the statistics as a human-readable table.
+        """
+        lines = ['{0:<16}{1:>16}'.format(name.replace('_', ' '), getattr(self, name))
+                 for name in self.__slots__[:-1]]
+        lines += ['{0:<16}{1:>15.6f}s'.format(name, seconds)
+                  for name, seconds in self.phases.items()]
+        return '\n'.join(lines)
+
+
+def current_stats():
+    """
+    Returns the `EngineStats` of the active `profile` block, or `None`.
+    """
+    return _current.get()
+
+
+@contextmanager
+def profile(callback=None):
+    """
+    Collects statistics on the work done by the prime engines in the body of
+    the context.
+
+    Parameters
+    ----------
+    callback: callable, optional
+        Called with the `EngineStats` when the block ends, in addition to the
+        functions in `stats_callbacks`.
+
+    Yields
+    ------
+    stats: `EngineStats`
+        The statistics, which are filled in as the engines run.
+    """
+    stats = EngineStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        for function in stats_callbacks + ([callback] if callback else []):
+            function(stats)
@@ -0,0 +1,261 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Export of ranges of primes that do not fit in memory to tables on disk.
+
+The range is sieved one window at a time, and each window is appended to
+the table before the next one is sieved, so memory use only depends on the
+window size. Each row holds a prime, its index (so that the n-th prime is
+in the row with ``index == n``) and the gap to the previous prime.
+
+Two table formats are supported, both readable with `astropy.table.Table`:
+
+``fits``
+    A FITS binary table, which can be read with
+    ``Table.read(path, memmap=True)``.
+``hdf5``
+    An HDF5 dataset named ``primes``, which can be read with
+    ``Table.read(path, path='primes')``. This requires h5py.
+
+Long exports are resumable: after each window, the progress is saved to a
+checkpoint file next to the table, and running the same export again
+continues from the last checkpoint. The checkpoint is removed once the
+export completes.
+"""
+
+import json
+import os
+
+import numpy as np
+
+__all__ = ['FORMATS', 'export_primes', 'detect_format']
+
+FORMATS = ('fits', 'hdf5')
+
+_EXTENSIONS = {'.fits': 'fits', '.fit': 'fits', '.fts': 'fits',
+               '.h5': 'hdf5', '.hdf5': 'hdf5', '.he5': 'hdf5'}
+
+# The names and types of the columns. The gaps between primes below 2**64
+# are at most 1550, so 32 bits is plenty for them.
+COLUMNS = [('index', 'i8'), ('prime', 'i8'), ('gap', 'i4')]
+
+FITS_BLOCK = 2880
+
+
+def detect_format(path):
+    """
+    Returns the table format matching the extension of ``path``.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError('cannot tell the format of {0}, expected one of the '
+                         'extensions {1}'.format(path, ', '.join(_EXTENSIONS)))
+    return _EXTENSIONS[extension]
+
+
+def _previous_prime(n):
+    """
+    Returns the largest prime below ``n``, or 0 if there is none.
+    """
+    from ..example_mod import primes_in_range
+
+    hi = n
+    while hi > 2:
+        lo = max(2, hi - 2048)
+        found = primes_in_range(lo, hi)
+        if found:
+            return found[-1]
+        hi = lo
+    return 0
+
+
+class _FitsTable:
+    """
+    Appends rows to the first extension of a FITS file, keeping its header
+    up to date with the number of rows written.
+    """
+
+    def __init__(self, path, start, stop, rows):
+        from astropy.io import fits
+
+        self.dtype = np.dtype([(name, '>' + kind) for name, kind in COLUMNS])
+        columns = fits.ColDefs([fits.Column(name='index', format='K'),
+                                fits.Column(name='prime', format='K'),
+                                fits.Column(name='gap', format='J')])
+        self.header = fits.BinTableHDU.from_columns(columns, nrows=0).header
+        self.header['EXTNAME'] = 'PRIMES'
+        self.header['PRIMELO'] = (start, 'start of the range of primes')
+        self.header['PRIMEHI'] = (stop, 'end (exclusive) of the range of primes')
+        primary = fits.PrimaryHDU().header.tostring().encode('ascii')
+
+        self._file = open(path, 'r+b' if rows else 'w+b')
+        self._header_offset = len(primary)
+        self._data_offset = len(primary) + len(self.header.tostring())
+        if rows:
+            self._file.truncate(self._data_offset + rows * self.dtype.itemsize)
+        else:
+            self._file.write(primary)
+            self.commit(0)
+        self._file.seek(0, os.SEEK_END)
+
+    def append(self, rows):
+        self._file.write(rows.tobytes())
+
+    def commit(self, count):
+        end = self._file.tell()
+        self.header['NAXIS2'] = count
+        header = self.header.tostring().encode('ascii')
+        if self._header_offset + len(header) != self._data_offset:
+            raise RuntimeError('the size of the FITS header changed')
+        self._file.seek(self._header_offset)
+        self._file.write(header)
+        self._file.seek(end)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, complete):
+        if complete:
+            self._file.write(bytes(-self._file.tell() % FITS_BLOCK))
+        self._file.close()
+
+
+class _Hdf5Table:
+    """
+    Appends rows to a resizable HDF5 dataset.
+    """
+
+    def __init__(self, path, start, stop, rows):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('h5py is required to export primes to HDF5')
+
+        self.dtype = np.dtype([(name, '<' + kind) for name, kind in COLUMNS])
+        self._file = h5py.File(path, 'a' if rows else 'w')
+        if rows:
+            self._dataset = self._file['primes']
+            self._dataset.resize((rows,))
+        else:
+            self._dataset = self._file.create_dataset(
+                'primes', shape=(0,), maxshape=(None,), dtype=self.dtype,
+                chunks=(2 ** 16,))
+            self._dataset.attrs['start'] = start
+            self._dataset.attrs['stop'] = stop
+
+    def append(self, rows):
+        size = len(self._dataset)
+        self._dataset.resize((size + len(rows),))
+        self._dataset[size:] = rows
+
+    def commit(self, count):
+        self._file.flush()
+
+    def close(self, complete):
+        self._file.close()
+
+
+_TABLES = {'fits': _FitsTable, 'hdf5': _Hdf5Table}
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def export_primes(path, start, stop, format=None, chunk=2 ** 22, usecython=False,
+                  resume=True, progress=None):
+    """
+    Writes the primes in ``[start, stop)`` to a table on disk, one window of
+    the range at a time.
+
+    The gap of the first prime in the range is measured from the prime
+    before ``start``, and that of 2 is 0.
+
+    Parameters
+    ----------
+    path: str
+        The table to write.
+    start, stop: int
+        The range of integers to export.
+    format: str, optional
+        One of `FORMATS`. Defaults to the one matching the extension of
+        ``path``.
+    chunk: int, optional
+        The number of odd numbers sieved and written at a time, which
+        bounds the memory used by the export.
+    usecython: bool, optional
+        Use the compiled sieve.
+    resume: bool, optional
+        If a checkpoint left by an interrupted export of the same range to
+        the same file exists, continue from it instead of starting over.
+    progress: callable, optional
+        Called after each window is saved with the number of primes written
+        so far and the integer up to which the range has been exported.
+
+    Returns
+    -------
+    count: int
+        The number of primes in the table.
+    """
+    from ..example_mod import iter_prime_chunks, prime_count
+
+    if format is None:
+        format = detect_format(path)
+    if format not in FORMATS:
+        raise ValueError('unknown format {0!r}, expected one of {1}'.format(
+            format, ', '.join(FORMATS)))
+    start = max(start, 2)
+    stop = max(stop, start)
+
+    checkpoint_path = path + '.checkpoint'
+    checkpoint = _read_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None and (checkpoint['format'], checkpoint['start'],
+                                   checkpoint['stop']) != (format, start, stop):
+        raise ValueError('{0} belongs to an export of a different range or '
+                         'format; remove it to start over'.format(checkpoint_path))
+    if checkpoint is None:
+        checkpoint = {'format': format, 'start': start, 'stop': stop, 'rows': 0,
+                      'next': start, 'last': _previous_prime(start),
+                      'index': prime_count(start - 1)}
+
+    table = _TABLES[format](path, start, stop, checkpoint['rows'])
+    try:
+        for lo in range(checkpoint['next'], stop, 2 * chunk):
+            hi = min(lo + 2 * chunk, stop)
+            found = np.concatenate([np.empty(0, dtype=np.int64)] + list(
+                iter_prime_chunks(lo, hi, chunk=chunk, usecython=usecython)))
+            rows = np.empty(len(found), dtype=table.dtype)
+            rows['prime'] = found
+            rows['index'] = np.arange(checkpoint['index'] + 1,
+                                      checkpoint['index'] + len(found) + 1)
+            # 2 has no previous prime, its gap is 0
+            previous = checkpoint['last'] or found[:1]
+            rows['gap'] = np.diff(found, prepend=previous)
+            table.append(rows)
+
+            checkpoint['rows'] += len(found)
+            checkpoint['index'] += len(found)
+            checkpoint['next'] = hi
+            if len(found):
+                checkpoint['last'] = int(found[-1])
+            table.commit(checkpoint['rows'])
+            _write_checkpoint(checkpoint_path, checkpoint)
+            if progress is not None:
+                progress(checkpoint['rows'], hi)
+    except BaseException:
+        table.close(complete=False)
+        raise
+    table.close(complete=True)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return checkpoint['rows']
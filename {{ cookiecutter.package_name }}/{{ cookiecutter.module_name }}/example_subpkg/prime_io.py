@@ -0,0 +1,325 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Compact file formats for long lists of primes, written and read back one
+chunk at a time.
+
+The following formats are supported:
+
+``npy``
+    A NumPy ``.npy`` file of 64-bit integers, which can be memory-mapped.
+``delta-varint``
+    The gaps between consecutive primes, each stored as a LEB128 variable
+    length integer. Gaps are almost always below 128, so this takes a little
+    over one byte per prime.
+``bitmap``
+    One bit per odd number between the first and the last odd prime, which
+    takes 1/16 of a byte per number in the range.
+``text``
+    One prime per line.
+"""
+
+import struct
+
+import numpy as np
+
+__all__ = ['FORMATS', 'PrimeWriter', 'write_primes', 'read_primes',
+           'iter_read_primes', 'detect_format']
+
+FORMATS = ('npy', 'delta-varint', 'bitmap', 'text')
+
+NPY_MAGIC = b'\x93NUMPY'
+VARINT_MAGIC = b'PRIMDV01'
+BITMAP_MAGIC = b'PRIMBM01'
+
+# magic, number of primes
+VARINT_HEADER = struct.Struct('<8sQ')
+# magic, number of primes, whether 2 is included, first odd number, number of bits
+BITMAP_HEADER = struct.Struct('<8sQQQQ')
+
+# The shifts of the seven-bit groups of a 64-bit LEB128 integer
+_SHIFTS = np.arange(0, 64, 7, dtype=np.uint64)
+
+
+def _npy_header(count):
+    return {'descr': '<i8', 'fortran_order': False, 'shape': (count,)}
+
+
+def _encode_varints(values):
+    """
+    Encodes an array of non-negative integers as LEB128 bytes.
+    """
+    values = values.astype(np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in _SHIFTS[1:]:
+        nbytes += values >= (np.uint64(1) << shift)
+    starts = np.cumsum(nbytes) - nbytes
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for i in range(int(nbytes.max(initial=0))):
+        sel = nbytes > i
+        group = (values[sel] >> _SHIFTS[i]) & np.uint64(0x7f)
+        more = (nbytes[sel] > i + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + i] = group | more
+    return out
+
+
+def _decode_varints(data):
+    """
+    Decodes LEB128 bytes into an array of integers.
+
+    Returns the decoded values and the number of bytes used, which is less
+    than the length of ``data`` if it ends in the middle of a value.
+    """
+    ends = np.flatnonzero(data < 0x80)
+    if not len(ends):
+        return np.empty(0, dtype=np.int64), 0
+    used = int(ends[-1]) + 1
+    data = data[:used]
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    # The position of each byte within its value
+    position = np.arange(used) - np.repeat(starts, ends - starts + 1)
+    groups = (data & 0x7f).astype(np.uint64) << _SHIFTS[position]
+    return np.add.reduceat(groups, starts).astype(np.int64), used
+
+
+class PrimeWriter:
+    """
+    Writes an increasing sequence of primes to a file, one chunk at a time.
+
+    The file is complete once the writer is closed, which also happens when
+    it is used as a context manager.
+
+    Parameters
+    ----------
+    path: str
+        The file to write.
+    format: str, optional
+        One of `FORMATS`.
+    """
+
+    def __init__(self, path, format='npy'):
+        if format not in FORMATS:
+            raise ValueError('unknown format {0!r}, expected one of {1}'.format(
+                format, ', '.join(FORMATS)))
+        self.format = format
+        self.count = 0
+        self._file = open(path, 'w' if format == 'text' else 'w+b')
+        self._last = 0
+        self._two = 0
+        self._first = None
+        self._carry = np.empty(0, dtype=bool)
+        self._bits_written = 0
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_header(self):
+        self._file.seek(0)
+        if self.format == 'npy':
+            np.lib.format.write_array_header_1_0(self._file, _npy_header(self.count))
+        elif self.format == 'delta-varint':
+            self._file.write(VARINT_HEADER.pack(VARINT_MAGIC, self.count))
+        elif self.format == 'bitmap':
+            first = self._first or 1
+            nbits = (self._last - first) // 2 + 1 if self._first else 0
+            self._file.write(BITMAP_HEADER.pack(BITMAP_MAGIC, self.count, self._two,
+                                                first, nbits))
+
+    def write(self, primes):
+        """
+        Appends primes, which must all be larger than those already written.
+
+        Parameters
+        ----------
+        primes: array-like
+            The primes to append.
+        """
+        primes = np.asarray(primes, dtype=np.int64)
+        if not len(primes):
+            return
+        if self.format == 'npy':
+            # The header declares little-endian data whatever the host
+            self._file.write(primes.astype('<i8', copy=False).tobytes())
+        elif self.format == 'delta-varint':
+            gaps = np.diff(primes, prepend=self._last)
+            self._file.write(_encode_varints(gaps).tobytes())
+        elif self.format == 'bitmap':
+            self._write_bits(primes)
+        else:
+            self._file.write('\n'.join(map(str, primes.tolist())) + '\n')
+        self.count += len(primes)
+        self._last = int(primes[-1])
+
+    def _write_bits(self, primes):
+        if primes[0] == 2:
+            self._two = 1
+            primes = primes[1:]
+            if not len(primes):
+                return
+        if self._first is None:
+            self._first = int(primes[0])
+        # Bits are written a whole byte at a time, the remaining ones are
+        # carried over to the next chunk.
+        index = (primes - self._first) // 2 - self._bits_written
+        flags = np.zeros(int(index[-1]) + 1, dtype=bool)
+        flags[:len(self._carry)] = self._carry
+        flags[index] = True
+        full = len(flags) // 8 * 8
+        self._file.write(np.packbits(flags[:full], bitorder='little').tobytes())
+        self._bits_written += full
+        self._carry = flags[full:]
+
+    def close(self):
+        """
+        Completes the file and closes it.
+        """
+        if self._file.closed:
+            return
+        if len(self._carry):
+            self._file.write(np.packbits(self._carry, bitorder='little').tobytes())
+            self._carry = self._carry[:0]
+        if self.format != 'text':
+            end = self._file.tell()
+            offset = self._data_offset()
+            self._write_header()
+            if self._file.tell() != offset:
+                raise RuntimeError('the size of the file header changed')
+            self._file.seek(end)
+        self._file.close()
+
+    def _data_offset(self):
+        self._file.seek(0)
+        if self.format == 'npy':
+            np.lib.format.read_magic(self._file)
+            np.lib.format.read_array_header_1_0(self._file)
+            return self._file.tell()
+        elif self.format == 'delta-varint':
+            return VARINT_HEADER.size
+        return BITMAP_HEADER.size
+
+
+def write_primes(path, chunks, format='npy', imax=None):
+    """
+    Writes primes to a file without holding all of them in memory.
+
+    Parameters
+    ----------
+    path: str
+        The file to write.
+    chunks: iterable
+        Arrays of increasing primes, as returned by
+        `~{{ cookiecutter.module_name }}.example_mod.iter_prime_chunks`.
+    format: str, optional
+        One of `FORMATS`.
+    imax: int, optional
+        If given, stop after writing this number of primes.
+
+    Returns
+    -------
+    count: int
+        The number of primes written.
+    """
+    with PrimeWriter(path, format) as writer:
+        for chunk in chunks:
+            if imax is not None:
+                chunk = chunk[:imax - writer.count]
+            writer.write(chunk)
+            if imax is not None and writer.count >= imax:
+                break
+    return writer.count
+
+
+def detect_format(path):
+    """
+    Returns the format of a file written by `PrimeWriter`.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(8)
+    if magic.startswith(NPY_MAGIC):
+        return 'npy'
+    elif magic == VARINT_MAGIC:
+        return 'delta-varint'
+    elif magic == BITMAP_MAGIC:
+        return 'bitmap'
+    return 'text'
+
+
+def iter_read_primes(path, chunk=2 ** 20):
+    """
+    Iterates over the primes stored in a file, in chunks.
+
+    Parameters
+    ----------
+    path: str
+        A file written by `PrimeWriter`, in any of the `FORMATS`.
+    chunk: int, optional
+        The number of bytes (or, for ``npy`` files, of primes) read at a time.
+
+    Yields
+    ------
+    primes: `numpy.ndarray`
+        The next primes in the file, as 64-bit integers.
+    """
+    format = detect_format(path)
+
+    if format == 'npy':
+        table = np.load(path, mmap_mode='r')
+        for i in range(0, len(table), chunk):
+            yield table[i:i + chunk]
+
+    elif format == 'text':
+        with open(path) as f:
+            while True:
+                lines = f.readlines(chunk)
+                if not lines:
+                    break
+                yield np.array(lines, dtype=np.int64)
+
+    elif format == 'delta-varint':
+        data = np.memmap(path, dtype=np.uint8, mode='r', offset=VARINT_HEADER.size)
+        last = 0
+        pos = 0
+        while pos < len(data):
+            # A value spans at most ten bytes, so each block ends in a value
+            gaps, used = _decode_varints(np.asarray(data[pos:pos + max(chunk, 10)]))
+            if not used:
+                raise ValueError('{0} is truncated'.format(path))
+            pos += used
+            primes = np.cumsum(gaps) + last
+            last = int(primes[-1])
+            yield primes
+
+    else:
+        with open(path, 'rb') as f:
+            _, _, two, first, nbits = BITMAP_HEADER.unpack(f.read(BITMAP_HEADER.size))
+        if two:
+            yield np.array([2], dtype=np.int64)
+        if nbits:
+            data = np.memmap(path, dtype=np.uint8, mode='r', offset=BITMAP_HEADER.size)
+            for pos in range(0, len(data), chunk):
+                bits = np.unpackbits(np.asarray(data[pos:pos + chunk]), bitorder='little')
+                found = np.flatnonzero(bits).astype(np.int64)
+                yield first + 2 * (8 * pos + found)
+
+
+def read_primes(path):
+    """
+    Reads all the primes stored in a file.
+
+    Parameters
+    ----------
+    path: str
+        A file written by `PrimeWriter`, in any of the `FORMATS`.
+
+    Returns
+    -------
+    primes: `numpy.ndarray`
+        The primes, as 64-bit integers. ``npy`` files are memory-mapped
+        rather than read.
+    """
+    if detect_format(path) == 'npy':
+        return np.load(path, mmap_mode='r')
+    return np.concatenate([np.empty(0, dtype=np.int64)] + list(iter_read_primes(path)))
@@ -0,0 +1,376 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+A long-running server answering prime number queries over a local Unix
+socket, and its client.
+
+The server keeps a table of all of the primes below a limit in memory, so
+most queries are answered by a binary search in it, and only queries beyond
+the table are computed. Each client connection is served by its own thread.
+
+Protocol
+--------
+Each request and response is a frame made of its length in bytes, as a
+little-endian unsigned 64-bit integer, followed by that many bytes.
+
+A request holds a one-byte operation code followed by little-endian signed
+64-bit integer arguments:
+
+======== ==== ============= ==========================================
+name     code arguments     response
+======== ==== ============= ==========================================
+RANGE    1    lo, hi        the primes in ``[lo, hi)``, as int64
+COUNT    2    x             the number of primes ``<= x``, as int64
+NTH      3    n             the n-th prime, as int64
+IS_PRIME 4    any number    one uint8 per argument, 1 if it is prime
+======== ==== ============= ==========================================
+
+A response holds a one-byte status, 0 on success followed by the result, or
+1 on error followed by a UTF-8 error message. Requests that would take too
+much work or memory to answer, as set by the ``MAX_*`` limits below, get an
+error.
+
+The socket is only accessible to the user running the server. By default it
+is created in a directory private to that user, in ``$XDG_RUNTIME_DIR`` if
+it is set, and in the temporary directory otherwise.
+"""
+
+import getpass
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+
+import numpy as np
+
+__all__ = ['PrimeServer', 'PrimeClient', 'DEFAULT_SOCKET', 'main']
+
+
+def _runtime_directory():
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, '{{ cookiecutter.module_name }}')
+    user = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(),
+                        '{{ cookiecutter.module_name }}-{0}'.format(user))
+
+
+DEFAULT_SOCKET = os.path.join(_runtime_directory(), 'primes.sock')
+
+RANGE, COUNT, NTH, IS_PRIME = 1, 2, 3, 4
+OK, ERROR = 0, 1
+
+LENGTH = struct.Struct('<Q')
+
+# Requests larger than this are rejected, so that a bad length can't make the
+# server allocate an arbitrary amount of memory.
+MAX_REQUEST = 2 ** 27
+
+# Likewise, requests whose response could be larger than this many bytes are
+# rejected, as are those that would take too long to answer: ranges reaching
+# more than MAX_RANGE numbers beyond the table, and counts and indices of
+# primes larger than MAX_COUNT and MAX_NTH.
+MAX_RESPONSE = 2 ** 27
+MAX_RANGE = 2 ** 30
+MAX_COUNT = 2 ** 40
+MAX_NTH = 2 ** 34
+
+
+def _recv_exactly(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    while size:
+        received = sock.recv_into(view[len(data) - size:])
+        if not received:
+            raise EOFError('connection closed')
+        size -= received
+    return data
+
+
+def _send_frame(sock, payload):
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_frame(sock, max_size=None):
+    size, = LENGTH.unpack(_recv_exactly(sock, LENGTH.size))
+    if max_size is not None and size > max_size:
+        raise ValueError('frame of {0} bytes is too large'.format(size))
+    return _recv_exactly(sock, size)
+
+
+class _PrimeTable:
+    """
+    The primes below ``limit``, with the queries answered from them.
+    """
+
+    def __init__(self, limit):
+        from ..example_mod import _backends, iter_prime_chunks
+        self.usecython = _backends['cython'].available
+        self.limit = limit
+        self.primes = np.concatenate([np.empty(0, dtype=np.int64)] + list(
+            iter_prime_chunks(2, limit, chunk=2 ** 22, usecython=self.usecython)))
+
+    def range(self, lo, hi):
+        from ..example_mod import _prime_count_upper_bound, iter_prime_chunks
+        hi = max(lo, hi)
+        table = self.primes[np.searchsorted(self.primes, lo):
+                            np.searchsorted(self.primes, min(hi, self.limit))]
+        if hi <= self.limit:
+            return table
+        start = max(lo, self.limit)
+        if hi - start > MAX_RANGE:
+            raise ValueError('ranges cannot reach more than {0} numbers beyond '
+                             '{1}'.format(MAX_RANGE, self.limit))
+        if 8 * (len(table) + _prime_count_upper_bound(start, hi)) > MAX_RESPONSE:
+            raise ValueError('the primes in [{0}, {1}) could take more than {2} '
+                             'bytes'.format(lo, hi, MAX_RESPONSE))
+        rest = iter_prime_chunks(start, hi, usecython=self.usecython)
+        return np.concatenate([table] + list(rest))
+
+    def count(self, x):
+        from ..example_mod import prime_count
+        if x < self.limit:
+            return int(np.searchsorted(self.primes, x, side='right'))
+        if x > MAX_COUNT:
+            raise ValueError('x cannot be larger than {0}'.format(MAX_COUNT))
+        return prime_count(x)
+
+    def nth(self, n):
+        from ..example_mod import nth_prime
+        if 1 <= n <= len(self.primes):
+            return int(self.primes[n - 1])
+        if n > MAX_NTH:
+            raise ValueError('n cannot be larger than {0}'.format(MAX_NTH))
+        return nth_prime(n)
+
+    def is_prime(self, values):
+        from ..example_mod import is_prime
+        values = np.asarray(values, dtype=np.int64)
+        result = np.zeros(len(values), dtype=bool)
+        small = values < self.limit
+        index = np.searchsorted(self.primes, values[small])
+        found = index < len(self.primes)
+        index[~found] = 0
+        result[small] = found & (self.primes[index] == values[small])
+        if not small.all():
+            result[~small] = is_prime(values[~small])
+        return result
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        table = self.server.table
+        while True:
+            try:
+                request = _recv_frame(self.request, MAX_REQUEST)
+            except (EOFError, ConnectionError):
+                return
+            except ValueError as exc:
+                _send_frame(self.request, bytes([ERROR]) + str(exc).encode())
+                return
+            try:
+                code = request[0]
+                args = np.frombuffer(request, dtype='<i8', offset=1)
+                if code == RANGE:
+                    result = table.range(int(args[0]), int(args[1]))
+                elif code == COUNT:
+                    result = [table.count(int(args[0]))]
+                elif code == NTH:
+                    result = [table.nth(int(args[0]))]
+                elif code == IS_PRIME:
+                    result = table.is_prime(args).astype(np.uint8)
+                else:
+                    raise ValueError('unknown operation {0}'.format(code))
+                if code != IS_PRIME:
+                    result = np.asarray(result, dtype='<i8')
+                response = bytes([OK]) + result.tobytes()
+            except Exception as exc:
+                response = bytes([ERROR]) + '{0}: {1}'.format(
+                    type(exc).__name__, exc).encode()
+            try:
+                _send_frame(self.request, response)
+            except ConnectionError:
+                return
+
+
+def _make_private_directory(path):
+    """
+    Creates the directory ``path`` if needed, and makes sure that only the
+    current user can access it.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise OSError('{0} is not a directory private to the current user'.format(path))
+
+
+class PrimeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A server answering prime number queries on a Unix socket.
+
+    Parameters
+    ----------
+    path: str, optional
+        The path of the socket, which is only accessible to the current user.
+        A stale socket left at this path by a server that is no longer
+        running is replaced.
+    limit: int, optional
+        The primes below this number are sieved when the server starts and
+        kept in memory. This happens once the socket is bound, so that a
+        server that would fail to start fails before the sieving.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path=DEFAULT_SOCKET, limit=10 ** 8):
+        if path == DEFAULT_SOCKET:
+            _make_private_directory(os.path.dirname(path))
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.remove(path)
+            else:
+                raise OSError('a server is already listening on {0}'.format(path))
+            finally:
+                probe.close()
+        super().__init__(path, _Handler)
+        self.path = path
+        self._thread = None
+        # Requests are only answered by serve_forever, so clients connecting
+        # in the meantime wait for the table
+        try:
+            self.table = _PrimeTable(limit)
+        except BaseException:
+            self.server_close()
+            raise
+
+    def server_bind(self):
+        super().server_bind()
+        os.chmod(self.server_address, 0o600)
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        """
+        Stops the server, if it was started in the background, and removes
+        its socket.
+        """
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+
+class PrimeClient:
+    """
+    A client of a `PrimeServer`.
+
+    A client holds a single connection, which is shared by its methods under
+    a lock so that it can be used from several threads.
+
+    Parameters
+    ----------
+    path: str, optional
+        The path of the server's socket.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Closes the connection to the server.
+        """
+        self._socket.close()
+
+    def _query(self, code, args, dtype='<i8'):
+        request = bytes([code]) + np.asarray(args, dtype='<i8').tobytes()
+        with self._lock:
+            _send_frame(self._socket, request)
+            response = _recv_frame(self._socket)
+        if response[0] != OK:
+            raise RuntimeError(bytes(response[1:]).decode())
+        return np.frombuffer(response, dtype=dtype, offset=1)
+
+    def range(self, lo, hi):
+        """
+        Returns the primes in ``[lo, hi)``, as a `numpy.ndarray`.
+        """
+        return self._query(RANGE, [lo, hi]).astype(np.int64)
+
+    def count(self, x):
+        """
+        Returns the number of primes less than or equal to ``x``.
+        """
+        return int(self._query(COUNT, [x])[0])
+
+    def nth(self, n):
+        """
+        Returns the n-th prime, counting from ``nth(1) = 2``.
+        """
+        return int(self._query(NTH, [n])[0])
+
+    def is_prime(self, values):
+        """
+        Tests whether each of the given integers is prime.
+
+        Returns
+        -------
+        result: `numpy.ndarray`
+            A boolean array with one entry per value.
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=np.int64))
+        return self._query(IS_PRIME, values, dtype=np.uint8).astype(bool)
+
+
+def main(args=None):
+    """
+    Runs a `PrimeServer` until it is interrupted. This is the ``serve``
+    command of the example console script.
+    """
+    import argparse
+    import signal
+    import sys
+
+    parser = argparse.ArgumentParser(
+        prog='serve', description='Answer prime number queries on a Unix socket.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help='Path of the socket to listen on.')
+    parser.add_argument('--limit', type=int, default=10 ** 8,
+                        help='Keep the primes below this number in memory.')
+    res = parser.parse_args(args)
+
+    server = PrimeServer(res.socket, res.limit)
+    print('Serving {0} primes below {1} on {2}'.format(
+        len(server.table.primes), res.limit, res.socket))
+    # Remove the socket when terminated, as well as when interrupted
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,233 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+A compact, immutable set of the primes in a range of integers.
+"""
+
+from operator import index as as_index
+
+import numpy as np
+
+__all__ = ['PrimeSet']
+
+# The number of bits unpacked at a time when iterating or slicing, so that
+# the temporary arrays stay small whatever the size of the set.
+BLOCK_BITS = 2 ** 20
+
+# The number of set bits in each byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _odd_base(lo):
+    """
+    Returns the odd number represented by the first bit of a set starting at
+    ``lo``. The bitmap starts at 3 at the lowest since 1 is not prime and 2
+    is handled separately.
+    """
+    return max(lo, 3) | 1
+
+
+def _pack_flags(pieces, nbits):
+    """
+    Packs consecutive boolean arrays, with ``nbits`` entries in total, into a
+    little-endian bitmap without ever holding all of the flags at once.
+    """
+    bits = np.zeros((nbits + 7) // 8, dtype=np.uint8)
+    carry = np.empty(0, dtype=bool)
+    done = 0
+    for flags in pieces:
+        flags = np.concatenate([carry, flags]) if len(carry) else flags
+        full = len(flags) // 8 * 8
+        bits[done // 8:(done + full) // 8] = np.packbits(flags[:full], bitorder='little')
+        done += full
+        carry = flags[full:]
+    if len(carry):
+        bits[done // 8] = np.packbits(carry, bitorder='little')[0]
+    return bits
+
+
+class PrimeSet:
+    """
+    The set of prime numbers in ``[lo, hi)``, stored as a bitmap over the odd
+    numbers.
+
+    Each odd number in the range takes one bit, so the set uses about 1/16 of
+    a byte per integer in the range, instead of the 36 bytes per prime of a
+    list of Python integers. Membership tests only look up one bit.
+
+    Sets are usually created with `from_range`, or by passing
+    ``as_set=True`` to `~{{ cookiecutter.module_name }}.example_mod.primes`
+    or `~{{ cookiecutter.module_name }}.example_mod.do_primes`. Slicing a set
+    selects a range of values, not of positions: ``primes[100:200]`` is the
+    set of the primes in ``[100, 200)``. The bitmap is exposed through
+    `bits`, through the buffer protocol on Python 3.12 and later, and
+    ``numpy.asarray(primes)`` returns the primes themselves.
+
+    Parameters
+    ----------
+    lo, hi: int
+        The range of integers covered by the set.
+    bits: `numpy.ndarray`
+        The bitmap, in which bit ``i`` (in little-endian bit order) is set if
+        the odd number ``b + 2 * i`` is prime, where ``b = max(lo, 3) | 1``.
+        The set keeps a read-only view of it rather than a copy.
+    """
+
+    __slots__ = ('_lo', '_hi', '_base', '_bits', '_len')
+
+    def __init__(self, lo, hi, bits):
+        self._lo = lo
+        self._hi = max(hi, lo)
+        self._base = _odd_base(lo)
+        # A read-only view, so that the caller's own array stays writable
+        self._bits = np.asarray(bits, dtype=np.uint8).view()
+        self._bits.flags.writeable = False
+        self._len = int(_POPCOUNT[self._bits].sum(dtype=np.int64)) + (2 in self)
+
+    @classmethod
+    def from_range(cls, lo, hi, usecython=False, chunk=2 ** 20):
+        """
+        Sieves the primes in ``[lo, hi)`` into a new set.
+
+        Parameters
+        ----------
+        lo, hi: int
+            The range of integers to sieve.
+        usecython: bool, optional
+            Use the compiled sieve.
+        chunk: int, optional
+            The number of odd numbers sieved at a time.
+        """
+        from ..example_mod import _iter_flags
+
+        base = _odd_base(lo)
+        nbits = max(0, (hi - base + 1) // 2)
+        if usecython:
+            from ..example_c import sieve
+
+            def pieces():
+                for start in range(base, base + 2 * nbits, 2 * chunk):
+                    stop = min(start + 2 * chunk, hi)
+                    flags = np.zeros((stop - start + 1) // 2, dtype=bool)
+                    flags[(sieve(start, stop) - start) // 2] = True
+                    yield flags
+        else:
+            def pieces():
+                for _, flags in _iter_flags(base, hi, chunk):
+                    yield np.frombuffer(flags, dtype=bool)
+
+        return cls(lo, hi, _pack_flags(pieces(), nbits))
+
+    @classmethod
+    def from_primes(cls, values, lo=None, hi=None):
+        """
+        Creates a set from an array of primes.
+
+        Parameters
+        ----------
+        values: array-like
+            The primes in the set.
+        lo, hi: int, optional
+            The range of integers covered by the set. Defaults to the
+            smallest range holding all of ``values``.
+        """
+        values = np.asarray(values, dtype=np.int64)
+        if lo is None:
+            lo = int(values.min()) if len(values) else 2
+        if hi is None:
+            hi = int(values.max()) + 1 if len(values) else lo
+        base = _odd_base(lo)
+        nbits = max(0, (hi - base + 1) // 2)
+        values = values[(values >= base) & (values < hi)]
+        flags = np.zeros(nbits, dtype=bool)
+        flags[(values - base) // 2] = True
+        return cls(lo, hi, _pack_flags([flags], nbits))
+
+    @property
+    def lo(self):
+        """The smallest integer covered by the set."""
+        return self._lo
+
+    @property
+    def hi(self):
+        """The end (exclusive) of the range of integers covered by the set."""
+        return self._hi
+
+    @property
+    def bits(self):
+        """The bitmap over the odd numbers, as a read-only array."""
+        return self._bits
+
+    @property
+    def nbytes(self):
+        """The memory used by the bitmap, in bytes."""
+        return self._bits.nbytes
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return '<{0} of {1} primes in [{2}, {3})>'.format(
+            type(self).__name__, self._len, self._lo, self._hi)
+
+    def __contains__(self, value):
+        try:
+            value = as_index(value)
+        except TypeError:
+            return False
+        if not self._lo <= value < self._hi:
+            return False
+        if value == 2:
+            return True
+        if value < 3 or not value & 1:
+            return False
+        i = (value - self._base) >> 1
+        return bool(self._bits[i >> 3] >> (i & 7) & 1)
+
+    def _iter_blocks(self):
+        """
+        Yields the primes in the set as arrays, a block of bits at a time.
+        """
+        if 2 in self:
+            yield np.array([2], dtype=np.int64)
+        for start in range(0, len(self._bits), BLOCK_BITS // 8):
+            block = self._bits[start:start + BLOCK_BITS // 8]
+            found = np.flatnonzero(np.unpackbits(block, bitorder='little'))
+            if len(found):
+                yield self._base + 2 * (8 * start + found.astype(np.int64))
+
+    def __iter__(self):
+        for block in self._iter_blocks():
+            yield from block.tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError('the primes of a {0} are decoded from its bitmap, so '
+                             'they cannot be returned without a copy'.format(
+                                 type(self).__name__))
+        result = np.concatenate([np.empty(0, dtype=np.int64)] + list(self._iter_blocks()))
+        return result if dtype is None else result.astype(dtype, copy=False)
+
+    def __buffer__(self, flags):
+        return memoryview(self._bits)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('{0} only supports slicing by a range of values'.format(
+                type(self).__name__))
+        if item.step is not None:
+            raise ValueError('{0} slices cannot have a step'.format(type(self).__name__))
+        lo = self._lo if item.start is None else min(max(item.start, self._lo), self._hi)
+        hi = self._hi if item.stop is None else min(max(item.stop, lo), self._hi)
+
+        base = _odd_base(lo)
+        nbits = max(0, (hi - base + 1) // 2)
+        offset = (base - self._base) // 2
+
+        def pieces():
+            for start in range(offset, offset + nbits, BLOCK_BITS):
+                stop = min(start + BLOCK_BITS, offset + nbits)
+                block = self._bits[start // 8:(stop + 7) // 8]
+                flags = np.unpackbits(block, bitorder='little')
+                yield flags[start % 8:start % 8 + stop - start].view(bool)
+
+        return type(self)(lo, hi, _pack_flags(pieces(), nbits))
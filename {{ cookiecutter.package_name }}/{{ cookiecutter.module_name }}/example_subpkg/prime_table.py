@@ -0,0 +1,166 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+A persistent table of the first N primes, shared by all processes through a
+memory-mapped ``.npy`` file. It backs the ``persistent`` option of
+`~{{ cookiecutter.module_name }}.example_mod.primes` and
+`~{{ cookiecutter.module_name }}.example_mod.do_primes`.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+__all__ = ['PrimeTable']
+
+
+def default_directory():
+    """
+    Returns the directory used for the prime table when none is given: the
+    package's astropy cache directory.
+
+    The table is never kept inside the package itself, so that it can't end
+    up in the package data of a source checkout.
+    """
+    from astropy.config import get_cache_dir
+    return get_cache_dir(rootname=__name__.split('.')[0])
+
+
+@contextmanager
+def _file_lock(path):
+    """
+    Holds an exclusive lock on ``path`` (created if needed) for the duration
+    of the context.
+    """
+    with open(path, 'a+b') as fd:
+        try:
+            import fcntl
+        except ImportError:  # Windows
+            import msvcrt
+            fd.seek(0)
+            msvcrt.locking(fd.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                fd.seek(0)
+                msvcrt.locking(fd.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class PrimeTable:
+    """
+    An on-disk table of the first N primes.
+
+    The table is stored as a 64-bit integer ``.npy`` file and read through
+    `numpy.memmap`, so requests that fit in the table are answered by
+    slicing it without copying. Larger requests extend the table: the new
+    file is written next to the old one and atomically renamed over it while
+    holding a lock, so concurrent readers always see a complete table and
+    concurrent writers never duplicate work.
+
+    Parameters
+    ----------
+    directory: str, optional
+        The directory holding the table. Defaults to `default_directory`.
+    filename: str, optional
+        The name of the table file.
+    """
+
+    def __init__(self, directory=None, filename='primes.npy'):
+        if directory is None:
+            directory = default_directory()
+        self.path = os.path.join(directory, filename)
+        self._table = None
+
+    def __len__(self):
+        return len(self._load())
+
+    def _load(self, reload=False):
+        if self._table is None or reload:
+            if os.path.exists(self.path):
+                self._table = np.load(self.path, mmap_mode='r')
+            else:
+                self._table = np.empty(0, dtype=np.int64)
+        return self._table
+
+    def primes(self, imax):
+        """
+        Returns the first ``imax`` prime numbers.
+
+        Parameters
+        ----------
+        imax: int
+            The number of primes to return.
+
+        Returns
+        -------
+        result: `numpy.ndarray`
+            A read-only view of the first ``imax`` entries of the table.
+        """
+        if imax <= 0:
+            return self._load()[:0]
+        if len(self._load()) < imax:
+            # Another process may have extended the table in the meantime
+            if len(self._load(reload=True)) < imax:
+                self.extend(imax)
+        return self._table[:imax]
+
+    def primes_below(self, limit):
+        """
+        Returns the primes below ``limit``.
+
+        Returns
+        -------
+        result: `numpy.ndarray`
+            A read-only view of the table.
+        """
+        from ..example_mod import prime_count
+        return self.primes(prime_count(limit - 1) if limit > 2 else 0)
+
+    def extend(self, imax):
+        """
+        Makes sure the table holds at least the first ``imax`` primes.
+
+        The table at least doubles in size when it is extended, so that a
+        sequence of growing requests only rewrites it a logarithmic number
+        of times.
+        """
+        from ..example_mod import iter_prime_chunks
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+        with _file_lock(self.path + '.lock'):
+            old = self._load(reload=True)
+            if len(old) >= imax:
+                return
+
+            size = max(imax, 2 * len(old))
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.npy')
+            os.close(fd)
+            try:
+                new = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.int64,
+                                                shape=(size,))
+                new[:len(old)] = old
+                filled = len(old)
+                start = int(old[-1]) + 1 if len(old) else 2
+                for chunk in iter_prime_chunks(start):
+                    take = min(len(chunk), size - filled)
+                    new[filled:filled + take] = chunk[:take]
+                    filled += take
+                    if filled == size:
+                        break
+                new.flush()
+                del new
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+            self._load(reload=True)
@@ -0,0 +1,311 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+A table of primes in shared memory, built once and read by all of the
+processes on a host.
+
+The first process to need more primes than the table holds extends it while
+holding a lock, and every process reads it as a read-only, zero-copy NumPy
+view. Once a process has attached to a table with `attach`,
+`~{{ cookiecutter.module_name }}.example_mod.primes` and
+`~{{ cookiecutter.module_name }}.example_mod.do_primes` use it instead of
+sieving.
+
+The table is made of two shared memory segments: a small header, holding
+the number of attached handles and the current version of the table, and
+the primes themselves. Shared memory segments cannot grow, so extending the
+table writes a new segment and publishes it in the header. Processes still
+reading the previous segment keep it mapped until they are done with it.
+"""
+
+import os
+
+import numpy as np
+
+from .prime_table import _file_lock, default_directory
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # Python < 3.8
+    SharedMemory = None
+
+__all__ = ['SharedPrimeTable', 'attach', 'detach', 'attached_table']
+
+DEFAULT_NAME = '{{ cookiecutter.module_name }}_primes'
+
+# The fields of the header segment
+REFCOUNT, GENERATION, COUNT, LIMIT = range(4)
+HEADER_FIELDS = 4
+
+# The table attached to this process, used by example_mod
+_attached = None
+
+
+def _open_segment(name, create=False, size=0):
+    """
+    Opens a shared memory segment that is not removed when this process
+    exits, since its lifetime is managed by the reference count.
+    """
+    try:
+        return SharedMemory(name, create=create, size=size, track=False)
+    except TypeError:  # Python < 3.13
+        segment = SharedMemory(name, create=create, size=size)
+        if os.name == 'posix':
+            # Only POSIX segments are tracked, under the name passed to
+            # shm_open, which is the public name with a leading slash
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister('/' + segment.name, 'shared_memory')
+        return segment
+
+
+def _unlink_segment(name):
+    try:
+        segment = SharedMemory(name, track=False)
+    except TypeError:  # Python < 3.13, where unlink() also stops tracking
+        segment = SharedMemory(name)
+    segment.unlink()
+    segment.close()
+
+
+def _create_segment(name, size):
+    try:
+        return _open_segment(name, create=True, size=size)
+    except FileExistsError:
+        # Left behind by a process that crashed while extending the table
+        _unlink_segment(name)
+        return _open_segment(name, create=True, size=size)
+
+
+class _Mapping:
+    """
+    Exposes the memory of a shared memory segment to NumPy as ``count``
+    64-bit integers, and closes the segment once no array refers to it.
+
+    Arrays created from a mapping keep it alive, so the segment stays mapped
+    for as long as they are used. Closing the segment while arrays still
+    referred to its buffer would fail otherwise.
+    """
+
+    def __init__(self, segment, count):
+        self._segment = segment
+        # The temporary array only serves to find the address of the buffer
+        address = np.frombuffer(segment.buf, dtype=np.uint8).ctypes.data
+        self.__array_interface__ = {'version': 3, 'shape': (count,),
+                                    'typestr': np.dtype(np.int64).str,
+                                    'data': (address, False)}
+
+    def __del__(self):
+        self._segment.close()
+
+
+def _map_segment(segment, count):
+    """
+    Returns the memory of a segment as an array of ``count`` 64-bit integers,
+    which keeps the segment open for as long as it, or any view of it, is
+    alive.
+    """
+    return np.asarray(_Mapping(segment, count))
+
+
+class SharedPrimeTable:
+    """
+    A handle on the table of all of the primes below a limit, in shared
+    memory.
+
+    Each handle counts as one reference on the table, until it is closed.
+    Closing the last handle removes the table from memory. A process that
+    is killed before closing its handles leaks the table until the host is
+    restarted or the segments are removed by hand.
+
+    Parameters
+    ----------
+    name: str, optional
+        The name of the table. Processes opening a table with the same name
+        share it, and the first one creates it.
+
+    Raises
+    ------
+    ImportError
+        On Python 3.7, which has no `multiprocessing.shared_memory`.
+    """
+
+    def __init__(self, name=DEFAULT_NAME):
+        if SharedMemory is None:
+            raise ImportError('shared prime tables require Python 3.8 or later')
+        self.name = name
+        # Kept with the user's other runtime files rather than in a shared
+        # temporary directory, where another user could hold it
+        self._lock_path = os.path.join(default_directory(), name + '.lock')
+        self._generation = 0
+        self._limit = 2
+        self._table = np.empty(0, dtype=np.int64)
+        with _file_lock(self._lock_path):
+            try:
+                segment = _open_segment(name)
+            except FileNotFoundError:
+                segment = _create_segment(name, HEADER_FIELDS * 8)
+                np.frombuffer(segment.buf, dtype=np.int64)[:] = [0, 0, 0, 2]
+            self._header = _map_segment(segment, HEADER_FIELDS)
+            self._header[REFCOUNT] += 1
+            self._reload()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._table)
+
+    @property
+    def closed(self):
+        """Whether this handle was closed."""
+        return self._header is None
+
+    @property
+    def refcount(self):
+        """The number of open handles on the table, in all processes."""
+        return int(self._header[REFCOUNT])
+
+    @property
+    def limit(self):
+        """The table holds all of the primes below this number."""
+        return self._limit
+
+    def _segment_name(self, generation):
+        return '{0}_{1}'.format(self.name, generation)
+
+    def _reload(self):
+        """
+        Maps the latest version of the table. Must be called with the lock
+        held.
+        """
+        generation = int(self._header[GENERATION])
+        if generation == self._generation:
+            return
+        count = int(self._header[COUNT])
+        segment = _open_segment(self._segment_name(generation))
+        table = _map_segment(segment, count)
+        table.flags.writeable = False
+        self._generation = generation
+        self._limit = int(self._header[LIMIT])
+        self._table = table
+
+    def primes(self, imax):
+        """
+        Returns the first ``imax`` prime numbers.
+
+        Returns
+        -------
+        result: `numpy.ndarray`
+            A read-only view of the table.
+        """
+        from ..example_mod import _nth_prime_upper_bound
+
+        if imax > len(self._table):
+            self.extend(_nth_prime_upper_bound(imax) + 1)
+        return self._table[:max(imax, 0)]
+
+    def primes_below(self, limit):
+        """
+        Returns the primes below ``limit``.
+
+        Returns
+        -------
+        result: `numpy.ndarray`
+            A read-only view of the table.
+        """
+        if limit > self._limit:
+            self.extend(limit)
+        return self._table[:np.searchsorted(self._table, limit)]
+
+    def extend(self, limit):
+        """
+        Makes sure the table holds all of the primes below ``limit``.
+
+        The limit of the table at least doubles when it is extended, so that
+        a sequence of growing requests only rewrites it a logarithmic number
+        of times.
+        """
+        from ..example_mod import _backends, iter_prime_chunks, prime_count
+
+        with _file_lock(self._lock_path):
+            self._reload()
+            old, old_limit = self._table, self._limit
+            if limit <= old_limit:
+                return
+
+            limit = max(limit, 2 * old_limit)
+            count = prime_count(limit - 1)
+            generation = self._generation + 1
+            segment = _create_segment(self._segment_name(generation), max(count, 1) * 8)
+            new = _map_segment(segment, count)
+            new[:len(old)] = old
+            filled = len(old)
+            for chunk in iter_prime_chunks(old_limit, limit,
+                                           usecython=_backends['cython'].available):
+                new[filled:filled + len(chunk)] = chunk
+                filled += len(chunk)
+
+            self._header[COUNT] = count
+            self._header[LIMIT] = limit
+            self._header[GENERATION] = generation
+            if self._generation:
+                _unlink_segment(self._segment_name(self._generation))
+            self._reload()
+
+    def close(self):
+        """
+        Releases this handle. The table is removed when the last handle on
+        it is closed, but arrays returned by this handle stay valid.
+        """
+        if self.closed:
+            return
+        with _file_lock(self._lock_path):
+            self._header[REFCOUNT] -= 1
+            if not self._header[REFCOUNT]:
+                generation = int(self._header[GENERATION])
+                if generation:
+                    _unlink_segment(self._segment_name(generation))
+                _unlink_segment(self.name)
+        self._header = None
+
+
+def attach(name=DEFAULT_NAME):
+    """
+    Attaches this process to a shared prime table, which is then used by
+    `~{{ cookiecutter.module_name }}.example_mod.primes` and
+    `~{{ cookiecutter.module_name }}.example_mod.do_primes`.
+
+    Parameters
+    ----------
+    name: str, optional
+        The name of the table, created if it does not exist yet.
+
+    Returns
+    -------
+    table: `SharedPrimeTable`
+        The attached table.
+    """
+    global _attached
+    detach()
+    _attached = SharedPrimeTable(name)
+    return _attached
+
+
+def detach():
+    """
+    Detaches this process from its shared prime table, if any, and closes
+    the handle.
+    """
+    global _attached
+    if _attached is not None:
+        _attached.close()
+        _attached = None
+
+
+def attached_table():
+    """
+    Returns the `SharedPrimeTable` attached to this process, or `None`.
+    """
+    return _attached
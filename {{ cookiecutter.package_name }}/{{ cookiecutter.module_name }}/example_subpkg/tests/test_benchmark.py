@@ -0,0 +1,28 @@
+import sys
+
+import pytest
+
+from ...example_mod import available_backends
+from ..benchmark import format_results, run_benchmark
+
+
+def test_run_benchmark():
+    backends = available_backends()
+    results = run_benchmark(1000, backends, repeat=3, warmup=1, workers=2)
+    assert [result['backend'] for result in results] == backends
+    for result in results:
+        assert 0 < result['min'] <= result['median'] <= result['p95']
+        assert result['primes_per_second'] > 0
+        if sys.platform.startswith('linux'):
+            # Each engine runs in its own process, so none is charged the
+            # peak of another, and only the parallel one has workers
+            assert 0 < result['peak_rss'] < 2 ** 30
+            assert (result['peak_rss_workers'] is None) == (result['backend'] != 'parallel')
+    table = format_results(results).splitlines()
+    assert len(table) == len(backends) + 1
+    assert table[1].startswith('python')
+
+
+def test_run_benchmark_unknown():
+    with pytest.raises(ValueError, match='unknown engines: fortran'):
+        run_benchmark(10, ['python', 'fortran'])
@@ -0,0 +1,54 @@
+from ...example_mod import PrimeCache, do_primes, main, primes
+from ..instrumentation import current_stats, profile, stats_callbacks
+
+
+def test_profile():
+    assert current_stats() is None
+    with profile() as stats:
+        assert current_stats() is stats
+        result = primes(100000)
+    assert current_stats() is None
+    assert result == primes(100000)
+    assert stats.segments >= 1
+    assert stats.marks > 1000000
+    assert stats.bytes_allocated > 0
+    assert set(stats.phases) == {'base primes', 'sieve', 'extract'}
+    assert stats.as_dict()['segments'] == stats.segments
+
+
+def test_profile_nested():
+    with profile() as outer:
+        primes(10)
+        with profile() as inner:
+            primes(100000)
+    assert inner.segments > 0
+    assert outer.segments < inner.segments
+
+
+def test_callbacks():
+    collected = []
+    stats_callbacks.append(collected.append)
+    try:
+        with profile(callback=collected.append) as stats:
+            primes(10)
+    finally:
+        stats_callbacks.remove(collected.append)
+    assert collected == [stats, stats]
+
+
+def test_cache_counters():
+    cache = PrimeCache(segment_size=1000)
+    with profile() as stats:
+        cache.primes(1000)
+        cache.primes(1000)
+    assert stats.cache_misses == cache.misses > 0
+    assert stats.cache_hits == cache.hits > 0
+
+
+def test_do_primes_profile(capsys):
+    result, stats = do_primes(1000, profile=True, verbose=False)
+    assert result == primes(1000)
+    assert 'total' in stats.phases
+    main(['--profile', '1000'])
+    out = capsys.readouterr().out
+    assert 'marks' in out and 'total' in out
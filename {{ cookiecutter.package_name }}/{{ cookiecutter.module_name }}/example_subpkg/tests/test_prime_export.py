@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import Table
+
+from ...example_mod import main, primes
+from ..prime_export import detect_format, export_primes
+
+
+def _check_table(table, start, stop):
+    expected = primes(limit=stop)
+    first = np.searchsorted(expected, start)
+    assert table['prime'].tolist() == expected[first:]
+    assert table['index'].tolist() == list(range(first + 1, len(expected) + 1))
+    gaps = np.diff(expected, prepend=expected[0])[first:]
+    assert table['gap'].tolist() == gaps.tolist()
+
+
+@pytest.mark.parametrize('start', [0, 2, 3, 1000])
+def test_export_fits(tmpdir, start):
+    path = str(tmpdir.join('primes.fits'))
+    count = export_primes(path, start, 100000, chunk=1000)
+    table = Table.read(path, memmap=True)
+    assert len(table) == count
+    _check_table(table, start, 100000)
+    with fits.open(path) as hdul:
+        hdul.verify('exception')
+        assert hdul[1].header['PRIMEHI'] == 100000
+    assert os.path.getsize(path) % 2880 == 0
+    assert not os.path.exists(path + '.checkpoint')
+
+
+def test_export_hdf5(tmpdir):
+    pytest.importorskip('h5py')
+    path = str(tmpdir.join('primes.h5'))
+    count = export_primes(path, 100, 100000, chunk=1000)
+    table = Table.read(path, path='primes')
+    assert len(table) == count
+    _check_table(table, 100, 100000)
+
+
+@pytest.mark.parametrize('format', ['fits', 'hdf5'])
+def test_resume(tmpdir, format):
+    if format == 'hdf5':
+        pytest.importorskip('h5py')
+    path = str(tmpdir.join('primes.' + format))
+    calls = []
+
+    def interrupt(count, done):
+        calls.append(done)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        export_primes(path, 10, 200000, chunk=5000, progress=interrupt)
+    assert os.path.exists(path + '.checkpoint')
+
+    with pytest.raises(ValueError, match='different range'):
+        export_primes(path, 10, 300000, chunk=5000)
+
+    resumed = []
+    export_primes(path, 10, 200000, chunk=5000,
+                  progress=lambda count, done: resumed.append(done))
+    assert resumed[0] == calls[-1] + 10000
+    table = Table.read(path, **({'path': 'primes'} if format == 'hdf5' else {}))
+    _check_table(table, 10, 200000)
+    assert not os.path.exists(path + '.checkpoint')
+
+
+def test_detect_format():
+    assert detect_format('a.FITS') == 'fits'
+    assert detect_format('a.hdf5') == 'hdf5'
+    with pytest.raises(ValueError):
+        detect_format('primes.txt')
+
+
+def test_main_export(tmpdir, capsys):
+    path = str(tmpdir.join('primes.fits'))
+    main(['-o', path, '-f', 'fits', '1000'])
+    assert 'Wrote 1000 prime numbers' in capsys.readouterr().out
+    table = Table.read(path)
+    assert table['prime'].tolist() == primes(1000)
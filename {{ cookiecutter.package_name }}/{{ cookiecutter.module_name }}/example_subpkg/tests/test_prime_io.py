@@ -0,0 +1,58 @@
+import struct
+
+import numpy as np
+import pytest
+
+from ...example_mod import iter_prime_chunks, main, primes
+from ..prime_io import FORMATS, detect_format, iter_read_primes, read_primes, write_primes
+
+
+@pytest.mark.parametrize('format', FORMATS)
+@pytest.mark.parametrize('start', [2, 3, 1000])
+def test_roundtrip(tmpdir, format, start):
+    path = str(tmpdir.join('primes'))
+    expected = [p for p in primes(limit=300000) if p >= start]
+    count = write_primes(path, iter_prime_chunks(start, 300000, chunk=1000), format)
+    assert count == len(expected)
+    assert detect_format(path) == format
+    assert read_primes(path).tolist() == expected
+    chunks = list(iter_read_primes(path, chunk=997))
+    assert len(chunks) > 1
+    assert np.concatenate(chunks).tolist() == expected
+
+
+def test_sizes(tmpdir):
+    sizes = {}
+    for format in FORMATS:
+        path = tmpdir.join(format)
+        write_primes(str(path), iter_prime_chunks(2, 10 ** 6), format)
+        sizes[format] = path.size()
+    assert sizes['delta-varint'] * 4 < sizes['npy']
+    assert sizes['bitmap'] * 4 < sizes['npy']
+
+
+def test_large_gaps(tmpdir):
+    path = str(tmpdir.join('gaps'))
+    values = np.array([2, 3, 200, 2 ** 20, 2 ** 40, 2 ** 62], dtype=np.int64)
+    write_primes(path, [values[:2], values[2:]], 'delta-varint')
+    assert read_primes(path).tolist() == values.tolist()
+
+
+def test_npy_little_endian(tmpdir):
+    path = str(tmpdir.join('primes.npy'))
+    write_primes(path, [np.array([2, 3, 5], dtype='>i8')], 'npy')
+    with open(path, 'rb') as f:
+        assert f.read()[-24:] == struct.pack('<3q', 2, 3, 5)
+    assert read_primes(path).tolist() == [2, 3, 5]
+
+
+def test_main_output(tmpdir, capsys):
+    path = str(tmpdir.join('primes.bin'))
+    main(['--output', path, '--format', 'delta-varint', '1000'])
+    assert 'Wrote 1000 prime numbers' in capsys.readouterr().out
+    assert read_primes(path).tolist() == primes(1000)
+    main(['-o', path, '-f', 'bitmap', '--start', '100', '200'])
+    assert read_primes(path).tolist() == [p for p in primes(limit=200) if p >= 100]
+    with pytest.raises(SystemExit):
+        main(['-o', path, '--workers', '2', '1000'])
+    assert '--output cannot be combined with --workers' in capsys.readouterr().err
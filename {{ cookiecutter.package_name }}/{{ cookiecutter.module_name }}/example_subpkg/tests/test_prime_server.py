@@ -0,0 +1,141 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+from ...example_mod import is_prime, main, nth_prime, prime_count, primes
+from .. import prime_server
+from ..prime_server import LENGTH, PrimeClient, PrimeServer
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                reason='Unix sockets are not available')
+
+
+@pytest.fixture(scope='module')
+def server():
+    # Socket paths are limited to about a hundred characters, which pytest's
+    # temporary directories can exceed.
+    directory = tempfile.mkdtemp()
+    server = PrimeServer(os.path.join(directory, 'primes.sock'), limit=100000)
+    server.start()
+    yield server
+    server.close()
+    shutil.rmtree(directory)
+
+
+def test_queries(server):
+    with PrimeClient(server.path) as client:
+        assert client.range(0, 1000).tolist() == primes(limit=1000)
+        assert client.range(99000, 101000).tolist() == [
+            p for p in primes(limit=101000) if p >= 99000]
+        assert client.range(200000, 200100).tolist() == [
+            p for p in primes(limit=200100) if p >= 200000]
+        assert len(client.range(10, 5)) == 0
+        for x in [0, 2, 1000, 99999, 100000, 10 ** 7]:
+            assert client.count(x) == prime_count(x)
+        for n in [1, 9592, 9593, 10 ** 5]:
+            assert client.nth(n) == nth_prime(n)
+        values = [0, 1, 2, 9, 99991, 99989, 100003, 2 ** 61 - 1, 2 ** 61 + 1]
+        assert client.is_prime(values).tolist() == is_prime(values).tolist()
+        assert client.is_prime(7).tolist() == [True]
+
+
+def test_errors(server):
+    with PrimeClient(server.path) as client:
+        with pytest.raises(RuntimeError, match='ValueError'):
+            client.nth(0)
+        # The connection is still usable after an error
+        assert client.count(10) == 4
+        # Requests that would take too much work or memory
+        with pytest.raises(RuntimeError, match='beyond'):
+            client.range(0, 2 ** 62)
+        with pytest.raises(RuntimeError, match='could take more than'):
+            client.range(10 ** 9, 10 ** 9 + prime_server.MAX_RANGE)
+        with pytest.raises(RuntimeError, match='larger than'):
+            client.nth(2 ** 62)
+        with pytest.raises(RuntimeError, match='larger than'):
+            client.count(2 ** 62)
+        assert client.count(10) == 4
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(server.path)
+        sock.sendall(LENGTH.pack(2 ** 62))
+        assert b'too large' in sock.recv(1000)
+
+
+def test_concurrent_clients(server):
+    errors = []
+
+    def query(k):
+        try:
+            with PrimeClient(server.path) as client:
+                for i in range(20):
+                    assert client.count(1000 * (k + i)) == prime_count(1000 * (k + i))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=query, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def test_permissions(server):
+    assert os.stat(server.path).st_mode & 0o777 == 0o600
+
+
+def test_default_socket(monkeypatch):
+    directory = tempfile.mkdtemp()
+    try:
+        monkeypatch.setenv('XDG_RUNTIME_DIR', directory)
+        path = os.path.join(prime_server._runtime_directory(), 'primes.sock')
+        monkeypatch.setattr(prime_server, 'DEFAULT_SOCKET', path)
+        server = PrimeServer(path, limit=100)
+        server.server_close()
+        assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+        os.chmod(os.path.dirname(path), 0o755)
+        with pytest.raises(OSError, match='private'):
+            PrimeServer(path, limit=100)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_already_running(server):
+    # Found out before sieving a table that would not even fit in memory
+    with pytest.raises(OSError, match='already listening'):
+        PrimeServer(server.path, limit=10 ** 15)
+    assert os.path.exists(server.path)
+
+
+def test_stale_socket():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'primes.sock')
+    try:
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = PrimeServer(path, limit=100)
+        server.start()
+        with PrimeClient(path) as client:
+            assert np.array_equal(client.range(0, 30), primes(limit=30))
+        server.close()
+        assert not os.path.exists(path)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_main_help(capsys):
+    # The commands are listed in the help of the console script
+    with pytest.raises(SystemExit):
+        main(['--help'])
+    out = capsys.readouterr().out
+    assert "'serve'" in out and "'tune'" in out
+    for command in ('serve', 'tune'):
+        with pytest.raises(SystemExit):
+            main([command, '--help'])
+        assert capsys.readouterr().out.startswith('usage: ' + command)
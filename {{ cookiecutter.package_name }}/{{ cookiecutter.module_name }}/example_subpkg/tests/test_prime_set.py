@@ -0,0 +1,68 @@
+import sys
+
+import numpy as np
+import pytest
+
+from ...example_mod import do_primes, primes
+from ..prime_set import PrimeSet
+
+EXPECTED = primes(limit=100000)
+
+
+@pytest.mark.parametrize(('lo', 'hi'), [(0, 100000), (2, 3), (3, 100000), (1000, 1001),
+                                        (99, 50000), (50, 10)])
+def test_from_range(lo, hi):
+    expected = [p for p in EXPECTED if lo <= p < hi]
+    pset = PrimeSet.from_range(lo, hi, chunk=1000)
+    assert list(pset) == expected
+    assert len(pset) == len(expected)
+    assert np.asarray(pset).tolist() == expected
+    assert list(PrimeSet.from_primes(expected, lo, hi)) == expected
+
+
+def test_contains():
+    pset = PrimeSet.from_range(0, 100000)
+    expected = set(EXPECTED)
+    for value in range(-5, 100010):
+        assert (value in pset) == (value in expected)
+    assert np.int64(99991) in pset
+    assert 7.5 not in pset
+    assert 'seven' not in pset
+
+
+def test_slicing():
+    pset = PrimeSet.from_range(0, 100000)
+    for lo, hi in [(100, 200), (2, 3), (0, 10 ** 6), (77777, 88888), (500, 100)]:
+        assert list(pset[lo:hi]) == [p for p in EXPECTED if lo <= p < hi]
+    assert list(pset[99900:]) == [p for p in EXPECTED if p >= 99900]
+    assert list(pset[:10]) == [2, 3, 5, 7]
+    with pytest.raises(TypeError):
+        pset[3]
+    with pytest.raises(ValueError):
+        pset[::2]
+
+
+def test_memory():
+    pset = PrimeSet.from_range(0, 10 ** 6)
+    assert pset.nbytes == 10 ** 6 // 16
+    assert not pset.bits.flags.writeable
+    # The caller's own bitmap is not made read-only
+    bits = pset.bits.copy()
+    assert PrimeSet(0, 10 ** 6, bits).bits.base is bits
+    assert bits.flags.writeable
+    if np.lib.NumpyVersion(np.__version__) >= '2.0.0':
+        with pytest.raises(ValueError, match='without a copy'):
+            np.asarray(pset, copy=False)
+    if sys.version_info >= (3, 12):
+        assert memoryview(pset).nbytes == pset.nbytes
+
+
+def test_primes_as_set():
+    assert list(primes(1000, as_set=True)) == EXPECTED[:1000]
+    assert list(primes(limit=1000, as_set=True)) == [p for p in EXPECTED if p < 1000]
+    assert len(primes(0, as_set=True)) == 0
+    assert list(do_primes(1000, as_set=True)) == EXPECTED[:1000]
+    assert list(do_primes(2000, start=1000, as_set=True)) == \
+        [p for p in EXPECTED if 1000 <= p < 2000]
+    with pytest.raises(ValueError):
+        do_primes(10, nth=True, as_set=True)
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from ... import example_mod
+from ...example_mod import do_primes, primes
+from ..prime_table import PrimeTable
+
+
+def test_prime_table(tmp_path):
+    table = PrimeTable(str(tmp_path))
+    assert len(table) == 0
+    assert table.primes(10).tolist() == primes(10)
+    assert len(table) == 10
+
+    # Larger requests extend the table from where it ends
+    assert table.primes(5000).tolist() == primes(5000)
+    assert table.primes(0).tolist() == []
+    # Growing requests at least double the table
+    table.primes(5001)
+    assert len(table) == 10000
+    assert isinstance(table.primes(100), np.memmap)
+
+
+def test_prime_table_shared(tmp_path):
+    first = PrimeTable(str(tmp_path))
+    second = PrimeTable(str(tmp_path))
+    second.primes(10)
+    first.primes(1000)
+    # The other instance picks up the extended file instead of sieving again
+    assert second.primes(1000).tolist() == primes(1000)
+    assert len(second) == 1000
+    assert not list(tmp_path.glob('tmp*'))
+
+
+def test_persistent(tmp_path, monkeypatch):
+    monkeypatch.setattr(example_mod, '_prime_table', PrimeTable(str(tmp_path)))
+    assert primes(1000, persistent=True) == primes(1000)
+    assert primes(limit=100, persistent=True) == primes(limit=100)
+    assert do_primes(1000, verbose=False, persistent=True).tolist() == primes(1000)
+    # Another process reads the table instead of sieving again
+    package = __name__.split('.')[0]
+    code = ('import sys; from {0} import example_mod; '
+            'from {0}.example_subpkg.prime_table import PrimeTable; '
+            'example_mod._prime_table = PrimeTable(sys.argv[1]); '
+            'example_mod.iter_prime_chunks = None; '
+            'print(example_mod.do_primes(1000, verbose=False, persistent=True)[-1])'
+            .format(package))
+    output = subprocess.run([sys.executable, '-c', code, str(tmp_path)], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    assert int(output) == 7919
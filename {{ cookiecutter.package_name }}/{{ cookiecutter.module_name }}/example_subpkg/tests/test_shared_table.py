@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import uuid
+
+import numpy as np
+import pytest
+
+from ...example_mod import do_primes, primes
+from .. import shared_table
+from ..prime_table import default_directory
+from ..shared_table import SharedPrimeTable, attach, attached_table, detach
+
+pytestmark = pytest.mark.skipif(shared_table.SharedMemory is None,
+                                reason='multiprocessing.shared_memory requires Python 3.8')
+
+
+@pytest.fixture
+def name():
+    name = 'test_{0}'.format(uuid.uuid4().hex[:12])
+    yield name
+    # The lock file outlives the table, to be reused by its next users
+    lock_path = os.path.join(default_directory(), name + '.lock')
+    if os.path.exists(lock_path):
+        os.remove(lock_path)
+
+
+def _read_table(name, imax, queue):
+    with SharedPrimeTable(name) as table:
+        queue.put((table.refcount, table.primes(imax).tolist(), table.limit))
+
+
+def test_extend(name):
+    with SharedPrimeTable(name) as table:
+        assert len(table) == 0
+        assert table.primes(100).tolist() == primes(100)
+        limit = table.limit
+        assert table.primes_below(limit).tolist() == primes(limit=limit)
+        first = table.primes(10)
+        assert not first.flags.writeable
+        with pytest.raises(ValueError):
+            first[0] = 4
+        assert table.primes_below(10 * limit).tolist() == primes(limit=10 * limit)
+        # Views of the previous version of the table stay valid
+        assert first.tolist() == primes(10)
+        assert table.primes(0).tolist() == []
+
+
+def test_shared(name):
+    with SharedPrimeTable(name) as first, SharedPrimeTable(name) as second:
+        assert first.refcount == second.refcount == 2
+        first.primes(1000)
+        assert second.primes(1000).tolist() == primes(1000)
+        assert second.limit == first.limit
+
+        queue = multiprocessing.get_context().Queue()
+        process = multiprocessing.get_context().Process(
+            target=_read_table, args=(name, 1000, queue))
+        process.start()
+        refcount, found, limit = queue.get(timeout=60)
+        process.join()
+        assert refcount == 3
+        assert found == primes(1000)
+        # The other process did not need to extend the table
+        assert limit == first.limit
+        assert first.refcount == 2
+
+
+def test_cleanup(name):
+    table = SharedPrimeTable(name)
+    table.primes(1000)
+    view = table.primes(1000)
+    other = SharedPrimeTable(name)
+    other.close()
+    other.close()
+    assert table.refcount == 1
+    table.close()
+    assert table.closed
+    assert view.tolist() == primes(1000)
+    # The last handle removed the table, so a new one starts empty
+    with SharedPrimeTable(name) as table:
+        assert len(table) == 0 and table.refcount == 1
+
+
+def test_segments_closed(name):
+    table = SharedPrimeTable(name)
+    view = table.primes(1000)
+    owner = view.base
+    while isinstance(owner, np.ndarray):
+        owner = owner.base
+    segment = owner._segment
+    del owner
+    table.close()
+    del table
+    # The segment stays open for as long as a view of it is alive
+    assert view.tolist() == primes(1000)
+    assert segment.buf is not None
+    del view
+    assert segment.buf is None
+
+
+def test_attach(name):
+    assert attached_table() is None
+    table = attach(name)
+    try:
+        assert attached_table() is table
+        assert primes(50) == primes(limit=230)
+        assert len(table) > 0
+        result = do_primes(200, verbose=False)
+        assert isinstance(result, np.ndarray)
+        assert result.tolist() == primes(200)
+        assert do_primes(200, verbose=False, backend='python') == primes(200)
+    finally:
+        detach()
+    assert attached_table() is None
+    assert table.closed
+    assert shared_table._attached is None
+    assert not os.path.exists(os.path.join('/dev/shm', name))
@@ -0,0 +1,218 @@
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+from ... import example_mod
+from ...example_mod import _backends, do_primes, main, primes
+from .. import tuning
+from ..tuning import DEFAULTS, autotune, cache_sizes, cpu_limit, memory_limit, parse_size
+
+
+@pytest.fixture
+def tuned(monkeypatch):
+    """
+    Lets a test change the settings of the engines, and restores them after.
+    """
+    monkeypatch.setattr(tuning, '_settings', dict(DEFAULTS))
+    return tuning._settings
+
+
+def test_parse_size():
+    assert parse_size('512') == 512
+    assert parse_size('48K') == 48 * 2 ** 10
+    assert parse_size('1.5MB') == 3 * 2 ** 19
+    assert parse_size(' 2g\n') == 2 ** 31
+
+
+def test_cache_sizes(tmp_path):
+    for index, (level, kind, size) in enumerate([('1', 'Data', '48K'),
+                                                 ('1', 'Instruction', '32K'),
+                                                 ('2', 'Unified', '2048K')]):
+        directory = tmp_path / 'index{0}'.format(index)
+        directory.mkdir()
+        (directory / 'level').write_text(level + '\n')
+        (directory / 'type').write_text(kind + '\n')
+        (directory / 'size').write_text(size + '\n')
+    assert cache_sizes(str(tmp_path)) == {'L1d': 48 * 2 ** 10, 'L2': 2 ** 21}
+    assert cache_sizes(str(tmp_path / 'missing')) == tuning.DEFAULT_CACHE_SIZES
+
+
+def test_memory_limit(tmp_path, monkeypatch):
+    path = tmp_path / 'memory.max'
+    monkeypatch.setattr(tuning, 'CGROUP_LIMITS', (str(path),))
+    assert memory_limit() is None
+    path.write_text('max\n')
+    assert memory_limit() is None
+    path.write_text('1073741824\n')
+    assert memory_limit() == 2 ** 30
+
+
+def test_cpu_limit(tmp_path, monkeypatch):
+    path = tmp_path / 'cpu.max'
+    quota, period = tmp_path / 'cpu.cfs_quota_us', tmp_path / 'cpu.cfs_period_us'
+    monkeypatch.setattr(tuning, 'CGROUP_CPU_MAX', str(path))
+    monkeypatch.setattr(tuning, 'CGROUP_CPU_QUOTA', (str(quota), str(period)))
+    assert cpu_limit() is None
+    path.write_text('max 100000\n')
+    assert cpu_limit() is None
+    path.write_text('150000 100000\n')
+    assert cpu_limit() == 1.5
+    # cgroup v1
+    path.unlink()
+    quota.write_text('-1\n')
+    period.write_text('100000\n')
+    assert cpu_limit() is None
+    quota.write_text('200000\n')
+    assert cpu_limit() == 2
+
+
+def test_tuning_path(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path))
+    path = tuning.tuning_path()
+    assert path == os.path.join(str(tmp_path), __name__.split('.')[0], 'tuning.json')
+    monkeypatch.setattr(tuning, '_settings', None)
+    assert tuning.settings() == DEFAULTS
+    # Reading the settings creates nothing
+    assert not os.listdir(str(tmp_path))
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        json.dump({'segment_size': 2 ** 16}, f)
+    assert tuning.settings(reload=True)['segment_size'] == 2 ** 16
+
+
+def test_engines_lazy(tmp_path):
+    # The first calls of the engines neither import astropy nor touch the
+    # configuration directory
+    package = __name__.split('.')[0]
+    code = ('import sys; from {0}.example_mod import do_primes, primes; '
+            'primes(10); do_primes(10, verbose=False); '
+            'print("astropy" in sys.modules)'.format(package))
+    env = dict(os.environ, XDG_CONFIG_HOME=str(tmp_path / 'config'))
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    assert output.strip() == 'False'
+    assert not (tmp_path / 'config').exists()
+
+
+def test_autotune(tuned, monkeypatch):
+    monkeypatch.setattr(tuning, 'memory_limit', lambda: 2 ** 30)
+    settings = autotune(save=False, repeat=1)
+    assert settings['max_memory'] == int(2 ** 30 * tuning.BUDGET_FRACTION)
+    assert tuning.settings() is settings
+    # The engines give the same results with any of the tuned sizes
+    assert primes(10000) == do_primes(10000, verbose=False, backend='python')
+    if _backends['cython'].available:
+        assert do_primes(10000, verbose=False, usecython=True) == primes(10000)
+        assert 2 ** 12 <= settings['segment_bytes'] <= 2 ** 22
+
+
+@pytest.mark.parametrize('usecython', [False, True])
+def test_max_memory(usecython):
+    if usecython and not _backends['cython'].available:
+        pytest.skip('the compiled extension is not available')
+    # Too small for the result, which is found out before sieving
+    with pytest.raises(MemoryError, match='max_memory'):
+        do_primes(10 ** 6, usecython, verbose=False, max_memory=2 ** 20)
+    with pytest.raises(MemoryError, match='max_memory'):
+        do_primes(10 ** 8, usecython, start=0, verbose=False, max_memory=2 ** 20)
+    with pytest.raises(MemoryError, match='max_memory'):
+        primes(limit=10 ** 8, as_set=True, max_memory=2 ** 20)
+
+
+@pytest.mark.parametrize('usecython', [False, True])
+def test_max_memory_peak(tuned, usecython):
+    if usecython and not _backends['cython'].available:
+        pytest.skip('the compiled extension is not available')
+    # Large segments, that have to be shrunk to fit in the budget
+    tuned.update(segment_size=2 ** 22, segment_bytes=2 ** 22, segments_per_thread=8)
+    budget = 8 * 2 ** 20
+    tracemalloc.start()
+    try:
+        result = do_primes(10 ** 5, usecython, verbose=False, max_memory=budget)
+        window = do_primes(10 ** 9 + 10 ** 6, usecython, start=10 ** 9,
+                           verbose=False, max_memory=budget)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak <= budget
+    assert result == primes(10 ** 5)
+    assert window == example_mod.primes_in_range(10 ** 9, 10 ** 9 + 10 ** 6)
+
+
+def test_max_memory_base_primes(tuned):
+    if not _backends['cython'].available:
+        pytest.skip('the compiled extension is not available')
+    # The base primes up to 1e9 would take 400 MB as a table, so they are
+    # streamed instead
+    budget = 8 * 2 ** 20
+    tracemalloc.start()
+    try:
+        window = do_primes(10 ** 18 + 1000, True, start=10 ** 18, verbose=False,
+                           max_memory=budget)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak <= budget
+    assert len(window) == 23 and window[0] == 10 ** 18 + 3
+    # Too small for even the segment they are streamed through
+    with pytest.raises(MemoryError, match='max_memory'):
+        do_primes(10 ** 18 + 1000, True, start=10 ** 18, verbose=False, max_memory=2 ** 14)
+
+
+@pytest.mark.parametrize('name', sorted(_backends))
+def test_max_memory_backends(tuned, name):
+    if name not in example_mod.available_backends():
+        pytest.skip('the {0} engine is not available'.format(name))
+    # Large segments, that every engine has to shrink to fit in the budget
+    tuned.update(segment_size=2 ** 22, segment_bytes=2 ** 22, segments_per_thread=8)
+    budget = 8 * 2 ** 20
+    assert do_primes(10 ** 5, verbose=False, backend=name, workers=2,
+                     max_memory=budget) == primes(10 ** 5)
+
+
+def test_parallel_budget(monkeypatch):
+    # The budget left by the result is divided between the workers, in
+    # tasks small enough for their share
+    tasks = []
+
+    class Executor:
+        def map(self, function, *args):
+            tasks.extend(zip(*args))
+            return map(function, *args)
+
+    monkeypatch.setattr(example_mod, '_get_executor', lambda workers: Executor())
+    budget = 16 * 2 ** 20
+    result = example_mod._parallel_primes(2, 10 ** 6, 4, imax=1000, max_memory=budget)
+    assert result == primes(1000)
+    share = (budget - example_mod._BYTES_PER_PRIME['parallel'] * 1000) // 4
+    assert len(tasks) > 1 and all(task[-1] == share for task in tasks)
+    with pytest.raises(MemoryError):
+        example_mod._parallel_primes(2, 10 ** 6, 4, max_memory=2 ** 20)
+
+
+def test_default_budget(tuned):
+    tuned['max_memory'] = 2 ** 20
+    with pytest.raises(MemoryError):
+        primes(10 ** 6)
+    assert primes(10 ** 6, max_memory=2 ** 27) == do_primes(10 ** 6, verbose=False,
+                                                            max_memory=2 ** 27)
+
+
+def test_main_max_memory(capsys):
+    with pytest.raises(MemoryError):
+        main(['--max-memory', '1M', '1000000'])
+    main(['--max-memory', '64M', '1000'])
+    assert 'Found 1000 prime numbers' in capsys.readouterr().out
+    # Checked by the parser, along with the options it doesn't apply to
+    for args in (['--max-memory', '64Q', '1000'],
+                 ['--max-memory', '64M', '--output', 'primes.npy', '1000']):
+        with pytest.raises(SystemExit):
+            main(args)
+    assert 'usage' in capsys.readouterr().err
+    with pytest.raises(MemoryError):
+        main(['--benchmark', '--backends', 'python', '--repeat', '1',
+              '--max-memory', '1M', '1000000'])
@@ -0,0 +1,248 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Machine-specific tuning of the prime engines.
+
+`autotune` reads the sizes of the CPU caches, times the engines with a few
+segment sizes around them, and saves the fastest settings to a JSON file.
+The engines read that file the first time they run, and use the defaults
+below until it exists. On a host with a memory limit (a container, or a
+cgroup), `autotune` also sets the default memory budget of the engines to a
+fraction of that limit, so that a request too large for it fails with a
+`MemoryError` instead of getting the process killed.
+"""
+
+import json
+import os
+
+__all__ = ['DEFAULTS', 'cache_sizes', 'memory_limit', 'cpu_limit', 'parse_size',
+           'settings', 'tuning_path', 'autotune']
+
+CPU_CACHE_DIR = '/sys/devices/system/cpu/cpu0/cache'
+
+# Sizes of the caches assumed when they can't be read
+DEFAULT_CACHE_SIZES = {'L1d': 32 * 2 ** 10, 'L2': 256 * 2 ** 10}
+
+# The cgroup v2 and v1 files holding the memory limit of the process
+CGROUP_LIMITS = ('/sys/fs/cgroup/memory.max',
+                 '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+# The cgroup v2 file holding the CPU quota and period of the process, and
+# the cgroup v1 files holding them separately
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_CPU_QUOTA = ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us',
+                    '/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+
+# The fraction of the memory limit of the host used as the default budget
+BUDGET_FRACTION = 0.75
+
+DEFAULTS = {
+    # Odd numbers per segment of the pure Python sieve, one byte each
+    'segment_size': 2 ** 18,
+    # Bytes per segment of the compiled sieve, one bit per odd number
+    'segment_bytes': 2 ** 15,
+    # Segments sieved by each thread of the compiled sieve at a time
+    'segments_per_thread': 4,
+    # Default memory budget of the engines, in bytes, or None
+    'max_memory': None,
+}
+
+_UNITS = {'': 1, 'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+_settings = None
+
+
+def parse_size(text):
+    """
+    Parses a size in bytes with an optional binary suffix, like ``512K`` or
+    ``4G``.
+    """
+    text = str(text).strip().upper()
+    if text.endswith('B'):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in _UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def cache_sizes(path=CPU_CACHE_DIR):
+    """
+    Returns the sizes of the data caches of the first CPU, in bytes.
+
+    Returns
+    -------
+    sizes: dict
+        The sizes keyed by cache name: ``'L1d'``, ``'L2'`` and so on. The
+        L1 and L2 sizes fall back to `DEFAULT_CACHE_SIZES` if they can't be
+        read, which is the case on platforms other than Linux.
+    """
+    sizes = dict(DEFAULT_CACHE_SIZES)
+    try:
+        entries = sorted(os.listdir(path))
+    except OSError:
+        return sizes
+    for entry in entries:
+        if not entry.startswith('index'):
+            continue
+        try:
+            with open(os.path.join(path, entry, 'level')) as f:
+                level = f.read().strip()
+            with open(os.path.join(path, entry, 'type')) as f:
+                kind = f.read().strip()
+            with open(os.path.join(path, entry, 'size')) as f:
+                size = parse_size(f.read())
+        except (OSError, ValueError):
+            continue
+        if kind == 'Instruction':
+            continue
+        sizes['L' + level + ('d' if kind == 'Data' else '')] = size
+    return sizes
+
+
+def memory_limit():
+    """
+    Returns the memory limit of this process's cgroup in bytes, or `None` if
+    there is none.
+    """
+    for path in CGROUP_LIMITS:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == 'max':
+            return None
+        limit = int(value)
+        # cgroup v1 reports a huge number when there is no limit
+        return limit if limit < 2 ** 60 else None
+    return None
+
+
+def cpu_limit():
+    """
+    Returns the CPU quota of this process's cgroup as a number of CPUs, which
+    may be fractional, or `None` if there is none.
+    """
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            with open(CGROUP_CPU_QUOTA[0]) as f:
+                quota = f.read().strip()
+            with open(CGROUP_CPU_QUOTA[1]) as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+    if quota in ('max', '-1'):
+        return None
+    return int(quota) / int(period)
+
+
+def tuning_path():
+    """
+    Returns the path of the tuning file, in the package's directory of the
+    user configuration directory: ``$XDG_CONFIG_HOME``, or ``~/.config``.
+
+    This is called by the engines the first time they run, so it neither
+    imports astropy nor creates the directory; `autotune` does the latter.
+    """
+    config = os.environ.get('XDG_CONFIG_HOME') or os.path.join(
+        os.path.expanduser('~'), '.config')
+    return os.path.join(config, __name__.split('.')[0], 'tuning.json')
+
+
+def settings(reload=False):
+    """
+    Returns the settings of the engines: the `DEFAULTS`, updated with those
+    saved by `autotune`.
+    """
+    global _settings
+    if _settings is None or reload:
+        result = dict(DEFAULTS)
+        try:
+            with open(tuning_path()) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        result.update((key, value) for key, value in saved.items() if key in DEFAULTS)
+        _settings = result
+    return _settings
+
+
+def _best(candidates, run, repeat):
+    from time import perf_counter
+
+    timings = {}
+    for candidate in candidates:
+        best = float('inf')
+        for _ in range(repeat):
+            start = perf_counter()
+            run(candidate)
+            best = min(best, perf_counter() - start)
+        timings[candidate] = best
+    return min(timings, key=timings.get)
+
+
+def autotune(save=True, repeat=3):
+    """
+    Picks the segment sizes of the engines from the CPU cache sizes and a
+    short benchmark, and the default memory budget from the memory limit.
+
+    This takes a few seconds. Segment sizes around the L1 and L2 cache
+    sizes are timed on a range of a few million numbers near 1e9, and the
+    fastest ones are kept.
+
+    Parameters
+    ----------
+    save: bool, optional
+        Save the settings to the tuning file, so that they are used by all
+        later processes, and not only by this one.
+    repeat: int, optional
+        The number of timings of each candidate, of which the best is kept.
+
+    Returns
+    -------
+    settings: dict
+        The new settings.
+    """
+    global _settings
+    from ..example_mod import _backends, _iter_flags
+
+    caches = cache_sizes()
+    l1, l2 = caches['L1d'], caches['L2']
+    result = dict(DEFAULTS)
+    lo = 10 ** 9 + 1
+
+    def clip(sizes, smallest, largest):
+        return sorted({min(max(size, smallest), largest) for size in sizes})
+
+    def run_python(size):
+        for _ in _iter_flags(lo, lo + 2 ** 22, size):
+            pass
+
+    result['segment_size'] = _best(clip([l1, l2 // 2, l2, 2 * l2], 2 ** 12, 2 ** 22),
+                                   run_python, repeat)
+
+    if _backends['cython'].available:
+        from ..example_c import sieve
+
+        def run_compiled(options):
+            sieve(lo, lo + 2 ** 26, segment_bytes=options[0],
+                  segments_per_thread=options[1])
+
+        sizes = clip([l1 // 2, l1, l2 // 4, l2 // 2, l2], 2 ** 12, 2 ** 22)
+        size, _ = _best([(size, 4) for size in sizes], run_compiled, repeat)
+        _, count = _best([(size, count) for count in (1, 2, 4, 8)], run_compiled, repeat)
+        result['segment_bytes'], result['segments_per_thread'] = size, count
+
+    limit = memory_limit()
+    if limit is not None:
+        result['max_memory'] = int(limit * BUDGET_FRACTION)
+
+    if save:
+        path = tuning_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(dict(result, cache_sizes=caches), f, indent=2)
+        os.replace(path + '.tmp', path)
+    _settings = result
+    return result
@@ -0,0 +1,85 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+import os
+
+from setuptools import Extension
+from extension_helpers import add_openmp_flags_if_available
+
+ROOT = os.path.relpath(os.path.dirname(__file__))
+
+# The primes below this limit are computed here, at build time, and compiled
+# into the extension as constant tables.
+SMALL_PRIME_LIMIT = 2 ** 16
+
+SMALL_PRIMES_HEADER = 'small_primes.h'
+
+
+def _small_primes_source(limit):
+    """
+    Returns the C source of the tables of the primes below ``limit``: their
+    list, as 64-bit integers, and an odd-only bitmap in which bit ``i`` stands
+    for ``2 * i + 1``, in the layout of the sieve segments.
+    """
+    flags = bytearray([1]) * limit
+    flags[:2] = b'\x00\x00'
+    for p in range(2, int((limit - 1) ** 0.5) + 1):
+        if flags[p]:
+            flags[p * p::p] = bytes(len(range(p * p, limit, p)))
+    primes = [n for n in range(limit) if flags[n]]
+
+    words = [0] * ((limit // 2 + 63) // 64)
+    for p in primes[1:]:
+        i = p >> 1
+        words[i >> 6] |= 1 << (i & 63)
+
+    def rows(values, width, per_row):
+        items = ['{0:>{1}}'.format(value, width) for value in values]
+        return ',\n'.join('    ' + ', '.join(items[i:i + per_row])
+                          for i in range(0, len(items), per_row))
+
+    return '\n'.join([
+        '/* Generated by setup_package.py at build time, do not edit. */',
+        '#include <stdint.h>',
+        '',
+        '#define EXAMPLE_SMALL_PRIME_LIMIT {0}'.format(limit),
+        '#define EXAMPLE_SMALL_PRIME_COUNT {0}'.format(len(primes)),
+        '',
+        'static const int64_t example_small_primes[{0}] = '.format(len(primes)) + '{',
+        rows(primes, 5, 12),
+        '};',
+        '',
+        'static const uint64_t example_small_prime_bits[{0}] = '.format(len(words)) + '{',
+        rows(['0x{0:016x}ULL'.format(word) for word in words], 0, 4),
+        '};',
+        ''])
+
+
+def _write_small_primes(path, limit=SMALL_PRIME_LIMIT):
+    source = _small_primes_source(limit)
+    try:
+        with open(path) as f:
+            if f.read() == source:
+                # Leave the file alone, so that the extension isn't rebuilt
+                return
+    except OSError:
+        pass
+    with open(path, 'w') as f:
+        f.write(source)
+
+
+def get_extensions():
+    # The prime sieve kernel uses prange, so it is built with OpenMP when the
+    # compiler supports it and falls back to running serially otherwise.
+    # Its instrumentation is only compiled in if EXAMPLE_STATS=1 is set in the
+    # environment.
+    define_macros = []
+    if os.environ.get('EXAMPLE_STATS') == '1':
+        define_macros.append(('EXAMPLE_STATS', '1'))
+    header = os.path.join(ROOT, SMALL_PRIMES_HEADER)
+    _write_small_primes(header)
+    extension = Extension('{{ cookiecutter.module_name }}.example_c',
+                          [os.path.join(ROOT, 'example_c.pyx')],
+                          include_dirs=[ROOT],
+                          depends=[header],
+                          define_macros=define_macros)
+    add_openmp_flags_if_available(extension)
+    return [extension]
@@ -1,7 +1,143 @@
+import pytest
 {% if cookiecutter.use_compiled_extensions == 'y' %}
+
 def test_primes_c():
     from ..example_c import primes as primes_c
     assert primes_c(10) == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+
+
+def test_primes_c_parity():
+    from ..example_mod import primes
+    from ..example_c import primes as primes_c
+    for imax in (0, 1, 5, 6, 1229, 100000):
+        assert primes_c(imax) == primes(imax)
+
+
+def test_sieve_c():
+    from ..example_mod import primes
+    from ..example_c import sieve
+    expected = primes(limit=3 * 10 ** 6)
+    for num_threads in (1, 3):
+        assert sieve(0, 3 * 10 ** 6, num_threads=num_threads).tolist() == expected
+    window = sieve(10 ** 6 + 1, 2 * 10 ** 6 + 7).tolist()
+    assert window == [p for p in expected if 10 ** 6 + 1 <= p < 2 * 10 ** 6 + 7]
+
+
+def test_sieve_out_c():
+    import numpy as np
+    from array import array
+    from ..example_c import primes as primes_c, sieve, sieve_size
+    expected = sieve(0, 3 * 10 ** 6)
+    size = sieve_size(0, 3 * 10 ** 6)
+    assert size == len(expected)
+    for num_threads in (1, 3):
+        out = np.zeros(size + 5, dtype=np.int64)
+        assert sieve(0, 3 * 10 ** 6, num_threads=num_threads, out=out) == size
+        assert np.array_equal(out[:size], expected) and not out[size:].any()
+    # imax stops in the middle of a segment and of a batch
+    for imax in (0, 1, 1000, 100000, size):
+        out = np.zeros(imax, dtype=np.int64)
+        assert sieve(0, 3 * 10 ** 6, imax, out=out) == imax
+        assert np.array_equal(out, expected[:imax])
+    lo, hi = 10 ** 6 + 1, 2 * 10 ** 6 + 7
+    buffer = array('q', bytes(8 * sieve_size(lo, hi)))
+    assert sieve(lo, hi, out=memoryview(buffer)) == len(buffer)
+    assert buffer.tolist() == sieve(lo, hi).tolist()
+    out = np.empty(1000, dtype=np.int64)
+    assert primes_c(1000, out=out) == 1000
+    assert out.tolist() == primes_c(1000)
+    with pytest.raises(ValueError, match='too small'):
+        sieve(0, 3 * 10 ** 6, out=np.empty(size - 1, dtype=np.int64))
+    with pytest.raises(ValueError, match='fewer than imax'):
+        primes_c(1000, out=np.empty(999, dtype=np.int64))
+    with pytest.raises(ValueError):
+        sieve(0, 100, out=np.empty(100, dtype=np.int32))
+
+
+def test_sieve_large_c():
+    import numpy as np
+    from ..example_mod import primes_in_range
+    from ..example_c import is_prime, sieve
+    # The base primes of a short window of large numbers are streamed
+    # instead of being tabulated up to sqrt(hi)
+    lo = 10 ** 18
+    window = primes_in_range(lo, lo + 1000)
+    assert len(window) == 23 and window[0] == lo + 3 and window[-1] == lo + 997
+    assert is_prime(np.arange(lo, lo + 1000)).sum() == 23
+    assert sieve(2 ** 62, 2 ** 62 + 1000).size == 32
+    for lo, hi in ((3, 10 ** 6), (10 ** 12, 10 ** 12 + 10 ** 5)):
+        assert np.array_equal(sieve(lo, hi, base_bytes=0), sieve(lo, hi))
+
+
+def test_small_primes_c():
+    import numpy as np
+    from ..example_mod import _small_primes
+    from ..example_c import SMALL_PRIMES, is_prime, prime_count, primes, sieve
+    expected = _small_primes(2 ** 16)
+    assert SMALL_PRIMES.tolist() == expected
+    assert not SMALL_PRIMES.flags.writeable
+    # Queries answered from the compiled table, and just past it
+    assert primes(len(expected)) == expected
+    assert primes(len(expected) + 1)[-1] == 65537
+    assert sieve(-5, 2 ** 16).tolist() == expected
+    assert sieve(100, 200, imax=3).tolist() == [101, 103, 107]
+    assert sieve(2 ** 16 - 100, 2 ** 16 + 50).tolist() == [
+        65437, 65447, 65449, 65479, 65497, 65519, 65521, 65537, 65539, 65543, 65551,
+        65557, 65563, 65579, 65581]
+    out = np.zeros(10, dtype=np.int64)
+    assert sieve(0, 30, out=out) == 10
+    assert out.tolist() == expected[:10]
+    with pytest.raises(ValueError, match='too small'):
+        sieve(0, 100, out=out)
+    assert [prime_count(x) for x in (-1, 0, 2, 100, 2 ** 16 - 1, 2 ** 16)] == \
+        [0, 0, 1, 25, len(expected), len(expected)]
+    values = np.arange(2 ** 16 + 10)
+    assert np.flatnonzero(is_prime(values[:2 ** 16])).tolist() == expected
+    assert np.flatnonzero(is_prime(values)).tolist() == expected + [65537, 65539, 65543]
+
+
+def test_iter_prime_chunks_c():
+    import numpy as np
+    from ..example_mod import iter_prime_chunks, primes
+    chunks = list(iter_prime_chunks(10, 10 ** 6, chunk=10 ** 4, usecython=True))
+    assert len(chunks) > 1
+    assert np.concatenate(chunks).tolist() == [p for p in primes(limit=10 ** 6) if p >= 10]
+
+
+def test_do_primes_as_set_c():
+    from ..example_mod import do_primes, primes
+    expected = primes(limit=3 * 10 ** 6)
+    assert list(do_primes(len(expected), usecython=True, as_set=True)) == expected
+    window = do_primes(2 * 10 ** 6 + 7, usecython=True, start=10 ** 6 + 1, as_set=True)
+    assert list(window) == [p for p in expected if 10 ** 6 + 1 <= p < 2 * 10 ** 6 + 7]
+
+
+def test_profile_c():
+    from ..example_c import STATS_ENABLED
+    from ..example_mod import do_primes
+    result, stats = do_primes(100000, usecython=True, profile=True)
+    assert len(result) == 100000
+    # The counters are compiled out of the kernel unless it was built with
+    # EXAMPLE_STATS=1.
+    assert (stats.segments > 0) == STATS_ENABLED
+    assert ('sieve' in stats.phases) == STATS_ENABLED
+
+
+def test_backends_c():
+    from ..example_mod import available_backends, do_primes, primes
+    assert 'cython' in available_backends()
+    assert do_primes(100000, backend='cython') == primes(100000)
+
+
+def test_do_primes_workers_c():
+    from ..example_mod import do_primes, primes
+    assert do_primes(200000, usecython=True, workers=2) == primes(200000)
+
+
+def test_aprimes_c():
+    import asyncio
+    from ..example_mod import aprimes, primes
+    assert asyncio.run(aprimes(200000, usecython=True, workers=2)) == primes(200000)
 {% endif %}
 
 def test_primes():
@@ -9,6 +145,308 @@ def test_primes():
     assert primes(10) == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
 
 
+def _trial_division_primes(imax):
+    # The algorithm used by primes() before it was switched to a sieve
+    from itertools import takewhile
+    result = []
+    n = 2
+    while len(result) < imax:
+        if all(n % p for p in takewhile(lambda p: p * p <= n, result)):
+            result.append(n)
+        n += 1
+    return result
+
+
+def test_primes_parity():
+    from ..example_mod import primes
+    expected = _trial_division_primes(10000)
+    for imax in (0, 1, 2, 5, 6, 100, 1229, 10000):
+        assert primes(imax) == expected[:imax]
+
+
+def test_primes_limit():
+    from ..example_mod import primes
+    assert primes(limit=30) == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    assert primes(limit=2) == []
+    assert len(primes(limit=10 ** 6)) == 78498
+
+
+def test_primes_segments():
+    from ..example_mod import _iter_segments, _small_primes
+    expected = _small_primes(10 ** 5)
+    for start in (2, 3, 1000, 1009):
+        flat = [p for segment in _iter_segments(start, 10 ** 5, segment_size=64)
+                for p in segment]
+        assert flat == [p for p in expected if p >= start]
+
+
+def test_iter_primes():
+    from itertools import islice
+    from ..example_mod import iter_primes, primes
+    expected = primes(limit=10 ** 5)
+    assert list(islice(iter_primes(), 1000)) == expected[:1000]
+    assert list(iter_primes(1000, 10 ** 5, chunk=100)) == [p for p in expected if p >= 1000]
+    assert list(iter_primes(2, 3)) == [2]
+    assert list(iter_primes(24, 29)) == []
+
+
+def test_iter_prime_chunks():
+    import numpy as np
+    from ..example_mod import iter_prime_chunks, primes
+    expected = primes(limit=10 ** 5)
+    chunks = list(iter_prime_chunks(stop=10 ** 5, chunk=1000))
+    assert len(chunks) > 1
+    assert np.concatenate(chunks).tolist() == expected
+    assert np.concatenate(list(iter_prime_chunks(2, 3))).tolist() == [2]
+
+
+def test_prime_count():
+    from ..example_mod import prime_count, _legendre_prime_count, primes
+    expected = primes(limit=10 ** 5 + 1)
+    for x in (0, 1, 2, 3, 10, 100, 1000, 7919, 7920, 65537, 10 ** 5):
+        count = sum(1 for p in expected if p <= x)
+        assert prime_count(x) == count
+        assert _legendre_prime_count(x) == count
+    assert prime_count(10 ** 9) == 50847534
+    assert _legendre_prime_count(10 ** 9) == 50847534
+
+
+def test_is_prime():
+    import numpy as np
+    from ..example_mod import is_prime, _is_prime_python, primes
+    values = np.arange(-10, 2 * 10 ** 5)
+    expected = np.isin(values, primes(limit=2 * 10 ** 5))
+    for func in (is_prime, _is_prime_python):
+        assert np.array_equal(func(values), expected)
+        assert np.array_equal(func(values.reshape(-1, 10)), expected.reshape(-1, 10))
+
+    # Large primes, Carmichael numbers and strong pseudoprimes to small bases
+    large = np.array([2 ** 61 - 1, 2 ** 64 - 59, 2147483647, 561, 3215031751,
+                      3825123056546413051, 2 ** 64 - 1, 2 ** 62 + 1], dtype=np.uint64)
+    expected = [True, True, True, False, False, False, False, False]
+    for func in (is_prime, _is_prime_python):
+        assert func(large).tolist() == expected
+    assert is_prime(7919) and not is_prime(7917)
+    for func in (is_prime, _is_prime_python):
+        assert func([]).tolist() == []
+    with pytest.raises(TypeError):
+        is_prime([1.5])
+
+
+def test_smallest_prime_factors():
+    from ..example_mod import (smallest_prime_factors,
+                               _smallest_prime_factors_python)
+    for func in (smallest_prime_factors, _smallest_prime_factors_python):
+        spf = func(10 ** 5)
+        assert spf.dtype.name == 'uint32'
+        assert spf[:10].tolist() == [0, 0, 2, 3, 2, 5, 2, 7, 2, 3]
+        assert spf[7919] == 7919 and spf[7917] == 3 and spf[99991 * 1] == 99991
+        assert spf[97 * 89] == 89
+
+
+def test_factorize():
+    import numpy as np
+    from ..example_mod import factorize, _factorize_python
+    values = np.array([0, 1, 2, 12, 97, 360, 2 ** 40, 600851475143,
+                       2 ** 61 - 1, (2 ** 31 - 1) * (2 ** 31 - 1),
+                       1000000007 * 998244353, 2 ** 64 - 1], dtype=np.uint64)
+    expected = [[], [], [(2, 1)], [(2, 2), (3, 1)], [(97, 1)],
+                [(2, 3), (3, 2), (5, 1)], [(2, 40)],
+                [(71, 1), (839, 1), (1471, 1), (6857, 1)], [(2 ** 61 - 1, 1)],
+                [(2 ** 31 - 1, 2)], [(998244353, 1), (1000000007, 1)],
+                [(3, 1), (5, 1), (17, 1), (257, 1), (641, 1), (65537, 1), (6700417, 1)]]
+    for func in (factorize, _factorize_python):
+        for limit in (2 ** 22, 1000):
+            offsets, factors, exponents = func(values, limit)
+            assert exponents.dtype.name == 'uint8'
+            result = [list(zip(factors[a:b].tolist(), exponents[a:b].tolist()))
+                      for a, b in zip(offsets[:-1], offsets[1:])]
+            assert result == expected
+
+    values = np.arange(2, 20000)
+    offsets, factors, exponents = factorize(values)
+    products = [np.prod(factors[a:b].astype(float) ** exponents[a:b])
+                for a, b in zip(offsets[:-1], offsets[1:])]
+    assert np.array_equal(products, values)
+    for func in (factorize, _factorize_python):
+        offsets, factors, exponents = func([], 1000)
+        assert offsets.tolist() == [0] and factors.size == exponents.size == 0
+    with pytest.raises(ValueError):
+        factorize([-1])
+
+
+def test_primes_in_range():
+    from ..example_mod import primes_in_range, _sieve_range, primes
+    expected = primes(limit=10 ** 5)
+    assert primes_in_range(1000, 10 ** 5) == [p for p in expected if p >= 1000]
+    assert _sieve_range(1000, 10 ** 5) == [p for p in expected if p >= 1000]
+    assert primes_in_range(0, 10) == [2, 3, 5, 7]
+    assert primes_in_range(24, 29) == []
+    # Only the window is sieved, far away from 2
+    window = [10 ** 12 + 39, 10 ** 12 + 61, 10 ** 12 + 63, 10 ** 12 + 91]
+    assert primes_in_range(10 ** 12, 10 ** 12 + 100) == window
+    assert _sieve_range(10 ** 12, 10 ** 12 + 100) == window
+
+
+def test_nth_prime():
+    from ..example_mod import nth_prime, primes
+    expected = primes(20000)
+    for n in (1, 2, 5, 6, 7, 100, 1229, 1230, 9592, 20000):
+        assert nth_prime(n) == expected[n - 1]
+    assert nth_prime(10 ** 7) == 179424673
+    with pytest.raises(ValueError):
+        nth_prime(0)
+
+
+def test_do_primes_modes():
+    from ..example_mod import do_primes
+    assert do_primes(100, start=50) == [53, 59, 61, 67, 71, 73, 79, 83, 89, 97]
+    assert do_primes(100, start=50, workers=2) == [53, 59, 61, 67, 71, 73, 79, 83, 89, 97]
+    assert do_primes(100, nth=True) == [541]
+
+
+def test_prime_cache():
+    from ..example_mod import PrimeCache, primes
+    cache = PrimeCache(segment_size=1000)
+    expected = primes(5000)
+    assert cache.primes(100) == expected[:100]
+    assert cache.stats['misses'] == 1
+    assert cache.primes(50) == expected[:50]
+    assert cache.stats['hits'] == 1
+    # Growing requests only sieve past the end of the table
+    assert cache.primes(5000) == expected
+    misses = cache.misses
+    assert cache.primes(5000) == expected
+    assert cache.misses == misses
+
+
+def test_prime_cache_eviction():
+    from ..example_mod import PrimeCache, primes
+    cache = PrimeCache(max_bytes=4000, segment_size=1000)
+    expected = primes(5000)
+    assert cache.primes(5000) == expected
+    assert cache.nbytes <= 4000
+    assert cache.evictions > 0
+    # Evicted segments are sieved again when they are needed
+    assert cache.primes(5000) == expected
+    assert cache.nbytes <= 4000
+
+
+def test_do_primes_workers():
+    from ..example_mod import do_primes, primes
+    expected = primes(200000)
+    assert do_primes(200000, workers=2) == expected
+    # The second call reuses the pool started by the first one
+    assert do_primes(10, workers=2) == expected[:10]
+
+
+def test_aprimes():
+    import asyncio
+    from ..example_mod import aprimes, do_primes, primes
+    assert asyncio.run(aprimes(100000, workers=2)) == primes(100000)
+    # start has the same meaning as in do_primes
+    window = do_primes(10 ** 6 + 200, start=10 ** 6, verbose=False)
+    assert asyncio.run(aprimes(10 ** 6 + 200, start=10 ** 6, max_pending=1)) == window
+    assert asyncio.run(aprimes(10, start=10 ** 6)) == []
+
+
+def test_aiter_prime_chunks():
+    import asyncio
+    from ..example_mod import aiter_prime_chunks, primes
+
+    async def collect(chunks):
+        return [p async for found in chunks for p in found.tolist()]
+
+    chunks = aiter_prime_chunks(10, 10 ** 6, chunk=10 ** 4, workers=2, max_pending=3)
+    expected = [p for p in primes(limit=10 ** 6) if p >= 10]
+    assert asyncio.run(collect(chunks)) == expected
+
+
+def test_aiter_prime_chunks_cancel():
+    import asyncio
+    from ..example_mod import aiter_prime_chunks
+
+    async def consume():
+        async for found in aiter_prime_chunks(chunk=2 ** 14, workers=2, max_pending=2):
+            pass
+
+    async def cancel_later():
+        task = asyncio.ensure_future(consume())
+        # The event loop keeps running other coroutines while the sieve is busy
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+        assert not task.done()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_later())
+
+
+def test_backends():
+    from ..example_mod import available_backends, do_primes, primes
+    expected = primes(1000)
+    assert {'python', 'numpy', 'parallel'} <= set(available_backends())
+    for name in available_backends():
+        assert do_primes(1000, backend=name, workers=2) == expected
+    assert do_primes(100, start=50, backend='numpy') == [53, 59, 61, 67, 71, 73, 79, 83, 89, 97]
+    # Whether the compiled extension is there or not
+    assert do_primes(1000, usecython=True) == expected
+    with pytest.raises(ValueError, match='unknown backend'):
+        do_primes(10, backend='fortran')
+
+
+def test_backend_auto():
+    from ..example_mod import (_available_cpus, _executors, available_backends,
+                               calibrate_backends, choose_backend, do_primes, primes)
+    pools = set(_executors)
+    calibration = calibrate_backends(sizes=(100, 1000), repeat=1)
+    # Calibrating never starts a worker pool
+    assert set(_executors) == pools
+    expected = set(available_backends())
+    if (_available_cpus(), False) not in pools:
+        expected.discard('parallel')
+    assert set(calibration) == expected
+    for overhead, per_prime in calibration.values():
+        assert overhead >= 0 and per_prime >= 0
+    assert choose_backend(10 ** 6) in available_backends()
+    assert do_primes(1000, backend='auto') == primes(1000)
+
+
+def test_register_backend():
+    from ..example_mod import (Backend, _calibration, available_backends, choose_backend,
+                               do_primes, primes, register_backend, unregister_backend)
+    calls = []
+
+    def trial_division(n, workers, max_memory):
+        calls.append(n)
+        return _trial_division_primes(n)
+
+    def missing():
+        import a_module_that_does_not_exist  # noqa: F401
+
+    register_backend(Backend('trial', trial_division, speedup=1e-9))
+    register_backend(Backend('missing', trial_division, probe=missing))
+    try:
+        with pytest.raises(ValueError, match='already registered'):
+            register_backend(Backend('trial', trial_division))
+        assert 'trial' in available_backends()
+        assert 'missing' not in available_backends()
+        assert do_primes(100, backend='trial') == primes(100)
+        assert calls == [100]
+        # Unavailable engines fall back to pure Python
+        assert do_primes(100, backend='missing') == primes(100)
+        assert calls == [100]
+        assert choose_backend(10 ** 6) != 'trial'
+        assert 'trial' in _calibration
+    finally:
+        unregister_backend('trial')
+        unregister_backend('missing')
+    assert 'trial' not in available_backends() and 'trial' not in _calibration
+    with pytest.raises(ValueError, match='no backend'):
+        unregister_backend('trial')
+
+
 def test_deprecation():
     import warnings
     warnings.warn(
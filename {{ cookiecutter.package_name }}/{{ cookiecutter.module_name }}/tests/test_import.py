@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+import pytest
+
+# Upper limit on the time taken by ``import {{ cookiecutter.module_name }}``
+IMPORT_BUDGET = 0.1
+
+# Modules that must only be imported once they are needed
+HEAVY_MODULES = ('astropy', 'numpy', 'pytest', 'setuptools_scm')
+
+
+def _import_times(module):
+    # -X importtime writes one line per imported module to stderr, in the form
+    # "import time: <self us> | <cumulative us> | <indented module name>".
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative) * 1e-6
+    return times
+
+
+def test_import_time():
+    package = __name__.split('.')[0]
+    times = _import_times(package)
+    heavy = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES)
+    assert not heavy
+    assert times[package] < IMPORT_BUDGET
+
+
+def test_lazy_attributes():
+    import {{ cookiecutter.module_name }}
+    assert isinstance({{ cookiecutter.module_name }}.__version__, str)
+    assert callable({{ cookiecutter.module_name }}.test)
+    assert 'test' in dir({{ cookiecutter.module_name }})
+{%- if cookiecutter.include_example_code == 'y' %}
+    from ..example_mod import do_primes
+    assert {{ cookiecutter.module_name }}.do_primes is do_primes
+{%- endif %}
+    with pytest.raises(AttributeError):
+        {{ cookiecutter.module_name }}.missing
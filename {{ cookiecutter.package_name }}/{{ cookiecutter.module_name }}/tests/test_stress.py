@@ -0,0 +1,196 @@
+"""
+Differential stress tests of the prime engines, and a throughput gate.
+
+These tests are slow, so they only run when selected with ``pytest -m slow``.
+Every engine is cross-checked against a plain reference sieve for random
+limits and windows up to 1e9, and the throughput of each backend is compared
+with a stored baseline. They are configured with environment variables:
+
+``STRESS_SEED``
+    The seed of the random limits, which is otherwise random and printed
+    when a test fails.
+``STRESS_BASELINE``
+    A JSON file holding the baseline throughputs. If it does not exist, the
+    measured throughputs are stored in it and the gate passes. Without it,
+    the baseline is kept in the pytest cache.
+``STRESS_TOLERANCE``
+    The drop below the baseline throughput, in percent, at which the gate
+    fails. Defaults to 25.
+``STRESS_UPDATE_BASELINE``
+    If set to 1, store the measured throughputs as the new baseline.
+"""
+
+import json
+import os
+import random
+from time import perf_counter
+
+import numpy as np
+import pytest
+
+from ..example_mod import (PrimeCache, _backends, _legendre_prime_count,
+                           _nth_prime_upper_bound, available_backends, do_primes,
+                           is_prime, isqrt, nth_prime, prime_count)
+
+pytestmark = pytest.mark.slow
+
+SEED = int(os.environ.get('STRESS_SEED', random.randrange(2 ** 32)))
+
+# The largest integer covered by the random windows
+MAX_VALUE = 10 ** 9
+
+# The largest number of primes requested from the engines that list all of
+# the primes from 2
+MAX_PRIMES = 2 * 10 ** 6
+
+# The number of primes generated by each backend to measure its throughput
+THROUGHPUT_PRIMES = 10 ** 6
+
+
+def _reference_primes(lo, hi):
+    """
+    Returns the primes in ``[lo, hi)`` with a plain sieve of the whole window,
+    which shares no code with the engines under test.
+    """
+    lo = max(lo, 0)
+    root = isqrt(max(hi - 1, 0))
+    base = np.ones(root + 1, dtype=bool)
+    base[:2] = False
+    for p in range(2, isqrt(root) + 1):
+        if base[p]:
+            base[p * p::p] = False
+    flags = np.ones(max(hi - lo, 0), dtype=bool)
+    flags[:max(0, 2 - lo)] = False
+    for p in np.flatnonzero(base).tolist():
+        first = max(p * p, (lo + p - 1) // p * p)
+        flags[first - lo::p] = False
+    return lo + np.flatnonzero(flags)
+
+
+@pytest.fixture
+def rng():
+    print('STRESS_SEED={0}'.format(SEED))
+    return random.Random(SEED)
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return _reference_primes(2, _nth_prime_upper_bound(MAX_PRIMES) + 1)[:MAX_PRIMES]
+
+
+def _random_counts(rng, rounds=6):
+    return [0, 1, 2] + sorted(rng.randrange(MAX_PRIMES) for _ in range(rounds))
+
+
+def _random_windows(rng, rounds=6):
+    windows = [(0, 100), (MAX_VALUE - 1000, MAX_VALUE)]
+    for _ in range(rounds):
+        lo = rng.randrange(MAX_VALUE)
+        windows.append((lo, lo + rng.randrange(1, 2 * 10 ** 6)))
+    return windows
+
+
+@pytest.mark.parametrize('name', list(_backends))
+def test_backends(rng, reference, name):
+    if not _backends[name].available:
+        pytest.skip('the {0} backend is not available'.format(name))
+    for n in _random_counts(rng):
+        result = do_primes(n, verbose=False, backend=name, workers=2)
+        assert np.array_equal(result, reference[:n]), n
+
+
+def test_cache(rng, reference):
+    # A small cache, so that segments are evicted and sieved again
+    cache = PrimeCache(max_bytes=2 ** 20, segment_size=2 ** 14)
+    for n in _random_counts(rng, rounds=12):
+        assert cache.primes(n) == reference[:n].tolist(), n
+    assert cache.evictions
+    for n in _random_counts(rng, rounds=3):
+        assert do_primes(n, verbose=False, cache=True) == reference[:n].tolist(), n
+
+
+@pytest.mark.parametrize('usecython', [False, True])
+@pytest.mark.parametrize('workers', [None, 2])
+def test_ranges(rng, usecython, workers):
+    if usecython and not _backends['cython'].available:
+        pytest.skip('the compiled extension is not available')
+    for lo, hi in _random_windows(rng):
+        result = do_primes(hi, usecython, workers=workers, start=lo, verbose=False)
+        assert np.array_equal(result, _reference_primes(lo, hi)), (lo, hi)
+
+
+def test_nth(rng, reference):
+    for n in _random_counts(rng)[1:]:
+        assert nth_prime(n) == reference[n - 1], n
+    for _ in range(6):
+        p = nth_prime(rng.randrange(1, MAX_VALUE // 20))
+        assert np.array_equal(_reference_primes(p, p + 1), [p]), p
+        assert prime_count(p) - prime_count(p - 1) == 1, p
+
+
+def test_prime_count(rng, reference):
+    for n in _random_counts(rng)[1:]:
+        # Any x before the next prime
+        x = rng.randrange(int(reference[n - 1]), int(reference[n]))
+        assert prime_count(x) == n, x
+    for _ in range(6):
+        x = rng.randrange(MAX_VALUE)
+        assert prime_count(x) == _legendre_prime_count(x), x
+    for lo, hi in _random_windows(rng, rounds=3):
+        count = prime_count(hi - 1) - prime_count(lo - 1)
+        assert count == len(_reference_primes(lo, hi)), (lo, hi)
+
+
+def test_is_prime(rng):
+    for lo, hi in _random_windows(rng):
+        hi = min(hi, lo + 10 ** 5)
+        expected = np.zeros(hi - lo, dtype=bool)
+        expected[_reference_primes(lo, hi) - lo] = True
+        assert np.array_equal(is_prime(np.arange(lo, hi)), expected), (lo, hi)
+
+
+def _measure_throughput(name, repeat=3):
+    best = min(_timed(name) for _ in range(repeat))
+    return THROUGHPUT_PRIMES / best
+
+
+def _timed(name):
+    start = perf_counter()
+    do_primes(THROUGHPUT_PRIMES, verbose=False, backend=name)
+    return perf_counter() - start
+
+
+def test_throughput(request):
+    tolerance = float(os.environ.get('STRESS_TOLERANCE', 25))
+    path = os.environ.get('STRESS_BASELINE')
+    update = os.environ.get('STRESS_UPDATE_BASELINE') == '1'
+
+    measured = {name: _measure_throughput(name) for name in available_backends()}
+    for name, rate in measured.items():
+        request.node.user_properties.append(('throughput:' + name, rate))
+        print('{0}: {1:.4g} primes/s'.format(name, rate))
+
+    cache = getattr(request.config, 'cache', None)
+    key = __name__.split('.')[0] + '/stress-throughput'
+    if path is not None:
+        baseline = None
+        if os.path.exists(path) and not update:
+            with open(path) as f:
+                baseline = json.load(f)
+    else:
+        baseline = None if cache is None or update else cache.get(key, None)
+
+    if baseline is None:
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(measured, f, indent=2)
+        elif cache is not None:
+            cache.set(key, measured)
+        return
+
+    slower = {name: 100 * (1 - rate / baseline[name])
+              for name, rate in measured.items() if name in baseline}
+    regressions = {name: drop for name, drop in slower.items() if drop > tolerance}
+    assert not regressions, 'throughput dropped by more than {0}%: {1}'.format(
+        tolerance, ', '.join('{0} by {1:.1f}%'.format(name, drop)
+                             for name, drop in sorted(regressions.items())))